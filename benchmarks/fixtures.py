@@ -0,0 +1,300 @@
+"""
+A file used for generating synthetic inputs for the benchmarks, so the
+pipeline can be measured without downloading the global datasets.
+
+Contains make_fixtures() and the functions it uses to make each input.
+"""
+import os
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from shapely.geometry import LineString, Polygon, box
+
+# PROBAV land cover class codes
+PROBAV_CLASSES = [0, 20, 30, 40, 50, 60, 70, 80, 90, 100, 111, 112, 113, 114,
+                  115, 116, 121, 122, 123, 124, 125, 126, 200]
+
+# Number of features or pixels made for each fixture size
+SIZES = {
+    'small': {'coast_points': 200, 'clc_pixels': 1000, 'roads': 5000,
+              'waterbodies': 1000, 'hex_res': 5, 'placements': 20000},
+    'medium': {'coast_points': 2000, 'clc_pixels': 4000, 'roads': 50000,
+               'waterbodies': 10000, 'hex_res': 6, 'placements': 200000},
+    'large': {'coast_points': 20000, 'clc_pixels': 10000, 'roads': 500000,
+              'waterbodies': 50000, 'hex_res': 7, 'placements': 2000000},
+}
+
+# Names of the synthetic countries, from west to east. The benchmarks use the
+# middle one, so it has neighbours on both sides.
+COUNTRY_NAMES = ['Westland', 'Testland', 'Eastland']
+
+# Extent of the synthetic countries in EPSG 4326
+WEST, SOUTH, EAST, NORTH = 30.0, -3.0, 39.0, 3.0
+
+# UTM zone of the synthetic countries
+EPSG = 32736
+
+
+def make_countries(coast_points, seed=0):
+    """
+    Makes three neighbouring countries with a jagged southern coastline.
+
+    ...
+    Parameters
+    ----------
+    coast_points : integer
+        Number of vertices along the coastline of each country.
+    seed : integer
+        Random seed.
+
+    Returns
+    -------
+    countries : geodataframe
+        Countries with Natural Earth style columns.
+    """
+    rng = np.random.default_rng(seed)
+    width = (EAST - WEST) / len(COUNTRY_NAMES)
+    polygons = []
+    for i in range(len(COUNTRY_NAMES)):
+        west = WEST + i * width
+        east = west + width
+        xs = np.linspace(east, west, coast_points)
+        ys = SOUTH + 0.3 * rng.random(coast_points)
+        # Share the corner points so the countries touch
+        coast = [(east, SOUTH)] + list(zip(xs[1:-1], ys[1:-1])) + [(west, SOUTH)]
+        polygons.append(Polygon([(west, NORTH), (east, NORTH)] + coast))
+
+    return gpd.GeoDataFrame({
+        'NAME': COUNTRY_NAMES,
+        'name': COUNTRY_NAMES,
+        'pop_est': [1e6] * len(COUNTRY_NAMES),
+        'continent': ['Africa'] * len(COUNTRY_NAMES),
+        'iso_a3': ['WST', 'TST', 'EST'],
+        'gdp_md_est': [1e4] * len(COUNTRY_NAMES),
+    }, geometry=polygons, crs=4326)
+
+def make_oceans():
+    """
+    Makes an ocean polygon south of the countries, and one far away that no
+    country needs.
+
+    ...
+    Returns
+    -------
+    oceans : geodataframe
+        Ocean polygons with GOAS style columns.
+    """
+    return gpd.GeoDataFrame({
+        'name': ['Synthetic Ocean', 'Distant Ocean'],
+        'mrgid': [1, 2],
+    }, geometry=[box(WEST - 5, SOUTH - 10, EAST + 5, SOUTH + 0.2),
+                 box(-60, 40, -30, 60)], crs=4326)
+
+def make_land_cover(output_path, pixels, seed=0):
+    """
+    Makes a land cover GeoTIFF with PROBAV class codes covering the countries.
+
+    ...
+    Parameters
+    ----------
+    output_path : string
+        Path to save the raster to.
+    pixels : integer
+        Width and height of the raster in pixels.
+    seed : integer
+        Random seed.
+    """
+    rng = np.random.default_rng(seed)
+    # Use blocks of classes so the raster compresses like real land cover
+    blocks = rng.choice(PROBAV_CLASSES, size=(pixels // 10 + 1, pixels // 10 + 1)).astype(np.uint8)
+    data = np.kron(blocks, np.ones((10, 10), dtype=np.uint8))[:pixels, :pixels]
+
+    margin = 1.0
+    transform = rasterio.transform.from_bounds(WEST - margin, SOUTH - margin,
+                                               EAST + margin, NORTH + margin,
+                                               pixels, pixels)
+    with rasterio.open(output_path, 'w', driver='GTiff', width=pixels,
+                       height=pixels, count=1, dtype='uint8', crs='EPSG:4326',
+                       transform=transform, nodata=255, tiled=True,
+                       compress='deflate') as dest:
+        dest.write(data, 1)
+
+def make_osm_lines(count, seed=0):
+    """
+    Makes OSM style road or waterway lines.
+
+    ...
+    Parameters
+    ----------
+    count : integer
+        Number of lines.
+    seed : integer
+        Random seed.
+
+    Returns
+    -------
+    lines : geodataframe
+        Lines with OSM style columns.
+    """
+    rng = np.random.default_rng(seed)
+    starts = np.column_stack([rng.uniform(WEST - 1, EAST + 1, count),
+                              rng.uniform(SOUTH - 1, NORTH + 1, count)])
+    steps = rng.normal(0, 0.01, size=(count, 4, 2)).cumsum(axis=1)
+    lines = [LineString(np.vstack([start, start + step]))
+             for start, step in zip(starts, steps)]
+
+    return gpd.GeoDataFrame({
+        'osm_id': np.arange(count).astype(str),
+        'code': rng.integers(5111, 5199, count),
+        'fclass': rng.choice(['primary', 'secondary', 'tertiary', 'residential',
+                              'track', 'footway', 'river', 'stream'], count),
+        'name': [f"Way {i}" for i in range(count)],
+    }, geometry=lines, crs=4326)
+
+def make_osm_polygons(count, seed=0):
+    """
+    Makes OSM style water body polygons.
+
+    ...
+    Parameters
+    ----------
+    count : integer
+        Number of polygons.
+    seed : integer
+        Random seed.
+
+    Returns
+    -------
+    polygons : geodataframe
+        Polygons with OSM style columns.
+    """
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(WEST - 1, EAST + 1, count)
+    ys = rng.uniform(SOUTH - 1, NORTH + 1, count)
+    sizes = rng.uniform(0.001, 0.02, count)
+
+    return gpd.GeoDataFrame({
+        'osm_id': np.arange(count).astype(str),
+        'code': 8200,
+        'fclass': rng.choice(['water', 'reservoir', 'wetland'], count),
+        'name': [f"Lake {i}" for i in range(count)],
+    }, geometry=[box(x, y, x + size, y + size) for x, y, size in zip(xs, ys, sizes)],
+       crs=4326)
+
+def make_hexagons(country, hex_res):
+    """
+    Makes H3 hexagons covering a country, like those made by SPIDER.
+
+    ...
+    Parameters
+    ----------
+    country : geodataframe
+        Country in EPSG 4326.
+    hex_res : integer
+        H3 resolution.
+
+    Returns
+    -------
+    hexagons : geodataframe
+        Hexagons with an 'h3_index' column.
+    """
+    import h3
+
+    to_cell = getattr(h3, 'latlng_to_cell', None) or h3.geo_to_h3
+    to_boundary = getattr(h3, 'cell_to_boundary', None) or h3.h3_to_geo_boundary
+    edge_km = {4: 22.6, 5: 8.5, 6: 3.2, 7: 1.2, 8: 0.46}.get(hex_res, 1.0)
+
+    # Sample the country more finely than the hexagon size to find all cells
+    west, south, east, north = country.total_bounds
+    step = edge_km / 111 / 2
+    xs, ys = np.meshgrid(np.arange(west, east, step), np.arange(south, north, step))
+    cells = sorted({to_cell(y, x, hex_res) for x, y in zip(xs.ravel(), ys.ravel())})
+    polygons = [Polygon([(lng, lat) for lat, lng in to_boundary(cell)]) for cell in cells]
+
+    hexagons = gpd.GeoDataFrame({'h3_index': cells}, geometry=polygons, crs=4326)
+    hexagons = hexagons[hexagons.intersects(country.union_all())].reset_index(drop=True)
+    hexagons['index'] = hexagons.index
+
+    return hexagons
+
+def make_placements(country, count, seed=0):
+    """
+    Makes placement points within a country, in its UTM CRS, like those made
+    by GLAES.
+
+    ...
+    Parameters
+    ----------
+    country : geodataframe
+        Country in EPSG 4326.
+    count : integer
+        Number of points.
+    seed : integer
+        Random seed.
+
+    Returns
+    -------
+    points : geodataframe
+        Placement points.
+    """
+    rng = np.random.default_rng(seed)
+    west, south, east, north = country.to_crs(epsg=EPSG).total_bounds
+    xs = rng.uniform(west, east, count)
+    ys = rng.uniform(south, north, count)
+
+    return gpd.GeoDataFrame(geometry=gpd.points_from_xy(xs, ys), crs=f"EPSG:{EPSG}")
+
+def make_fixtures(fixture_path, size='small', seed=0):
+    """
+    Makes all synthetic inputs for the benchmarks.
+
+    ...
+    Parameters
+    ----------
+    fixture_path : string
+        Path to the folder to save the inputs to.
+    size : string
+        One of SIZES.
+    seed : integer
+        Random seed.
+
+    Returns
+    -------
+    paths : dictionary
+        Paths to the inputs, keyed by name.
+    """
+    settings = SIZES[size]
+    os.makedirs(fixture_path, exist_ok=True)
+
+    def path(name):
+        return os.path.join(fixture_path, name)
+
+    paths = {
+        # GeoJSON keeps both the 'NAME' and 'name' columns, which GeoPackage
+        # field names, being case-insensitive, cannot
+        'countries': path('countries.geojson'),
+        'oceans': path('oceans.gpkg'),
+        'land_cover': path('land_cover.tif'),
+        'roads': path('gis_osm_roads_free_1.shp'),
+        'waterways': path('gis_osm_waterways_free_1.shp'),
+        'waterbodies': path('gis_osm_water_a_free_1.shp'),
+        'hexagons': path('Testland_hex.geojson'),
+        'wind_placements': path('Testland_turbine_placements.shp'),
+        'pv_placements': path('Testland_pv_placements.shp'),
+    }
+
+    countries = make_countries(settings['coast_points'], seed)
+    countries.to_file(paths['countries'], driver='GeoJSON')
+    country = countries[countries['NAME'] == 'Testland']
+
+    make_oceans().to_file(paths['oceans'], driver='GPKG')
+    make_land_cover(paths['land_cover'], settings['clc_pixels'], seed)
+    make_osm_lines(settings['roads'], seed).to_file(paths['roads'])
+    make_osm_lines(settings['roads'] // 5, seed + 1).to_file(paths['waterways'])
+    make_osm_polygons(settings['waterbodies'], seed).to_file(paths['waterbodies'])
+    make_hexagons(country, settings['hex_res']).to_file(paths['hexagons'], driver='GeoJSON')
+    make_placements(country, settings['placements'] // 10, seed).to_file(paths['wind_placements'])
+    make_placements(country, settings['placements'], seed + 1).to_file(paths['pv_placements'])
+
+    return paths
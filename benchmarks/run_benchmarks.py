@@ -0,0 +1,534 @@
+"""
+A file used for timing and memory-profiling each stage of the data prep
+pipeline on synthetic inputs.
+
+Each stage is run in a fresh process, so its peak memory is not affected by
+other stages. Results are saved as JSON, and can be compared with an earlier
+run to catch regressions, e.g.:
+
+python benchmarks/run_benchmarks.py --size small --compare benchmarks/baselines/small.json
+
+The start-up time of the unified CLI, prep.py, is also measured against a
+fixed budget, as slow imports add up when a scheduler runs many small steps.
+
+Contains IMPORT_BUDGETS, STAGE_TIMEOUT, STAGES, check_import_budgets(),
+check_stage_errors(), compare_results(), run_benchmarks(), run_import_checks()
+and run_stage().
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+from queue import Empty
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Let the benchmarks import the repository's modules
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_PATH not in sys.path:
+    sys.path.insert(0, REPO_PATH)
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import mapping
+
+from benchmarks.fixtures import EPSG, SIZES, make_fixtures
+from profiling import file_size
+
+
+def stage_ocean_clip(paths, work_path):
+    """
+    Sets up the ocean clip stage.
+    """
+    from oceans import OceanProvider
+
+    countries = gpd.read_file(paths['countries'])
+    country_buffer = countries[countries['NAME'] == 'Testland'].to_crs(epsg=EPSG).buffer(10000)
+    output_path = os.path.join(work_path, 'Testland_oceans.gpkg')
+
+    def run():
+        OceanProvider(paths['oceans']).clip(country_buffer).to_file(output_path, driver='GPKG')
+
+    return run, [paths['oceans']], [output_path]
+
+def stage_coast_distance(paths, work_path):
+    """
+    Sets up the coast distance stage.
+    """
+    from oceans import save_coast_distance
+
+    countries = gpd.read_file(paths['countries'])
+    country = countries[countries['NAME'] == 'Testland'].to_crs(epsg=EPSG)
+    oceans = gpd.read_file(paths['oceans'])
+    output_path = os.path.join(work_path, 'Testland_coast_distance.tif')
+
+    def run():
+        save_coast_distance(oceans, output_path, country.total_bounds, EPSG)
+
+    return run, [paths['oceans']], [output_path]
+
+def stage_clc_clip(paths, work_path):
+    """
+    Sets up the land cover clip stage.
+    """
+    from clc import clip_clc
+
+    countries = gpd.read_file(paths['countries'])
+    geometries = list(countries[countries['NAME'] == 'Testland'].geometry.apply(mapping))
+    output_path = os.path.join(work_path, 'Testland_CLC.tif')
+
+    def run():
+        clip_clc(paths['land_cover'], geometries, output_path)
+
+    return run, [paths['land_cover']], [output_path]
+
+def stage_osm_conversion(paths, work_path):
+    """
+    Sets up the OSM conversion stage.
+    """
+    from osm import convert_osm_layer
+
+    layers = ['roads', 'waterways', 'waterbodies']
+    output_paths = [os.path.join(work_path, f'Testland_{layer}.gpkg') for layer in layers]
+
+    def run():
+        for layer, output_path in zip(layers, output_paths):
+            convert_osm_layer(paths[layer], output_path)
+
+    return run, [paths[layer] for layer in layers], output_paths
+
+def stage_combine_glaes_spider(paths, work_path):
+    """
+    Sets up the stage joining GLAES placements to SPIDER hexagons.
+    """
+    from prep_after_spider import combine_glaes_spider
+
+    hexagons = gpd.read_file(paths['hexagons'])
+    wind_points = gpd.read_file(paths['wind_placements'])
+    pv_points = gpd.read_file(paths['pv_placements'])
+    hexagons.to_crs(pv_points.crs, inplace=True)
+
+    def run():
+        combine_glaes_spider(hexagons, wind_points, pv_points)
+
+    return run, [paths['hexagons'], paths['wind_placements'], paths['pv_placements']], []
+
+def stage_combine_glaes_spider_coords(paths, work_path):
+    """
+    Sets up the stage joining GLAES placements to SPIDER hexagons, with the
+    placements memory-mapped from coordinate arrays.
+    """
+    from placements import get_coords_path, read_placement_coords, save_placement_coords
+    from prep_after_spider import combine_glaes_spider
+
+    hexagons = gpd.read_file(paths['hexagons'])
+    placement_paths = []
+    for name in ('wind_placements', 'pv_placements'):
+        points = gpd.read_file(paths[name])
+        placement_path = os.path.join(work_path, os.path.basename(paths[name]))
+        save_placement_coords(np.column_stack([points.geometry.x, points.geometry.y]),
+                              placement_path, points.crs.to_epsg())
+        placement_paths.append(placement_path)
+    hexagons.to_crs(points.crs, inplace=True)
+
+    def run():
+        combine_glaes_spider(hexagons, *(read_placement_coords(path) for path in placement_paths))
+
+    return run, [get_coords_path(path) for path in placement_paths], []
+
+def stage_assign_country(paths, work_path):
+    """
+    Sets up the stage assigning countries to hexagons.
+    """
+    from boundaries import Boundaries
+    from prep_after_spider import assign_country
+
+    hexagons = gpd.read_file(paths['hexagons'])
+    world = Boundaries(gpd.read_file(paths['countries']).drop(columns=['NAME']))
+
+    def run():
+        assign_country(hexagons.copy(), world, 'Testland')
+
+    return run, [paths['hexagons'], paths['countries']], []
+
+def stage_remove_extra_hexagons(paths, work_path):
+    """
+    Sets up the stage removing hexagons of other countries.
+    """
+    from boundaries import Boundaries
+    from prep_after_spider import assign_country, remove_extra_hexagons
+
+    hexagons = gpd.read_file(paths['hexagons'])
+    world = Boundaries(gpd.read_file(paths['countries']).drop(columns=['NAME']))
+    hexagons_with_country = assign_country(hexagons, world, 'Testland')
+
+    def run():
+        remove_extra_hexagons(hexagons_with_country, 'Testland')
+
+    return run, [paths['hexagons']], []
+
+# Maximum start-up time in seconds of prep.py commands that should not import
+# the geospatial stack, keyed by name
+IMPORT_BUDGETS = {
+    'help': (['--help'], 0.5),
+    'config_help': (['config', '--help'], 0.5),
+}
+
+# Longest time in seconds a stage can run before it is stopped and reported as
+# an error
+STAGE_TIMEOUT = 3600
+
+# Smallest change from the baseline of each metric that can count as a
+# regression, so that noise in short stages and start-ups is not reported
+MIN_CHANGE = {'wall_s': 0.05, 'peak_rss_mb': 10}
+
+# Benchmarked stages, keyed by name
+STAGES = {
+    'ocean_clip': stage_ocean_clip,
+    'coast_distance': stage_coast_distance,
+    'clc_clip': stage_clc_clip,
+    'osm_conversion': stage_osm_conversion,
+    'combine_glaes_spider': stage_combine_glaes_spider,
+    'combine_glaes_spider_coords': stage_combine_glaes_spider_coords,
+    'assign_country': stage_assign_country,
+    'remove_extra_hexagons': stage_remove_extra_hexagons,
+}
+
+def _measure_stage(name, paths, work_path, queue):
+    """
+    Runs one stage and puts its measurements on the queue. Used as the target
+    of the stage's process.
+    """
+    try:
+        run, inputs, outputs = STAGES[name](paths, work_path)
+
+        tracemalloc.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        run()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        queue.put({
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'python_peak_mb': python_peak / 1024 ** 2,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 1024 ** 2,
+            'input_mb': sum(file_size(path) for path in inputs) / 1024 ** 2,
+            'output_mb': sum(file_size(path) for path in outputs) / 1024 ** 2,
+        })
+    except Exception as error:
+        queue.put({'error': repr(error)})
+
+def run_stage(name, paths, work_path, repeat=1, timeout=STAGE_TIMEOUT):
+    """
+    Runs a stage in fresh processes and keeps the fastest run.
+
+    A process that dies without a result, e.g. when it runs out of memory,
+    or that takes longer than the timeout, is reported as an error.
+
+    ...
+    Parameters
+    ----------
+    name : string
+        Name of the stage, from STAGES.
+    paths : dictionary
+        Paths to the synthetic inputs, as made by make_fixtures().
+    work_path : string
+        Path to the folder to save stage outputs to.
+    repeat : integer
+        Number of times to run the stage.
+    timeout : float
+        Longest time in seconds to wait for each run. Default is
+        STAGE_TIMEOUT.
+
+    Returns
+    -------
+    result : dictionary
+        Measurements of the fastest run, or the 'error' of the first run that
+        failed.
+    """
+    context = multiprocessing.get_context('spawn')
+    best = None
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=_measure_stage,
+                                  args=(name, paths, work_path, queue))
+        process.start()
+        deadline = time.monotonic() + timeout
+        result = None
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except Empty:
+                if not process.is_alive():
+                    # The result may have arrived just before the process ended
+                    try:
+                        result = queue.get(timeout=1)
+                    except Empty:
+                        result = {'error': f"Stage process ended with exit code {process.exitcode} "
+                                           "without a result"}
+                elif time.monotonic() > deadline:
+                    process.terminate()
+                    result = {'error': f"Stage took longer than {timeout} s"}
+        process.join()
+        if 'error' in result:
+            return result
+        if best is None or result['wall_s'] < best['wall_s']:
+            best = result
+
+    return best
+
+def run_import_checks(repeat=1):
+    """
+    Times prep.py commands in fresh interpreters and compares them with
+    IMPORT_BUDGETS.
+
+    ...
+    Parameters
+    ----------
+    repeat : integer
+        Number of times to run each command, keeping the fastest run.
+
+    Returns
+    -------
+    results : dictionary
+        Start-up time, budget and any heavy modules imported for each command.
+    """
+    # Modules that make start-up slow, reported if a command imports them
+    heavy_modules = ['geopandas', 'glaes', 'rasterio', 'shapely', 'pandas', 'numpy']
+    script = ("import runpy, sys; sys.argv = ['prep.py'] + sys.argv[1:]\n"
+              "try:\n    runpy.run_path('prep.py', run_name='__main__')\n"
+              "except SystemExit:\n    pass\n"
+              f"print(','.join(m for m in {heavy_modules!r} if m in sys.modules), file=sys.stderr)")
+
+    results = {}
+    for name, (command, budget) in IMPORT_BUDGETS.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, '-c', script] + command, cwd=REPO_PATH,
+                                     capture_output=True, text=True)
+            wall = time.perf_counter() - start
+            best = wall if best is None else min(best, wall)
+        heavy = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else ''
+        results[name] = {
+            'wall_s': best,
+            'budget_s': budget,
+            'heavy_imports': [module for module in heavy.split(',') if module],
+        }
+
+    return results
+
+def run_benchmarks(fixture_path, size='small', stages=None, repeat=1,
+                   timeout=STAGE_TIMEOUT):
+    """
+    Makes the synthetic inputs and runs the benchmarks.
+
+    ...
+    Parameters
+    ----------
+    fixture_path : string
+        Path to the folder for synthetic inputs and stage outputs.
+    size : string
+        Fixture size, from fixtures.SIZES.
+    stages : list
+        Names of stages to run. Default is None, which runs all stages.
+    repeat : integer
+        Number of times to run each stage.
+    timeout : float
+        Longest time in seconds to wait for each run of a stage.
+
+    Returns
+    -------
+    results : dictionary
+        Run metadata and the measurements of each stage.
+    """
+    print(f"Making {size} fixtures...")
+    paths = make_fixtures(os.path.join(fixture_path, size), size)
+    work_path = os.path.join(fixture_path, size, 'outputs')
+    os.makedirs(work_path, exist_ok=True)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_PATH,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    results = {
+        'metadata': {
+            'size': size,
+            'repeat': repeat,
+            'commit': commit,
+            'python': platform.python_version(),
+            'geopandas': gpd.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'stages': {},
+    }
+    print("Timing prep.py start-up...")
+    results['imports'] = run_import_checks(repeat)
+    for name, result in results['imports'].items():
+        print(f"   {name}: {result}")
+
+    for name in stages or STAGES:
+        print(f" - Running {name}...")
+        results['stages'][name] = run_stage(name, paths, work_path, repeat, timeout)
+        print(f"   {results['stages'][name]}")
+
+    return results
+
+def check_import_budgets(results):
+    """
+    Reports prep.py commands that took longer than their budget to start, or
+    imported heavy modules.
+
+    ...
+    Parameters
+    ----------
+    results : dictionary
+        Results from run_benchmarks().
+
+    Returns
+    -------
+    overruns : list
+        Descriptions of each overrun.
+    """
+    overruns = []
+    for name, result in results.get('imports', {}).items():
+        if result['wall_s'] > result['budget_s'] or result['heavy_imports']:
+            overruns.append(f"prep.py {name} start-up: {result['wall_s']:.3f} s "
+                            f"(budget {result['budget_s']:.3f} s), heavy imports {result['heavy_imports']}")
+
+    return overruns
+
+def check_stage_errors(results):
+    """
+    Reports stages that failed, e.g. with an error or by their process dying.
+
+    ...
+    Parameters
+    ----------
+    results : dictionary
+        Results from run_benchmarks().
+
+    Returns
+    -------
+    errors : list
+        Descriptions of each failed stage.
+    """
+    return [f"{name} failed: {result['error']}"
+            for name, result in results['stages'].items() if 'error' in result]
+
+def is_regression(old, new, threshold, min_change):
+    """
+    Checks whether a metric got worse than its baseline by more than both a
+    ratio and an absolute amount.
+
+    ...
+    Parameters
+    ----------
+    old : float
+        Value of the metric in the baseline.
+    new : float
+        Value of the metric in the results.
+    threshold : float
+        Ratio to the baseline above which the metric counts as a regression.
+    min_change : float
+        Smallest increase over the baseline that counts as a regression.
+
+    Returns
+    -------
+    regressed : boolean
+        True if the metric regressed.
+    """
+    return old > 0 and new / old > threshold and new - old > min_change
+
+def compare_results(results, baseline, threshold=1.2):
+    """
+    Compares results with a baseline and reports stages that got slower or
+    used more memory, by more than the threshold ratio and by more than
+    MIN_CHANGE. Stages that failed, prep.py commands that are over
+    their start-up budget, and prep.py commands that got slower than the
+    baseline are also reported.
+
+    ...
+    Parameters
+    ----------
+    results : dictionary
+        Results from run_benchmarks().
+    baseline : dictionary
+        Earlier results from run_benchmarks().
+    threshold : float
+        Ratio to the baseline above which a stage counts as a regression.
+
+    Returns
+    -------
+    regressions : list
+        Descriptions of each regression.
+    """
+    regressions = check_stage_errors(results)
+    for name, result in results['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or 'error' in old or 'error' in result:
+            continue
+        for metric in ('wall_s', 'peak_rss_mb'):
+            if is_regression(old[metric], result[metric], threshold, MIN_CHANGE[metric]):
+                regressions.append(f"{name} {metric}: {old[metric]:.3f} -> {result[metric]:.3f}")
+
+    regressions.extend(check_import_budgets(results))
+    for name, result in results.get('imports', {}).items():
+        old = baseline.get('imports', {}).get(name)
+        if old and is_regression(old['wall_s'], result['wall_s'], threshold, MIN_CHANGE['wall_s']):
+            regressions.append(f"prep.py {name} start-up: {old['wall_s']:.3f} -> {result['wall_s']:.3f}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', default='small', choices=list(SIZES),
+                        help="<Optional> Enter the size of the synthetic inputs. Default is 'small'.")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        help="<Optional> Enter the stages to run. Default runs all stages.")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="<Optional> Enter the number of runs of each stage, keeping the fastest. Default is 1.")
+    parser.add_argument('--timeout', type=float, default=STAGE_TIMEOUT,
+                        help=f"<Optional> Enter the longest time in seconds to wait for each run of a stage. Default is {STAGE_TIMEOUT}.")
+    parser.add_argument('--output', type=str,
+                        help="<Optional> Enter the path to save results to. Default is benchmarks/results/[SIZE]_[TIME].json.")
+    parser.add_argument('--compare', type=str,
+                        help="<Optional> Enter the path to earlier results to compare with. Exits with an error if any stage regressed.")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="<Optional> Enter the ratio to the earlier results that counts as a regression. Default is 1.2.")
+    args = parser.parse_args()
+
+    benchmark_path = os.path.dirname(os.path.abspath(__file__))
+    results = run_benchmarks(os.path.join(benchmark_path, 'fixtures_data'), args.size,
+                             args.stages, args.repeat, args.timeout)
+
+    output_path = args.output or os.path.join(
+        benchmark_path, 'results', f"{args.size}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {output_path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare_results(results, baseline, args.threshold)
+    else:
+        regressions = check_stage_errors(results) + check_import_budgets(results)
+    for regression in regressions:
+        print(f" ! Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions found")
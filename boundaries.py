@@ -0,0 +1,216 @@
+"""
+A file used for loading country boundaries once per run, and for simplifying
+them before they are used to clip, mask and run GLAES.
+
+Contains Boundaries, get_boundaries(), get_boundary_tolerance() and
+simplify_boundaries().
+"""
+import geopandas as gpd
+
+from osm import count_vertices
+
+# Loaded boundary datasets, keyed by path and index column
+_boundaries = {}
+
+
+class Boundaries:
+    """
+    Holds a country boundary dataset with its spatial index built, along with
+    any reprojected copies that have been asked for, so they are only made
+    once per run.
+
+    ...
+    Attributes
+    ----------
+    frame : geodataframe
+        Country boundaries in their original CRS.
+    """
+    def __init__(self, frame):
+        self.frame = frame
+        self._projected = {}
+        # Build the spatial index now so every lookup can reuse it
+        self.frame.sindex
+
+    def in_crs(self, crs):
+        """
+        Gets the boundaries in another CRS, reprojecting them on first use.
+
+        ...
+        Parameters
+        ----------
+        crs : integer or string
+            EPSG code or other CRS definition.
+
+        Returns
+        -------
+        frame : geodataframe
+            Country boundaries in the given CRS.
+        """
+        key = str(crs)
+        if key not in self._projected:
+            projected = self.frame.to_crs(crs)
+            projected.sindex
+            self._projected[key] = projected
+
+        return self._projected[key]
+
+    def select(self, names, column=None):
+        """
+        Gets the boundaries of the named countries.
+
+        ...
+        Parameters
+        ----------
+        names : list
+            Country names.
+        column : string
+            Column holding the names. Default is None, which uses the index.
+
+        Returns
+        -------
+        countries : geodataframe
+            Boundaries of the named countries.
+        """
+        if column is None:
+            return self.frame.loc[names, :]
+
+        return self.frame[self.frame[column].isin(names)]
+
+    def with_neighbours(self, name, column=None):
+        """
+        Gets the boundaries of a country and every country touching it.
+
+        ...
+        Parameters
+        ----------
+        name : string
+            Country name.
+        column : string
+            Column holding the names. Default is None, which uses the index.
+
+        Returns
+        -------
+        countries : geodataframe
+            Boundaries of the country and its neighbours, in their original
+            order. Empty if the country is not found.
+        """
+        if column is None:
+            target = self.frame[self.frame.index == name]
+        else:
+            target = self.frame[self.frame[column] == name]
+        if target.empty:
+            return target
+
+        hits = self.frame.sindex.query(target.union_all(), predicate='intersects')
+
+        return self.frame.iloc[sorted(hits)]
+
+def get_boundaries(path, index_column=None):
+    """
+    Gets a country boundary dataset, reading it only the first time it is
+    asked for in this process.
+
+    ...
+    Parameters
+    ----------
+    path : string
+        Path to the boundaries file.
+    index_column : string
+        Column to use as the index, e.g. 'NAME'. Default is None.
+
+    Returns
+    -------
+    boundaries : Boundaries
+        Country boundaries.
+    """
+    key = (path, index_column)
+    if key not in _boundaries:
+        frame = gpd.read_file(path)
+        if index_column is not None:
+            frame = frame.set_index(index_column)
+        _boundaries[key] = Boundaries(frame)
+
+    return _boundaries[key]
+
+def get_boundary_tolerance(pixel_size=100, factor=0.5):
+    """
+    Gets the simplification tolerance for country boundaries used on a raster
+    grid. With the default half a pixel, the simplified boundary stays
+    within the pixels the original boundary passes through.
+
+    ...
+    Parameters
+    ----------
+    pixel_size : float
+        Pixel size in meters of the raster the boundaries are used on.
+        Default is 100, as used by GLAES.
+    factor : float
+        Tolerance as a share of the pixel size. Default is 0.5.
+
+    Returns
+    -------
+    tolerance : float
+        Tolerance in meters.
+    """
+    return pixel_size * factor
+
+def _polygons(geometry):
+    """
+    Keeps only the polygons of a geometry, as make_valid() can leave lines or
+    points where a ring touched itself.
+    """
+    if geometry is None or geometry.geom_type in ('Polygon', 'MultiPolygon'):
+        return geometry
+
+    return gpd.GeoSeries([part for part in getattr(geometry, 'geoms', [geometry])
+                          if part.geom_type in ('Polygon', 'MultiPolygon')]).union_all()
+
+def simplify_boundaries(country, tolerance, max_area_change=0.01):
+    """
+    Simplifies country boundaries without changing their topology, so that
+    no part is dropped and no ring crosses itself, and makes them valid.
+
+    The area that changed, i.e. the symmetric difference between the original
+    and simplified boundaries, is reported. If it is more than a set share of
+    the country's area, the original boundaries are kept.
+
+    ...
+    Parameters
+    ----------
+    country : geodataframe
+        Country boundaries in a CRS in meters, e.g. the country's UTM zone.
+    tolerance : float
+        Tolerance in meters, as from get_boundary_tolerance().
+    max_area_change : float
+        Largest share of the country's area that can change. Default is 0.01.
+
+    Returns
+    -------
+    simplified : geodataframe
+        Simplified and valid boundaries, or the valid original boundaries if
+        too much of the area changed.
+    report : dictionary
+        Tolerance, vertex counts, areas and changed area of the boundaries.
+    """
+    original = country.copy()
+    original['geometry'] = country.geometry.make_valid().apply(_polygons)
+    simplified = original.copy()
+    simplified['geometry'] = (original.geometry.simplify(tolerance, preserve_topology=True)
+                              .make_valid().apply(_polygons))
+
+    area = original.area.sum()
+    changed_area = original.geometry.symmetric_difference(simplified.geometry).area.sum()
+    report = {
+        'tolerance_m': tolerance,
+        'vertices': count_vertices(original.geometry),
+        'simplified_vertices': count_vertices(simplified.geometry),
+        'area_km2': area / 1e6,
+        'simplified_area_km2': simplified.area.sum() / 1e6,
+        'changed_area_km2': changed_area / 1e6,
+        'changed_area_share': changed_area / area,
+        'simplified': changed_area <= max_area_change * area,
+    }
+    if not report['simplified']:
+        return original, report
+
+    return simplified, report
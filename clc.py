@@ -0,0 +1,272 @@
+"""
+A file used for preparing the land cover (CLC) raster.
+
+Contains clip_clc(), clip_clc_to_vrt(), get_clc_path(), get_glaes_grid(),
+keep_open(), open_raster() and warp_clc_to_glaes_grid().
+"""
+from contextlib import contextmanager
+import os
+import threading
+
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling
+from rasterio.windows import Window
+
+# Rasters kept open for the rest of the process by keep_open(), keyed by path,
+# each with a lock as a dataset cannot be read from two threads at once
+_open_rasters = {}
+
+
+def keep_open(raster_path):
+    """
+    Opens a raster and keeps it open for the rest of the process, so that
+    later calls to open_raster() reuse the handle and its cached blocks
+    instead of opening the file again. Used by the worker service for the
+    global CLC raster.
+
+    ...
+    Parameters
+    ----------
+    raster_path : string
+        Path to the raster.
+    """
+    if raster_path not in _open_rasters:
+        _open_rasters[raster_path] = (rasterio.open(raster_path), threading.Lock())
+
+@contextmanager
+def open_raster(raster_path):
+    """
+    Opens a raster for reading, reusing the handle from keep_open() if there
+    is one.
+
+    ...
+    Parameters
+    ----------
+    raster_path : string
+        Path to the raster.
+    """
+    if raster_path in _open_rasters:
+        src, lock = _open_rasters[raster_path]
+        with lock:
+            yield src
+    else:
+        with rasterio.open(raster_path) as src:
+            yield src
+
+def clip_clc(clc_path, geometries, output_path, max_memory_mb=512,
+             block_size=512):
+    """
+    Clips the CLC raster to a country, streaming it in strips of rows so that
+    memory use stays below a set limit.
+
+    Gives the same pixels as rasterio.mask.mask() with crop=True. The output
+    is a tiled, compressed GeoTIFF with internal overviews.
+
+    ...
+    Parameters
+    ----------
+    clc_path : string
+        Path to the global CLC raster.
+    geometries : list
+        Country geometries as GeoJSON-like dictionaries, in the raster's CRS.
+    output_path : string
+        Path to save the clipped raster to.
+    max_memory_mb : integer
+        Approximate limit in megabytes for the pixels held in memory at once.
+    block_size : integer
+        Width and height in pixels of the output tiles.
+    """
+    with open_raster(clc_path) as src:
+        window = geometry_window(src, geometries)
+        width, height = int(window.width), int(window.height)
+        transform = src.window_transform(window)
+        nodata = src.nodata if src.nodata is not None else 0
+
+        out_meta = src.meta.copy()
+        out_meta.update({
+            'height': height,
+            'width': width,
+            'transform': transform,
+            'tiled': True,
+            'blockxsize': block_size,
+            'blockysize': block_size,
+            'compress': 'deflate',
+            'BIGTIFF': 'IF_SAFER',
+        })
+
+        # Each row needs its pixels plus one byte for the mask
+        bytes_per_row = width * (np.dtype(src.dtypes[0]).itemsize * src.count + 1)
+        rows = max(1, int(max_memory_mb * 1024 ** 2 // bytes_per_row))
+        # Keep strips aligned to whole output tiles where possible
+        if rows >= block_size:
+            rows -= rows % block_size
+
+        with rasterio.open(output_path, 'w', **out_meta) as dest:
+            for row_start in range(0, height, rows):
+                strip_height = min(rows, height - row_start)
+                strip = Window(0, row_start, width, strip_height)
+                source_strip = Window(window.col_off, window.row_off + row_start,
+                                      width, strip_height)
+
+                data = src.read(window=source_strip)
+                outside = geometry_mask(geometries,
+                                        out_shape=(strip_height, width),
+                                        transform=dest.window_transform(strip))
+                data[:, outside] = nodata
+                dest.write(data, window=strip)
+
+    # Add internal overviews for quick viewing of large countries
+    with rasterio.open(output_path, 'r+') as dest:
+        factors = [factor for factor in (2, 4, 8, 16, 32)
+                   if min(dest.width, dest.height) // factor >= block_size]
+        if factors:
+            dest.build_overviews(factors, Resampling.nearest)
+            dest.update_tags(ns='rio_overview', resampling='nearest')
+
+def clip_clc_to_vrt(clc_path, cutline_path, output_path):
+    """
+    Clips the CLC raster to a country as a GDAL VRT with a cutline, without
+    copying any pixels. The pixels are read from the global raster when the VRT
+    is used.
+
+    ...
+    Parameters
+    ----------
+    clc_path : string
+        Path to the global CLC raster.
+    cutline_path : string
+        Path to a vector file containing the country boundaries.
+    output_path : string
+        Path to save the VRT to.
+    """
+    from osgeo import gdal
+
+    with open_raster(clc_path) as src:
+        nodata = src.nodata if src.nodata is not None else 0
+
+    gdal.Warp(output_path, clc_path, format='VRT', cutlineDSName=cutline_path,
+              cropToCutline=True, dstNodata=nodata)
+
+def get_clc_path(glaes_data_path, country_name):
+    """
+    Gets the path to a country's clipped CLC raster, which is either a GeoTIFF
+    or, if made with clip_clc_to_vrt(), a VRT.
+
+    ...
+    Parameters
+    ----------
+    glaes_data_path : string
+        Path to the folder containing the clipped CLC raster.
+    country_name : string
+        Name of country for file names.
+
+    Returns
+    -------
+    clc_path : string
+        Path to the clipped CLC raster.
+    """
+    clc_path = os.path.join(glaes_data_path, f'{country_name}_CLC.tif')
+    if not os.path.isfile(clc_path):
+        vrt_path = os.path.join(glaes_data_path, f'{country_name}_CLC.vrt')
+        if os.path.isfile(vrt_path):
+            return vrt_path
+
+    return clc_path
+
+
+def get_glaes_grid(bounds, pixel_size=100):
+    """
+    Gets the pixel grid GLAES uses for a region, which is the region's bounding
+    box expanded outwards to whole multiples of the pixel size.
+
+    ...
+    Parameters
+    ----------
+    bounds : array
+        Bounds of the region as (minx, miny, maxx, maxy) in its UTM CRS.
+    pixel_size : integer
+        Pixel size in meters.
+
+    Returns
+    -------
+    transform : Affine
+        Transform of the grid.
+    width : integer
+        Number of columns in the grid.
+    height : integer
+        Number of rows in the grid.
+    """
+    minx, miny, maxx, maxy = bounds
+    minx = np.floor(minx / pixel_size) * pixel_size
+    miny = np.floor(miny / pixel_size) * pixel_size
+    maxx = np.ceil(maxx / pixel_size) * pixel_size
+    maxy = np.ceil(maxy / pixel_size) * pixel_size
+
+    width = int(round((maxx - minx) / pixel_size))
+    height = int(round((maxy - miny) / pixel_size))
+    transform = rasterio.transform.from_origin(minx, maxy, pixel_size, pixel_size)
+
+    return transform, width, height
+
+def warp_clc_to_glaes_grid(clc_path, output_path, bounds, EPSG, pixel_size=100,
+                           max_memory_mb=512, block_size=512):
+    """
+    Warps a CLC raster onto the GLAES grid of a country, so that land cover
+    exclusions can be read directly instead of being warped on every call.
+
+    The raster is warped in strips of rows through a warped VRT, so that
+    memory use stays below a set limit. The output is a tiled, compressed
+    GeoTIFF.
+
+    ...
+    Parameters
+    ----------
+    clc_path : string
+        Path to the clipped CLC raster.
+    output_path : string
+        Path to save the warped CLC raster to.
+    bounds : array
+        Bounds of the country as (minx, miny, maxx, maxy) in its UTM CRS.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    pixel_size : integer
+        Pixel size in meters used by GLAES.
+    max_memory_mb : integer
+        Approximate limit in megabytes for the pixels held in memory at once.
+    block_size : integer
+        Width and height in pixels of the output tiles.
+    """
+    transform, width, height = get_glaes_grid(bounds, pixel_size)
+    crs = rasterio.crs.CRS.from_epsg(EPSG)
+
+    with rasterio.open(clc_path) as src:
+        nodata = src.nodata if src.nodata is not None else 0
+        out_meta = src.meta.copy()
+        out_meta.update({
+            'count': 1,
+            'crs': crs,
+            'transform': transform,
+            'width': width,
+            'height': height,
+            'nodata': nodata,
+            'tiled': True,
+            'blockxsize': block_size,
+            'blockysize': block_size,
+            'compress': 'deflate',
+            'BIGTIFF': 'IF_SAFER',
+        })
+
+        rows = max(1, int(max_memory_mb * 1024 ** 2 // (width * np.dtype(src.dtypes[0]).itemsize)))
+        # Keep strips aligned to whole output tiles where possible
+        if rows >= block_size:
+            rows -= rows % block_size
+
+        with WarpedVRT(src, crs=crs, transform=transform, width=width, height=height,
+                       nodata=nodata, resampling=Resampling.nearest) as vrt, \
+                rasterio.open(output_path, 'w', **out_meta) as dest:
+            for row_start in range(0, height, rows):
+                strip = Window(0, row_start, width, min(rows, height - row_start))
+                dest.write(vrt.read(1, window=strip), 1, window=strip)
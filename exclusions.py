@@ -0,0 +1,292 @@
+"""
+A file used for shared GLAES exclusion steps.
+
+Some steps read or write the exclusion calculator's availability array and
+placement coordinates directly, which GLAES keeps private. All such access
+goes through the helpers below, which first check that the installed GLAES
+is a version they were checked with. With other versions, the steps fall
+back to the GLAES API, and base exclusions are recalculated on a new
+calculator instead of being restored.
+
+Contains GLAES_VERSIONS, exclude_clc_classes(), exclude_coast(),
+get_availability(), get_base_exclusions(), get_item_coords(),
+restore_base_exclusions() and set_availability().
+"""
+from functools import lru_cache
+import re
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+# GLAES versions whose private exclusion state the helpers below were checked
+# with, as major and minor versions
+GLAES_VERSIONS = [(1, 2)]
+
+
+@lru_cache(maxsize=None)
+def _get_glaes_version():
+    """
+    Gets the version of the installed GLAES, or None if it cannot be found.
+    """
+    try:
+        import glaes
+    except ImportError:
+        return None
+
+    return getattr(glaes, '__version__', None)
+
+def _parse_version(version):
+    """
+    Gets the major and minor version from a version string, e.g. (1, 2) from
+    "1.2.1", or None if it has none.
+    """
+    match = re.match(r'(\d+)\.(\d+)', version or '')
+
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+def _has_glaes_state(ec):
+    """
+    Checks whether an exclusion calculator's private state can be used: the
+    installed GLAES is one of GLAES_VERSIONS and the calculator holds an
+    availability array of its region's shape.
+    """
+    if _parse_version(_get_glaes_version()) not in GLAES_VERSIONS:
+        return False
+    availability = getattr(ec, '_availability', None)
+
+    return isinstance(availability, np.ndarray) and availability.shape == ec.region.mask.shape
+
+def _check_glaes_state(ec):
+    """
+    Raises an error if an exclusion calculator's private state cannot be used.
+    """
+    if not _has_glaes_state(ec):
+        raise RuntimeError(f"GLAES {_get_glaes_version()} does not keep its exclusions as "
+                           "expected. Supported versions: "
+                           f"{', '.join(f'{major}.{minor}' for major, minor in GLAES_VERSIONS)}.")
+
+def get_availability(ec):
+    """
+    Gets the availability array of an exclusion calculator. Writing to it
+    changes the calculator's exclusions.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+
+    Returns
+    -------
+    availability : array
+        Availability of each pixel, 0 where excluded.
+    """
+    _check_glaes_state(ec)
+
+    return ec._availability
+
+def set_availability(ec, availability):
+    """
+    Replaces the exclusions of an exclusion calculator with a copy of an
+    availability array, e.g. to start again from shared base exclusions.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+    availability : array
+        Availability of each pixel, as returned by get_availability().
+    """
+    _check_glaes_state(ec)
+    if availability.shape != ec._availability.shape:
+        raise ValueError("The availability array does not match the calculator's grid.")
+
+    ec._availability = availability.copy()
+
+def get_base_exclusions(ec):
+    """
+    Gets a copy of an exclusion calculator's current exclusions, to restore
+    with restore_base_exclusions() once more exclusions have been applied.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+
+    Returns
+    -------
+    base_availability : array or None
+        Copy of the availability array, or None if the installed GLAES is
+        not one of GLAES_VERSIONS.
+    """
+    if not _has_glaes_state(ec):
+        return None
+
+    return get_availability(ec).copy()
+
+def restore_base_exclusions(ec, base_availability, make_calculator):
+    """
+    Restores the base exclusions saved with get_base_exclusions(). If they
+    could not be saved, a new exclusion calculator with the base exclusions
+    is made instead.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator the base exclusions were saved from.
+    base_availability : array or None
+        Base exclusions, as returned by get_base_exclusions().
+    make_calculator : function
+        Function without arguments that makes a new exclusion calculator and
+        applies the base exclusions to it.
+
+    Returns
+    -------
+    ec : ExclusionCalculator
+        Exclusion calculator holding only the base exclusions.
+    """
+    if base_availability is not None and _has_glaes_state(ec):
+        set_availability(ec, base_availability)
+        return ec
+
+    print(f" ! GLAES {_get_glaes_version()} is not supported for restoring exclusions. "
+          "Recalculating the base exclusions...")
+
+    return make_calculator()
+
+def get_item_coords(ec):
+    """
+    Gets the coordinates of the items placed by the last call to
+    distributeItems().
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+
+    Returns
+    -------
+    coords : array or None
+        Item coordinates as an (n, 2) array of x and y, or None if the
+        calculator does not hold them.
+    """
+    if ec is None or not _has_glaes_state(ec):
+        return None
+    coords = getattr(ec, '_itemCoords', None)
+    if coords is None:
+        return None
+
+    return np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def _get_glaes_window(src, ec):
+    """
+    Gets the window of a raster that covers an exclusion calculator, if the
+    raster is on the same pixel grid and covers all of it. A calculator for
+    one tile of a country can then read from the country's raster.
+
+    ...
+    Parameters
+    ----------
+    src : rasterio dataset
+        Open raster.
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+
+    Returns
+    -------
+    window : Window or None
+        Window of the raster matching the calculator's grid, or None if the
+        grids do not line up.
+    """
+    extent = ec.region.extent
+    height, width = ec.region.mask.shape
+    tolerance = 1e-6
+
+    col = (extent.xMin - src.bounds.left) / src.res[0]
+    row = (src.bounds.top - extent.yMax) / src.res[1]
+    if (abs(col - round(col)) > tolerance or abs(row - round(row)) > tolerance
+            or abs((extent.xMax - extent.xMin) / src.res[0] - width) > tolerance
+            or abs((extent.yMax - extent.yMin) / src.res[1] - height) > tolerance):
+        return None
+
+    col, row = int(round(col)), int(round(row))
+    if col < 0 or row < 0 or col + width > src.width or row + height > src.height:
+        return None
+
+    return Window(col, row, width, height)
+
+def exclude_clc_classes(ec, clc_path, values, grid_clc_path=None):
+    """
+    Excludes several CLC land cover classes in one pass.
+
+    If a CLC raster already warped onto the calculator's grid, or a larger
+    grid that contains it, is given, all classes are read from it and
+    excluded together. Otherwise, each class is excluded with GLAES, which
+    warps the raster on every call.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+    clc_path : string
+        Path to the clipped CLC raster.
+    values : list
+        CLC class values to exclude.
+    grid_clc_path : string
+        Path to the CLC raster warped onto the GLAES grid, as made by
+        clc.warp_clc_to_glaes_grid(). Default is None.
+    """
+    if grid_clc_path is not None and _has_glaes_state(ec):
+        with rasterio.open(grid_clc_path) as src:
+            window = _get_glaes_window(src, ec)
+            if window is not None:
+                land_cover = src.read(1, window=window)
+                get_availability(ec)[np.isin(land_cover, list(values))] = 0
+                return
+        print(" ! Warped CLC raster does not match the GLAES grid. Warping each class instead.")
+    elif grid_clc_path is not None:
+        print(f" ! GLAES {_get_glaes_version()} is not supported for direct exclusions. Warping each class instead.")
+
+    for value in values:
+        ec.excludeRasterType(clc_path, value=value, prewarp=True)
+
+def exclude_coast(ec, oceans_path, buffer=250, coast_distance_path=None):
+    """
+    Excludes the oceans and the coast within a buffer distance of them.
+
+    If a distance raster on the calculator's grid, or a larger grid that
+    contains it, is given, the pixels closer than the buffer are excluded
+    directly. Otherwise, GLAES buffers and rasterises the ocean polygons.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator.
+    oceans_path : string
+        Path to the ocean polygons around the country.
+    buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
+    coast_distance_path : string
+        Path to the distance raster, as made by oceans.save_coast_distance().
+        Default is None.
+    """
+    if coast_distance_path is not None and _has_glaes_state(ec):
+        with rasterio.open(coast_distance_path) as src:
+            window = _get_glaes_window(src, ec)
+            if window is not None and buffer < float(src.tags().get('max_distance', 0)):
+                distance = src.read(1, window=window)
+                get_availability(ec)[distance <= buffer] = 0
+                return
+        print(" ! Coast distance raster does not match the GLAES grid or buffer. Buffering the oceans instead.")
+    elif coast_distance_path is not None:
+        print(f" ! GLAES {_get_glaes_version()} is not supported for direct exclusions. Buffering the oceans instead.")
+
+    ec.excludeVectorType(oceans_path, buffer=buffer)
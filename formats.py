@@ -0,0 +1,113 @@
+"""
+A file used for reading and writing hexagon and placement files in either
+GeoJSON/Shapefile or GeoParquet format.
+
+Contains FORMATS, read_vector(), with_format(), write_partition() and
+write_vector().
+"""
+import os
+
+import geopandas as gpd
+
+# File formats that hexagon and placement files can be saved in
+FORMATS = ['geojson', 'parquet']
+
+# Number of rows per Parquet row group, each of which has its own statistics
+ROW_GROUP_SIZE = 50000
+
+
+def with_format(path, file_format):
+    """
+    Changes the extension of a path to match a file format. Paths are left
+    as they are for the default format.
+
+    ...
+    Parameters
+    ----------
+    path : string
+        Path with a GeoJSON or Shapefile extension.
+    file_format : string
+        One of FORMATS.
+
+    Returns
+    -------
+    path : string
+        Path with the extension for the format.
+    """
+    if file_format == 'parquet':
+        return f"{os.path.splitext(path)[0]}.parquet"
+
+    return path
+
+def write_vector(gdf, path, driver="GeoJSON"):
+    """
+    Saves a GeoDataFrame, as GeoParquet if the path ends in .parquet or with
+    the given driver otherwise.
+
+    ...
+    Parameters
+    ----------
+    gdf : geodataframe
+        Data to save.
+    path : string
+        Path to save the data to.
+    driver : string
+        OGR driver used for non-Parquet files. Default is "GeoJSON".
+    """
+    if path.endswith('.parquet'):
+        kwargs = {}
+        # Newer geopandas can add a bounding box column for row group filtering
+        if int(gpd.__version__.split('.')[0]) >= 1:
+            kwargs['write_covering_bbox'] = True
+        gdf.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE,
+                       write_statistics=True, **kwargs)
+    else:
+        gdf.to_file(path, driver=driver)
+
+def read_vector(path, columns=None):
+    """
+    Reads a GeoParquet file, or any file OGR can read.
+
+    ...
+    Parameters
+    ----------
+    path : string
+        Path to the file.
+    columns : list
+        Columns to read, including the geometry column. Only used for
+        GeoParquet files. Default is None, which reads all columns.
+
+    Returns
+    -------
+    gdf : geodataframe
+        Data read from the file.
+    """
+    if path.endswith('.parquet') or os.path.isdir(path):
+        return gpd.read_parquet(path, columns=columns)
+
+    return gpd.read_file(path)
+
+def write_partition(gdf, dataset_path, iso_code):
+    """
+    Saves one country's hexagons into a GeoParquet dataset partitioned by ISO
+    code, so that readers can load only the countries they need, e.g. with
+    gpd.read_parquet(dataset_path, filters=[('iso', '==', 'KE')]).
+
+    ...
+    Parameters
+    ----------
+    gdf : geodataframe
+        Hexagons for one country.
+    dataset_path : string
+        Path to the folder of the partitioned dataset.
+    iso_code : string
+        ISO code of the country, used as the partition value.
+    """
+    partition_path = os.path.join(dataset_path, f"iso={iso_code}")
+    os.makedirs(partition_path, exist_ok=True)
+    # Replace any earlier output for this country
+    for file_name in os.listdir(partition_path):
+        if file_name.endswith('.parquet'):
+            os.remove(os.path.join(partition_path, file_name))
+
+    write_vector(gdf, os.path.join(partition_path, "part-0.parquet"))
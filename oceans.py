@@ -0,0 +1,270 @@
+"""
+A file used for loading ocean and sea boundaries, and for saving the distance
+to them on the GLAES grid.
+
+Contains OceanProvider and save_coast_distance().
+"""
+import math
+import sqlite3
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from pyogrio import read_dataframe
+import rasterio
+from rasterio.features import rasterize
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from scipy.ndimage import distance_transform_edt
+
+from clc import get_glaes_grid
+
+
+class OceanProvider:
+    """
+    Loads ocean and sea polygons from a GeoPackage, such as the Global Oceans
+    and Seas (GOAS) dataset, reading only the features each country needs.
+
+    The GeoPackage's R-tree spatial index is queried with the bounding box of
+    the area being clipped, so only candidate features are read from disk.
+    Features are cached once loaded, so countries sharing a sea within one run
+    read it only once. If the GeoPackage has no spatial index, the whole layer
+    is read once and cached instead.
+
+    ...
+    Attributes
+    ----------
+    ocean_path : string
+        Path to the ocean GeoPackage file.
+    layer : string
+        Name of the layer to read. Default is the first layer with geometry.
+    """
+    def __init__(self, ocean_path, layer=None):
+        self.ocean_path = ocean_path
+        self.layer = layer
+        self._index_table = None
+        self._crs = None
+        self._features = None
+        self._all_features = None
+        self._read_index_info()
+
+    def _read_index_info(self):
+        """
+        Reads the layer name, CRS and spatial index table from the GeoPackage.
+        """
+        with sqlite3.connect(self.ocean_path) as connection:
+            rows = connection.execute(
+                "SELECT g.table_name, g.column_name, s.organization, "
+                "s.organization_coordsys_id "
+                "FROM gpkg_geometry_columns g "
+                "JOIN gpkg_spatial_ref_sys s ON g.srs_id = s.srs_id"
+            ).fetchall()
+            if self.layer is not None:
+                rows = [row for row in rows if row[0] == self.layer]
+            if not rows:
+                raise ValueError(f"No geometry layer found in {self.ocean_path}")
+            table_name, column_name, organization, coordsys_id = rows[0]
+            self.layer = table_name
+            self._crs = f"{organization}:{coordsys_id}"
+
+            index_table = f"rtree_{table_name}_{column_name}"
+            exists = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                (index_table,)
+            ).fetchone()
+            self._index_table = index_table if exists else None
+
+    def _query_index(self, area):
+        """
+        Returns the feature IDs whose bounding boxes intersect the area.
+
+        ...
+        Parameters
+        ----------
+        area : geodataframe or geoseries
+            Area of interest.
+
+        Returns
+        -------
+        fids : list
+            Sorted feature IDs of candidate features.
+        """
+        xmin, ymin, xmax, ymax = area.to_crs(self._crs).total_bounds
+        with sqlite3.connect(self.ocean_path) as connection:
+            rows = connection.execute(
+                f'SELECT id FROM "{self._index_table}" '
+                "WHERE minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ?",
+                (xmax, xmin, ymax, ymin)
+            ).fetchall()
+
+        return sorted(row[0] for row in rows)
+
+    def _load_features(self, fids):
+        """
+        Reads any features not already cached, in one call, and returns the
+        requested ones.
+
+        The features are indexed by their feature IDs, as when the whole
+        layer is read with _get_all_features().
+
+        ...
+        Parameters
+        ----------
+        fids : list
+            Sorted feature IDs to return.
+
+        Returns
+        -------
+        features : geodataframe
+            Requested features in EPSG 4326.
+        """
+        cached = self._features
+        missing = [fid for fid in fids if cached is None or fid not in cached.index]
+        if cached is None or missing:
+            # Reading no feature IDs still gives the layer schema, so
+            # landlocked countries get it too
+            features = read_dataframe(self.ocean_path, layer=self.layer, fids=missing,
+                                      fid_as_index=True).to_crs(epsg=4326)
+            self._features = features if cached is None else pd.concat([cached, features])
+
+        return self._features.loc[fids]
+
+    def _get_all_features(self):
+        """
+        Reads the whole layer once and caches it.
+
+        ...
+        Returns
+        -------
+        features : geodataframe
+            All features in EPSG 4326, indexed by their feature IDs.
+        """
+        if self._all_features is None:
+            features = read_dataframe(self.ocean_path, layer=self.layer, fid_as_index=True)
+            self._all_features = features.to_crs(epsg=4326)
+
+        return self._all_features
+
+    def candidates(self, area):
+        """
+        Returns the ocean polygons that intersect the area of interest.
+
+        ...
+        Parameters
+        ----------
+        area : geodataframe or geoseries
+            Area of interest.
+
+        Returns
+        -------
+        candidates : geodataframe
+            Intersecting ocean polygons in EPSG 4326, in their original order.
+        """
+        area = area.to_crs(epsg=4326)
+
+        if self._index_table is None:
+            features = self._get_all_features()
+        else:
+            features = self._load_features(self._query_index(area))
+
+        if features.empty:
+            return features.reset_index(drop=True)
+
+        hits = features.sindex.query(area.union_all(), predicate='intersects')
+
+        return features.iloc[sorted(hits)].reset_index(drop=True)
+
+    def clip(self, area):
+        """
+        Clips the ocean polygons to the area of interest.
+
+        Gives the same result as reading the whole layer, reprojecting it to
+        EPSG 4326 and clipping it with the area.
+
+        ...
+        Parameters
+        ----------
+        area : geodataframe or geoseries
+            Area of interest.
+
+        Returns
+        -------
+        clipped : geodataframe
+            Clipped ocean polygons in EPSG 4326.
+        """
+        area = area.to_crs(epsg=4326)
+
+        return gpd.clip(self.candidates(area), area).reset_index(drop=True)
+
+def save_coast_distance(oceans, output_path, bounds, EPSG, pixel_size=100,
+                        max_distance=10000, max_memory_mb=512):
+    """
+    Saves the distance from each pixel of the GLAES grid to the nearest ocean,
+    so that the coast can be excluded at any buffer distance by comparing
+    against it, instead of buffering and rasterising the ocean polygons in
+    every GLAES run.
+
+    The oceans are rasterised by pixel centre and a Euclidean distance
+    transform is run on them. Half a pixel is taken off the distance between
+    pixel centres, so the saved distance is to the edge of the nearest ocean
+    pixel, and is accurate to about half a pixel. Distances above
+    max_distance are saved as max_distance. As no distance above it is
+    needed, the grid is worked through in strips of rows, each extended by
+    max_distance on every side, so that memory use stays below a set limit.
+
+    ...
+    Parameters
+    ----------
+    oceans : geodataframe
+        Ocean polygons around the country, as clipped from GOAS.
+    output_path : string
+        Path to save the distance raster to.
+    bounds : array
+        Bounds of the country as (minx, miny, maxx, maxy) in its UTM CRS.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    pixel_size : integer
+        Pixel size in meters used by GLAES. Default is 100.
+    max_distance : float
+        Largest distance in meters to measure. Default is 10000, as oceans
+        are only clipped to 10 km around the country.
+    max_memory_mb : integer
+        Approximate limit in megabytes for the pixels held in memory at once.
+    """
+    transform, width, height = get_glaes_grid(bounds, pixel_size)
+    margin = int(math.ceil(max_distance / pixel_size))
+    shapes = [geometry for geometry in oceans.to_crs(epsg=EPSG).geometry
+              if geometry is not None and not geometry.is_empty]
+
+    # The distance transform keeps the nearest ocean pixel of each pixel and
+    # its float64 distance, plus the ocean mask and the float32 output,
+    # measured at about 36 bytes per pixel
+    bytes_per_row = (width + 2 * margin) * 36
+    rows = max(1, int(max_memory_mb * 1024 ** 2 // bytes_per_row) - 2 * margin)
+
+    out_meta = {
+        'driver': 'GTiff',
+        'dtype': 'float32',
+        'count': 1,
+        'crs': rasterio.crs.CRS.from_epsg(EPSG),
+        'transform': transform,
+        'width': width,
+        'height': height,
+        'tiled': True,
+        'compress': 'deflate',
+        'BIGTIFF': 'IF_SAFER',
+    }
+    with rasterio.open(output_path, 'w', **out_meta) as dest:
+        for row_start in range(0, height, rows):
+            strip_height = min(rows, height - row_start)
+            distance = np.full((strip_height, width), max_distance, dtype='float32')
+            if shapes:
+                ocean = rasterize(shapes, out_shape=(strip_height + 2 * margin, width + 2 * margin),
+                                  transform=transform * Affine.translation(-margin, row_start - margin),
+                                  fill=0, default_value=1, dtype='uint8')
+                if ocean.any():
+                    strip_distance = distance_transform_edt(ocean == 0, sampling=pixel_size)
+                    strip_distance = strip_distance[margin:margin + strip_height, margin:margin + width]
+                    distance = np.clip(strip_distance - pixel_size / 2, 0, max_distance).astype('float32')
+            dest.write(distance, 1, window=Window(0, row_start, width, strip_height))
+        dest.update_tags(max_distance=max_distance)
@@ -0,0 +1,285 @@
+"""
+A file used for converting OpenStreetMap layers for SPIDER.
+
+Layers can also be made lighter for SPIDER's distance operations, which
+take longer the more vertices a layer has: minor classes are dropped, the
+remaining features are merged per class and tile, and the result is
+simplified with a tolerance tied to the hexagon size.
+
+Contains H3_EDGE_LENGTHS, OSM_COLUMNS, OSM_FCLASSES, convert_osm_layer(),
+count_vertices(), get_simplify_tolerance() and simplify_osm_layer().
+"""
+import math
+
+import geopandas as gpd
+import numpy as np
+from pyogrio import read_dataframe
+from shapely.geometry import MultiLineString
+from shapely.ops import linemerge
+
+# Attribute columns kept from the OSM layers. SPIDER's distance operations
+# only use the geometry; the class is kept so layers can be filtered later.
+OSM_COLUMNS = ['osm_id', 'fclass']
+
+# OSM classes kept in each layer when simplifying, or None to keep them all.
+# Residential roads, tracks, paths, streams and drains are dropped.
+OSM_FCLASSES = {
+    'roads': ['motorway', 'motorway_link', 'trunk', 'trunk_link', 'primary',
+              'primary_link', 'secondary', 'secondary_link', 'tertiary',
+              'tertiary_link'],
+    'waterways': ['river', 'canal'],
+    'waterbodies': None,
+}
+
+# Average H3 cell edge length in meters at each resolution, from 0 to 15
+H3_EDGE_LENGTHS = [1107712.591, 418676.0055, 158244.6558, 59810.85794,
+                   22606.3794, 8544.408276, 3229.482772, 1220.629759,
+                   461.354684, 174.375668, 65.907807, 24.910561, 9.415526,
+                   3.559893, 1.348575, 0.509713]
+
+
+def convert_osm_layer(input_path, output_path, columns=OSM_COLUMNS, mask=None,
+                      batch_size=200000):
+    """
+    Converts an OSM Shapefile layer to a GeoPackage, reading it in batches so
+    that only one batch of features is held in memory at a time.
+
+    ...
+    Parameters
+    ----------
+    input_path : string
+        Path to the OSM Shapefile layer.
+    output_path : string
+        Path to save the GeoPackage to.
+    columns : list
+        Attribute columns to keep. Default is OSM_COLUMNS.
+    mask : geoseries
+        Area to keep features from, e.g. the buffered country. Features that
+        do not intersect it are dropped. Default is None, which keeps all
+        features.
+    batch_size : integer
+        Number of features to read at a time.
+
+    Returns
+    -------
+    count : integer
+        Number of features written.
+    """
+    mask_geometry = None
+    count = 0
+    start = 0
+    written = False
+
+    while True:
+        # pyogrio moves straight to the first feature of the batch, where
+        # fiona would read all the features before it again
+        batch = read_dataframe(input_path, skip_features=start, max_features=batch_size,
+                               columns=columns)
+        read_count = len(batch)
+        start += read_count
+
+        if mask is not None and read_count:
+            if mask_geometry is None:
+                mask_geometry = mask.to_crs(batch.crs).union_all()
+            hits = batch.sindex.query(mask_geometry, predicate='intersects')
+            batch = batch.iloc[sorted(hits)]
+
+        # Always write the first batch, so the layer exists even if empty
+        if not written or not batch.empty:
+            batch.to_file(output_path, driver='GPKG', encoding='utf-8',
+                          mode='a' if written else 'w', SPATIAL_INDEX='YES')
+            written = True
+            count += len(batch)
+
+        if read_count < batch_size:
+            break
+
+    return count
+
+def get_simplify_tolerance(hex_res, factor=0.01):
+    """
+    Gets the simplification tolerance for a hexagon resolution, as a share of
+    the hexagon edge length. Distances to the simplified features differ from
+    the originals by at most the tolerance.
+
+    ...
+    Parameters
+    ----------
+    hex_res : integer
+        H3 resolution of the SPIDER hexagons.
+    factor : float
+        Tolerance as a share of the hexagon edge length. Default is 0.01.
+
+    Returns
+    -------
+    tolerance : float
+        Tolerance in meters.
+    """
+    return H3_EDGE_LENGTHS[hex_res] * factor
+
+def count_vertices(geometries):
+    """
+    Counts the vertices of some geometries.
+
+    ...
+    Parameters
+    ----------
+    geometries : geoseries
+        Geometries to count the vertices of.
+
+    Returns
+    -------
+    count : integer
+        Total number of vertices.
+    """
+    try:
+        from shapely import get_num_coordinates
+    except ImportError:
+        # Shapely 1 has no vectorised count
+        return sum(_count_vertices(geometry) for geometry in geometries)
+
+    return int(np.sum(get_num_coordinates(np.asarray(geometries))))
+
+def _count_vertices(geometry):
+    """
+    Counts the vertices of one geometry, with Shapely 1.
+    """
+    if geometry is None or geometry.is_empty:
+        return 0
+    if hasattr(geometry, 'geoms'):
+        return sum(_count_vertices(part) for part in geometry.geoms)
+    if geometry.geom_type == 'Polygon':
+        return len(geometry.exterior.coords) + sum(len(ring.coords) for ring in geometry.interiors)
+
+    return len(geometry.coords)
+
+def _sample_distances(parts, points):
+    """
+    Gets the distance from each point to the nearest of some features.
+    """
+    nearest = gpd.sjoin_nearest(points, parts, distance_col='distance')
+
+    # Points equally near to several features appear more than once
+    return nearest.groupby(level=0)['distance'].first().reindex(points.index).to_numpy()
+
+def _line_parts(geometries):
+    """
+    Gets the single lines of some line geometries, or None if any geometry
+    is not a line.
+    """
+    parts = []
+    for geometry in geometries:
+        if geometry is None or geometry.is_empty:
+            continue
+        if geometry.geom_type == 'LineString':
+            parts.append(geometry)
+        elif geometry.geom_type == 'MultiLineString':
+            parts.extend(geometry.geoms)
+        else:
+            return None
+
+    return parts
+
+def _merge_features(features, tile_size):
+    """
+    Merges the features of each class within each tile, so that no single
+    merge covers the whole layer. Each feature goes to the tile holding the
+    centre of its bounds, so features are never split.
+
+    Lines are joined end to end with linemerge() on a plain MultiLineString,
+    which does not node them where they cross, and polygons are dissolved.
+    Each merged group is saved as one feature per part, unless that would
+    give it more features or vertices than it had, in which case its
+    original features are kept.
+    """
+    bounds = features.bounds
+    keys = [np.floor((bounds['minx'] + bounds['maxx']) / 2 / tile_size),
+            np.floor((bounds['miny'] + bounds['maxy']) / 2 / tile_size)]
+    if 'fclass' in features.columns:
+        keys.append(features['fclass'])
+
+    merged = []
+    for _, group in features.geometry.groupby(keys, dropna=False):
+        lines = _line_parts(group)
+        if lines is None:
+            part = group.union_all()
+        else:
+            part = linemerge(MultiLineString(lines)) if lines else None
+        parts = list(getattr(part, 'geoms', [part])) if part is not None else []
+        if (len(parts) <= len(group)
+                and count_vertices(gpd.GeoSeries(parts)) <= count_vertices(group)):
+            merged.extend(parts)
+        else:
+            merged.extend(group)
+
+    return gpd.GeoSeries(merged, crs=features.crs)
+
+def simplify_osm_layer(input_path, output_path, EPSG, tolerance, fclasses=None,
+                       sample_count=400, tile_size=50000):
+    """
+    Saves a lighter version of an OSM layer for SPIDER, keeping only some
+    classes, merging the features and simplifying them.
+
+    The simplification is done in the country's UTM zone. Features are
+    merged per class and per tile, which keeps each union small. The change
+    in distance caused by merging and simplifying the kept features is
+    measured at a grid of points over the layer. The effect of dropping
+    classes is reported separately, as feature and vertex counts.
+
+    ...
+    Parameters
+    ----------
+    input_path : string
+        Path to the OSM layer, as made by convert_osm_layer().
+    output_path : string
+        Path to save the lighter GeoPackage to, in the input's CRS.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    tolerance : float
+        Simplification tolerance in meters.
+    fclasses : list
+        OSM classes to keep. Default is None, which keeps all classes.
+    sample_count : integer
+        Approximate number of points to measure the distance error at.
+    tile_size : float
+        Width and height in meters of the tiles features are merged in.
+
+    Returns
+    -------
+    report : dictionary
+        Feature and vertex counts of the input, of the kept classes and of
+        the output, and the mean and maximum change in distance in meters
+        from the kept classes to the output.
+    """
+    features = gpd.read_file(input_path)
+    input_crs = features.crs
+    report = {'features_before': len(features),
+              'vertices_before': count_vertices(features.geometry)}
+
+    if fclasses is not None:
+        features = features[features['fclass'].isin(fclasses)]
+    report.update({'features_kept': len(features),
+                   'vertices_kept': count_vertices(features.geometry)})
+    features = features.to_crs(epsg=EPSG)
+
+    # Merged features are saved one part each, so SPIDER can use a spatial
+    # index
+    merged = _merge_features(features, tile_size)
+    merged_parts = gpd.GeoDataFrame(geometry=merged, crs=EPSG)
+    output = gpd.GeoDataFrame(geometry=merged.simplify(tolerance, preserve_topology=True), crs=EPSG)
+    output = output[~output.is_empty].reset_index(drop=True)
+    output.to_crs(input_crs).to_file(output_path, driver='GPKG', SPATIAL_INDEX='YES')
+
+    report.update({'features_after': len(output),
+                   'vertices_after': count_vertices(output.geometry),
+                   'mean_distance_error_m': 0.0, 'max_distance_error_m': 0.0})
+    if not output.empty:
+        xmin, ymin, xmax, ymax = merged_parts.total_bounds
+        side = max(2, int(math.sqrt(sample_count)))
+        x, y = np.meshgrid(np.linspace(xmin, xmax, side), np.linspace(ymin, ymax, side))
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x.ravel(), y.ravel()), crs=EPSG)
+        errors = np.abs(_sample_distances(output, points) - _sample_distances(merged_parts, points))
+        report['mean_distance_error_m'] = float(errors.mean())
+        report['max_distance_error_m'] = float(errors.max())
+
+    return report
@@ -0,0 +1,265 @@
+"""
+A file used for saving GLAES placements in other formats.
+
+Placements are always also saved as a NumPy array of x and y coordinates,
+with the CRS in a small text file next to it, which can be memory-mapped
+and counted without building a geometry for each placement.
+
+Contains PV_SEPARATION, TURBINES, distribute_variants(), get_coords_path(),
+get_placement_coords(), get_pv_variant(), get_turbine_variants(),
+get_variant_path(), read_placement_coords(), save_placement_coords() and
+save_placements().
+"""
+import os
+
+import geopandas as gpd
+import numpy as np
+
+from exclusions import get_item_coords
+from formats import with_format, write_vector
+from profiling import stage
+
+# Turbine models that placements can be made for, with their radius in meters
+TURBINES = {
+    # https://nrel.github.io/turbine-models/2020ATB_NREL_Reference_4MW_150.html
+    'NREL_4MW': 150,
+    # https://en.wind-turbine-models.com/turbines/19-vestas-v80-2.0
+    'Vestas_V80': 80,
+    # https://www.thewindpower.net/turbine_en_225_enercon_e126-7500.php
+    'Enercon_E126': 127,
+}
+
+# Default separation in meters between PV modules
+PV_SEPARATION = 440
+
+
+def get_placement_coords(ec, shp_path):
+    """
+    Gets the coordinates of the placements from the last call to
+    distributeItems(), reading them from its Shapefile output if the
+    exclusion calculator does not hold them.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator that placements were distributed with, or
+        None to read the Shapefile.
+    shp_path : string
+        Path to the placements Shapefile written by distributeItems().
+
+    Returns
+    -------
+    coords : array
+        Placement coordinates as an (n, 2) array of x and y.
+    """
+    coords = get_item_coords(ec)
+    if coords is not None:
+        return coords
+
+    points = gpd.read_file(shp_path)
+
+    return np.column_stack([points.geometry.x, points.geometry.y])
+
+def get_coords_path(shp_path):
+    """
+    Gets the path of the coordinate array saved next to a placements file.
+
+    ...
+    Parameters
+    ----------
+    shp_path : string
+        Path to the placements Shapefile, or the same path in another format.
+
+    Returns
+    -------
+    path : string
+        Path ending in .npy.
+    """
+    return f"{os.path.splitext(shp_path)[0]}.npy"
+
+def save_placement_coords(coords, shp_path, EPSG):
+    """
+    Saves placement coordinates as a float64 NumPy array of shape (n, 2),
+    with the CRS saved to a .crs text file next to it.
+
+    ...
+    Parameters
+    ----------
+    coords : array
+        Placement coordinates as an (n, 2) array of x and y.
+    shp_path : string
+        Path to the placements Shapefile the coordinates belong to.
+    EPSG : integer
+        EPSG code of the coordinates' CRS.
+    """
+    coords_path = get_coords_path(shp_path)
+    np.save(coords_path, np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2))
+    with open(f"{os.path.splitext(coords_path)[0]}.crs", 'w', encoding='utf-8') as file:
+        file.write(f"EPSG:{EPSG}")
+
+def read_placement_coords(shp_path):
+    """
+    Memory-maps the placement coordinates saved next to a placements file,
+    so only the parts being counted are read from disk.
+
+    ...
+    Parameters
+    ----------
+    shp_path : string
+        Path to the placements Shapefile, or the same path in another format.
+
+    Returns
+    -------
+    coords : array or None
+        Read-only memory-mapped (n, 2) array of x and y, or None if no
+        coordinates were saved, e.g. by an older run.
+    crs : string or None
+        CRS of the coordinates, e.g. "EPSG:32736".
+    """
+    coords_path = get_coords_path(shp_path)
+    crs_path = f"{os.path.splitext(coords_path)[0]}.crs"
+    if not (os.path.isfile(coords_path) and os.path.isfile(crs_path)):
+        return None, None
+
+    with open(crs_path, 'r', encoding='utf-8') as file:
+        crs = file.read().strip()
+
+    return np.load(coords_path, mmap_mode='r'), crs
+
+def save_placements(ec, shp_path, EPSG, file_format, coords=None):
+    """
+    Saves the placements from the last call to distributeItems() as a
+    coordinate array, and in another format if asked for, next to the
+    Shapefile written by GLAES.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator that placements were distributed with, or
+        None to read the Shapefile.
+    shp_path : string
+        Path to the placements Shapefile written by distributeItems().
+    EPSG : integer
+        EPSG code of the calculator's CRS.
+    file_format : string
+        One of formats.FORMATS. Only the coordinate array is saved for the
+        default format.
+    coords : array
+        Placement coordinates as an (n, 2) array of x and y. Default is None,
+        which gets them from the calculator or the Shapefile.
+    """
+    if coords is None:
+        coords = get_placement_coords(ec, shp_path)
+    save_placement_coords(coords, shp_path, EPSG)
+
+    if file_format == 'parquet':
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(coords[:, 0], coords[:, 1]),
+                                  crs=f"EPSG:{EPSG}")
+        write_vector(points, with_format(shp_path, file_format))
+
+def get_variant_path(path, variant):
+    """
+    Gets the path of a placement file for one variant of a sweep, e.g.
+    Kenya_turbine_placements_Vestas_V80.shp.
+
+    ...
+    Parameters
+    ----------
+    path : string
+        Path to the placement file of the default variant.
+    variant : string
+        Name of the variant.
+
+    Returns
+    -------
+    path : string
+        Path with the variant name added before the extension.
+    """
+    root, extension = os.path.splitext(path)
+
+    return f"{root}_{variant}{extension}"
+
+def get_pv_variant(separation):
+    """
+    Gets the variant name of a PV separation, e.g. "440m".
+
+    ...
+    Parameters
+    ----------
+    separation : float
+        Separation between PV modules in meters.
+
+    Returns
+    -------
+    variant : string
+        Name of the variant.
+    """
+    return f"{separation:g}m"
+
+def get_turbine_variants(turbines):
+    """
+    Gets the variant name and radius of each extra turbine, given as a model
+    from TURBINES or as a radius in meters. Models are named as in TURBINES,
+    and radii like PV separations, e.g. "100m".
+
+    ...
+    Parameters
+    ----------
+    turbines : list
+        Turbine models or radii in meters, e.g. ["Vestas_V80", "100"].
+
+    Returns
+    -------
+    variants : dictionary
+        Radius in meters of each turbine, keyed by variant name.
+    """
+    variants = {}
+    unknown = []
+    for turbine in turbines:
+        if turbine in TURBINES:
+            variants[turbine] = TURBINES[turbine]
+            continue
+        try:
+            radius = float(turbine)
+        except (TypeError, ValueError):
+            radius = None
+        if radius is None or not radius > 0:
+            unknown.append(turbine)
+            continue
+        variants[f"{radius:g}m"] = radius
+
+    if unknown:
+        raise ValueError(f"Unknown turbines {unknown}. Enter models from {list(TURBINES)} "
+                         "or radii in meters.")
+
+    return variants
+
+def distribute_variants(ec, shp_path, EPSG, file_format, separations, **kwargs):
+    """
+    Distributes items once for each variant of a sweep, reusing the
+    calculator's current exclusions, and saves each to a suffixed file.
+
+    ...
+    Parameters
+    ----------
+    ec : ExclusionCalculator
+        GLAES exclusion calculator with exclusions applied.
+    shp_path : string
+        Path to the placements Shapefile of the default variant.
+    EPSG : integer
+        EPSG code of the calculator's CRS.
+    file_format : string
+        One of formats.FORMATS, to also save placements in.
+    separations : dictionary
+        Separation passed to distributeItems(), keyed by variant name.
+    **kwargs
+        Other keyword arguments passed to distributeItems().
+    """
+    for variant, separation in separations.items():
+        print(f" - Distributing placements for {variant}...")
+        variant_path = get_variant_path(shp_path, variant)
+        with stage(f'distribute_{variant}', outputs=[variant_path]):
+            ec.distributeItems(separation=separation, output=variant_path, **kwargs)
+            save_placements(ec, variant_path, EPSG, file_format)
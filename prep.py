@@ -0,0 +1,467 @@
+"""
+A single entry point for the data prep steps, with one subcommand per step:
+
+ - boundaries: prepares the boundary, ocean, OSM, land cover and optional
+   hydropower and geothermal files for GLAES and SPIDER.
+ - exclusions: runs GLAES land exclusions and placements.
+ - config: makes the SPIDER config files.
+ - combine: joins the GLAES placements to the SPIDER hexagons.
+ - assign: assigns the country to the combined hexagons and removes those of
+   other countries.
+ - serve, submit, status and stop: run country jobs in a long-lived worker
+   that keeps the global datasets loaded, see worker_service.py.
+
+Each subcommand only imports the modules it uses, and nothing heavy is
+imported at start-up, so --help and the config step start quickly. This is
+useful when a scheduler runs one step for one country at a time. The
+prep_before_spider.py and prep_after_spider.py scripts still run all steps
+together.
+
+e.g. python prep.py exclusions Kenya --format parquet
+"""
+import argparse
+import os
+import sys
+
+# File formats and steps, repeated here so that building the parser does not
+# import formats.py or prep_before_spider.py
+FORMATS = ['geojson', 'parquet']
+BOUNDARY_STEPS = ['hydro', 'geothermal', 'boundaries', 'oceans', 'osm', 'clc']
+
+# Path to the top-level folder of the repository
+DIRNAME = os.path.dirname(os.path.abspath(__file__))
+
+# File the worker saves its address and key to
+WORKER_ADDRESS = os.path.join(DIRNAME, "logs", "worker.json")
+
+
+def _start_profile(args):
+    """
+    Turns profiling on if asked for.
+    """
+    if args.profile:
+        from profiling import configure
+
+        configure(cprofile_stages=args.cprofile,
+                  cprofile_path=os.path.join(DIRNAME, "logs", "profiles"))
+
+def _save_profile(args):
+    """
+    Saves the profiling report if asked for.
+    """
+    if args.profile:
+        from profiling import write_report
+
+        write_report(args.profile)
+        print(f"Profiling report saved to {args.profile}")
+
+def _prepare_countries(args, steps, **options):
+    """
+    Runs some steps of prep_before_spider.prepare_country() for each country.
+
+    ...
+    Parameters
+    ----------
+    args : Namespace
+        Parsed command line arguments.
+    steps : list
+        Names of the steps to run.
+    **options
+        Other keyword arguments passed to prepare_country().
+    """
+    from boundaries import get_boundaries
+    from placements import TURBINES
+    from prep_before_spider import prepare_country
+    from utils import clean_country_name, get_paths
+
+    paths = get_paths(DIRNAME)
+    boundaries = get_boundaries(paths['region'], index_column='NAME')
+
+    for country_name in args.countries:
+        country = boundaries.select([clean_country_name(country_name)])
+        prepare_country(country_name, country, paths, None, TURBINES['NREL_4MW'],
+                        steps=steps, **options)
+
+def _get_turbine_variants(turbines):
+    """
+    Gets the radius of each extra turbine model or radius, exiting if one is
+    unknown.
+    """
+    from placements import get_turbine_variants
+
+    try:
+        return get_turbine_variants(turbines)
+    except ValueError as error:
+        sys.exit(str(error))
+
+def run_boundaries(args):
+    """
+    Runs the boundaries subcommand.
+    """
+    registries = {'hydro': args.hydro_registry, 'geothermal': args.geothermal_registry}
+    registries = {kind: path for kind, path in registries.items() if path}
+    saved = {}
+    if registries and not args.dry_run:
+        from boundaries import get_boundaries
+        from registries import split_registry
+        from utils import get_paths
+
+        paths = get_paths(DIRNAME)
+        boundaries = get_boundaries(paths['region'], index_column='NAME')
+        for kind, registry_path in registries.items():
+            print(f"Splitting {kind} registry {registry_path} between countries...")
+            saved[kind] = split_registry(registry_path, kind, boundaries, args.countries, paths)
+    elif registries:
+        from utils import clean_country_name
+
+        saved = {kind: [clean_country_name(name) for name in args.countries]
+                 for kind in registries}
+
+    osm_simplify = None
+    if args.osm_simplify:
+        import yaml
+
+        from prep_before_spider import get_osm_simplify
+        from utils import get_paths
+
+        # The tolerance is tied to the hexagon size in the SPIDER config
+        with open(get_paths(DIRNAME)['config_input_file'], 'r') as file:
+            hex_res = yaml.load(file, Loader=yaml.FullLoader)['hex_res']
+        try:
+            osm_simplify = get_osm_simplify(hex_res, args.osm_simplify_factor,
+                                            args.osm_fclasses)
+        except ValueError as error:
+            sys.exit(str(error))
+
+    _prepare_countries(args, BOUNDARY_STEPS,
+                       hydro=args.hydro, geothermal=args.geothermal,
+                       registries=saved,
+                       clc_max_memory_mb=args.clc_memory, clc_vrt=args.clc_vrt,
+                       osm_clip=args.osm_clip, osm_simplify=osm_simplify,
+                       boundary_simplify=args.simplify_boundaries,
+                       force=args.force,
+                       step_workers=args.step_workers, dry_run=args.dry_run)
+
+def run_exclusions(args):
+    """
+    Runs the exclusions subcommand.
+    """
+    if args.tile_size and (args.turbines or args.pv_separations):
+        sys.exit('--turbines and --pv-separations cannot be used with --tile-size.')
+    if args.tile_size and args.no_placements:
+        sys.exit('--no-placements cannot be used with --tile-size.')
+    if args.preview is not None and args.preview <= 100:
+        sys.exit('Please enter a --preview pixel size larger than the 100 m used for full runs.')
+    if args.preview is not None and args.tile_size:
+        sys.exit('--preview cannot be used with --tile-size.')
+    if not 0 <= args.coast_buffer < 10000:
+        sys.exit('Please enter a --coast-buffer from 0 to less than 10000 m.')
+
+    # A preview replaces the exclusions step with a coarse run of its own
+    step = 'exclusions' if args.preview is None else 'preview'
+    _prepare_countries(args, ['exclusions'],
+                       slope_exclusion=args.slopeexclusion,
+                       placement_format=args.format,
+                       tile_size=args.tile_size * 1000 if args.tile_size else None,
+                       tile_overlap=args.tile_overlap * 1000,
+                       glaes_workers=args.glaes_workers,
+                       turbine_variants=_get_turbine_variants(args.turbines),
+                       pv_separations=args.pv_separations,
+                       placements=not args.no_placements,
+                       preview=args.preview,
+                       coast_buffer=args.coast_buffer,
+                       force=[step] if args.force else [])
+
+def run_config(args):
+    """
+    Runs the config subcommand.
+    """
+    import yaml
+
+    from spider_config import PLANT_FILES, write_spider_config
+    from utils import clean_country_name, get_paths
+
+    paths = get_paths(DIRNAME)
+    with open(paths['config_input_file'], 'r') as file:
+        config_data = yaml.load(file, Loader=yaml.FullLoader)
+
+    for country_name in args.countries:
+        country_name_clean = clean_country_name(country_name)
+        # Only add plant data the country has a GeoPackage for, as countries
+        # without plants in a global registry get none
+        kinds = {}
+        for kind, wanted in (('hydro', args.hydro), ('geothermal', args.geothermal)):
+            file_name = f"{country_name_clean}{PLANT_FILES[kind]}"
+            kinds[kind] = wanted and os.path.exists(os.path.join(paths['spider_prep_data'], file_name))
+            if wanted and not kinds[kind]:
+                print(f" ! No {kind} GeoPackage found for {country_name_clean}. Not adding {kind} to its config.")
+        write_spider_config(country_name_clean, config_data, paths,
+                            kinds['hydro'], kinds['geothermal'])
+
+def run_combine(args):
+    """
+    Runs the combine subcommand.
+    """
+    from prep_after_spider import combine_country
+    from profiling import set_context
+    from utils import clean_country_name
+
+    _get_turbine_variants(args.turbines)
+    for country_name in args.countries:
+        country_name_clean = clean_country_name(country_name)
+        set_context(country=country_name_clean)
+        print(f"Combining GLAES and SPIDER data for {country_name_clean}:")
+        combine_country(country_name_clean, DIRNAME, args.format, args.turbines,
+                        args.pv_separations, args.zonal_stats or args.no_placements,
+                        not args.no_placements)
+        print("Done! File saved \n")
+
+def run_assign(args):
+    """
+    Runs the assign subcommand.
+    """
+    if len(args.isocodes) != len(args.countries):
+        sys.exit('Please enter one ISO code for each country.')
+
+    import geopandas as gpd
+
+    from boundaries import get_boundaries
+    from formats import read_vector
+    from prep_after_spider import finalise_country, get_combined_path
+    from profiling import set_context
+    from utils import clean_country_name
+
+    world = get_boundaries(gpd.datasets.get_path('naturalearth_lowres'))
+    for country_name, iso_code in zip(args.countries, args.isocodes):
+        country_name_clean = clean_country_name(country_name)
+        set_context(country=country_name_clean)
+        hexagons = read_vector(get_combined_path(country_name_clean, DIRNAME, args.format))
+        finalise_country(hexagons, world, country_name_clean, iso_code, DIRNAME,
+                         args.format)
+
+def _send_request(args, message):
+    """
+    Sends a request to the running worker, exiting if it cannot be reached.
+    """
+    from worker_service import send_request
+
+    try:
+        return send_request(args.address, message)
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+
+def run_serve(args):
+    """
+    Runs the serve subcommand.
+    """
+    from worker_service import WorkerService
+
+    WorkerService(DIRNAME).serve(args.address, args.port)
+
+def run_submit(args):
+    """
+    Runs the submit subcommand.
+    """
+    import json
+
+    try:
+        options = json.loads(args.options)
+    except json.JSONDecodeError as error:
+        sys.exit(f"--options is not valid JSON: {error}")
+    if args.kind == 'after':
+        if len(args.isocodes or []) != len(args.countries):
+            sys.exit("Please enter one ISO code for each country with -ic.")
+        options.setdefault('file_format', args.format)
+        jobs = [(country_name, dict(options, iso_code=iso_code))
+                for country_name, iso_code in zip(args.countries, args.isocodes)]
+    else:
+        jobs = [(country_name, options) for country_name in args.countries]
+
+    reply = _send_request(args, {'command': 'submit', 'kind': args.kind, 'jobs': jobs})
+    for (country_name, _), job_id in zip(jobs, reply['job_ids']):
+        print(f"Submitted job {job_id}: {args.kind} {country_name}")
+
+def run_status(args):
+    """
+    Runs the status subcommand.
+    """
+    reply = _send_request(args, {'command': 'status', 'job_ids': args.job_ids or None})
+    if not reply['jobs']:
+        print("No jobs")
+    for job in reply['jobs']:
+        line = f" - {job['id']} {job['kind']} {job['country']}: {job['state']}"
+        if job['wall_s'] is not None:
+            line += f" in {job['wall_s']:.1f} s"
+        print(f"{line} (log: {job['log_path']})")
+        if args.stages:
+            for record in job['stages']:
+                print(f"     {record['stage']}: {record['wall_s']:.1f} s, {record['status']}")
+
+def run_stop(args):
+    """
+    Runs the stop subcommand.
+    """
+    _send_request(args, {'command': 'stop'})
+    print("Worker stopping after the running job")
+
+def get_parser():
+    """
+    Builds the command line parser.
+
+    ...
+    Returns
+    -------
+    parser : ArgumentParser
+        Parser with one subparser per subcommand.
+    """
+    parser = argparse.ArgumentParser(description="Geo-X data prep steps.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_countries(subparser):
+        subparser.add_argument('countries', nargs='+', type=str,
+                               help="<Required> Enter the country names you are preparing for.")
+
+    def add_profile(subparser):
+        subparser.add_argument('--profile', type=str,
+                               help="<Optional> Enter a path ending in .json or .csv to save the time, CPU time, peak memory and file sizes of each stage to.")
+        subparser.add_argument('--cprofile', nargs='+', default=[],
+                               help="<Optional> Enter the stages to also run cProfile for. Requires --profile.")
+
+    def add_variants(subparser):
+        subparser.add_argument('--turbines', nargs='+', default=[],
+                               help="<Optional> Enter extra turbine models (NREL_4MW, Vestas_V80 or Enercon_E126) or radii in meters.")
+        subparser.add_argument('--pv-separations', nargs='+', type=float, default=[],
+                               help="<Optional> Enter extra PV separations in meters.")
+
+    boundaries = subparsers.add_parser('boundaries', help="Prepare the input files for GLAES and SPIDER.")
+    add_countries(boundaries)
+    boundaries.add_argument('--hydro', action='store_true',
+                            help="<Optional> Use the flag to prepare hydropower data.")
+    boundaries.add_argument('--geothermal', action='store_true',
+                            help="<Optional> Use the flag to prepare geothermal data.")
+    boundaries.add_argument('--hydro-registry', type=str,
+                            help="<Optional> Enter the path to one hydropower CSV file for all countries. Implies --hydro.")
+    boundaries.add_argument('--geothermal-registry', type=str,
+                            help="<Optional> Enter the path to one geothermal CSV file for all countries. Implies --geothermal.")
+    boundaries.add_argument('--clc-memory', type=int, default=512,
+                            help="<Optional> Enter the approximate memory limit in megabytes used when clipping the land cover raster. Default is 512.")
+    boundaries.add_argument('--clc-vrt', action='store_true',
+                            help="<Optional> Use the flag to save the clipped land cover raster as a VRT.")
+    boundaries.add_argument('--osm-clip', action='store_true',
+                            help="<Optional> Use the flag to drop OSM features outside the country and its 10 km buffer.")
+    boundaries.add_argument('--osm-simplify', action='store_true',
+                            help="<Optional> Use the flag to filter, merge and simplify the OSM layers for faster SPIDER distances.")
+    boundaries.add_argument('--osm-simplify-factor', type=float, default=0.01,
+                            help="<Optional> Enter the simplification tolerance as a share of the hexagon edge length. Default is 0.01.")
+    boundaries.add_argument('--osm-fclasses', nargs='+', default=[],
+                            help="<Optional> Enter the OSM classes to keep in a layer when simplifying, e.g. 'roads=motorway,trunk,primary'.")
+    boundaries.add_argument('--simplify-boundaries', type=float, nargs='?', const=0.5,
+                            help="<Optional> Use the flag to simplify the boundaries used by GLAES, with a tolerance as a share of the 100 m pixel size, 0.5 if not given.")
+    boundaries.add_argument('--force', nargs='+', default=[], choices=BOUNDARY_STEPS + ['all'],
+                            help="<Optional> Enter the steps to run even if their outputs are up to date.")
+    boundaries.add_argument('--step-workers', type=int, default=1,
+                            help="<Optional> Enter the number of steps of each country to run at the same time in threads. Default is 1.")
+    boundaries.add_argument('--dry-run', action='store_true',
+                            help="<Optional> Use the flag to print the planned steps without running them.")
+    add_profile(boundaries)
+    boundaries.set_defaults(function=run_boundaries)
+
+    exclusions = subparsers.add_parser('exclusions', help="Run GLAES land exclusions and placements.")
+    add_countries(exclusions)
+    exclusions.add_argument('-se', '--slopeexclusion', action='store_true',
+                            help="<Optional> Use the flag if you have used the Slope-Exclusion submodule.")
+    exclusions.add_argument('--format', default='geojson', choices=FORMATS,
+                            help="<Optional> Enter 'parquet' to also save placements as GeoParquet. Default is 'geojson'.")
+    exclusions.add_argument('--tile-size', type=float,
+                            help="<Optional> Enter a tile size in kilometres to run GLAES on overlapping tiles.")
+    exclusions.add_argument('--tile-overlap', type=float, default=5,
+                            help="<Optional> Enter the overlap between GLAES tiles in kilometres. Default is 5.")
+    exclusions.add_argument('--glaes-workers', type=int, default=1,
+                            help="<Optional> Enter the number of GLAES tiles to run at the same time. Default is 1.")
+    add_variants(exclusions)
+    exclusions.add_argument('--no-placements', action='store_true',
+                            help="<Optional> Use the flag to only save the exclusion rasters, without placing turbines and PV modules.")
+    exclusions.add_argument('--coast-buffer', type=float, default=250,
+                            help="<Optional> Enter the distance in meters from the oceans to exclude, up to 10000. Default is 250.")
+    exclusions.add_argument('--preview', type=float, nargs='?', const=1000,
+                            help="<Optional> Use the flag to preview the exclusions at a coarse pixel size in meters, 1000 if not given.")
+    exclusions.add_argument('--force', action='store_true',
+                            help="<Optional> Use the flag to run exclusions even if their outputs are up to date.")
+    add_profile(exclusions)
+    exclusions.set_defaults(function=run_exclusions)
+
+    config = subparsers.add_parser('config', help="Make the SPIDER config files.")
+    add_countries(config)
+    config.add_argument('--hydro', action='store_true',
+                        help="<Optional> Use the flag to add hydropower to the config.")
+    config.add_argument('--geothermal', action='store_true',
+                        help="<Optional> Use the flag to add geothermal to the config.")
+    config.set_defaults(function=run_config, profile=None)
+
+    combine = subparsers.add_parser('combine', help="Join the GLAES placements to the SPIDER hexagons.")
+    add_countries(combine)
+    combine.add_argument('--format', default='geojson', choices=FORMATS,
+                         help="<Optional> Enter 'parquet' to read placements and save hexagons as GeoParquet. Default is 'geojson'.")
+    add_variants(combine)
+    combine.add_argument('--zonal-stats', action='store_true',
+                         help="<Optional> Use the flag to add the eligible area and estimated placements of each hexagon from the exclusion rasters.")
+    combine.add_argument('--no-placements', action='store_true',
+                         help="<Optional> Use the flag if exclusions were run with --no-placements. Implies --zonal-stats.")
+    add_profile(combine)
+    combine.set_defaults(function=run_combine)
+
+    assign = subparsers.add_parser('assign', help="Assign countries to the combined hexagons and save the final files.")
+    add_countries(assign)
+    assign.add_argument('-ic', '--isocodes', nargs='+', type=str, required=True,
+                        help="<Required> Enter the ISO codes for the country names, respectively.")
+    assign.add_argument('--format', default='geojson', choices=FORMATS,
+                        help="<Optional> Enter 'parquet' to read and save hexagons as GeoParquet. Default is 'geojson'.")
+    add_profile(assign)
+    assign.set_defaults(function=run_assign)
+
+    def add_address(subparser):
+        subparser.add_argument('--address', default=WORKER_ADDRESS,
+                               help="<Optional> Enter the path to the worker's address file. Default is logs/worker.json.")
+
+    serve = subparsers.add_parser('serve', help="Start a worker that keeps the global datasets loaded and runs submitted jobs.")
+    add_address(serve)
+    serve.add_argument('--port', type=int, default=0,
+                       help="<Optional> Enter the local port to listen on. Default uses any free port.")
+    serve.set_defaults(function=run_serve, profile=None)
+
+    submit = subparsers.add_parser('submit', help="Send country jobs to a running worker.")
+    submit.add_argument('kind', choices=['before', 'after'],
+                        help="<Required> Enter 'before' to run prep_before_spider.py steps, or 'after' to combine and assign hexagons.")
+    add_countries(submit)
+    submit.add_argument('-ic', '--isocodes', nargs='+', type=str,
+                        help="<Optional> Enter the ISO codes for the country names, respectively. Required for 'after' jobs.")
+    submit.add_argument('--format', default='geojson', choices=FORMATS,
+                        help="<Optional> Enter 'parquet' to read placements and save hexagons as GeoParquet in 'after' jobs. Default is 'geojson'.")
+    submit.add_argument('--options', default='{}',
+                        help="<Optional> Enter other settings as JSON, passed to prepare_country() for 'before' jobs or combine_country() for 'after' jobs, e.g. '{\"steps\": [\"exclusions\"], \"slope_exclusion\": true}'.")
+    add_address(submit)
+    submit.set_defaults(function=run_submit, profile=None)
+
+    status = subparsers.add_parser('status', help="Show the status and timings of jobs sent to a running worker.")
+    status.add_argument('job_ids', nargs='*', type=int,
+                        help="<Optional> Enter the IDs of the jobs to show. Default shows all jobs.")
+    status.add_argument('--stages', action='store_true',
+                        help="<Optional> Use the flag to also show the time taken by each stage of each job.")
+    add_address(status)
+    status.set_defaults(function=run_status, profile=None)
+
+    stop = subparsers.add_parser('stop', help="Stop a running worker after its running job.")
+    add_address(stop)
+    stop.set_defaults(function=run_stop, profile=None)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    _start_profile(args)
+    try:
+        args.function(args)
+    finally:
+        _save_profile(args)
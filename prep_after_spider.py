@@ -11,90 +11,298 @@ The inputs are the SPIDER hex.geojson file and the GLAES pv_placements.shp and
 turbine_placements.shp files.
 The output is a hexagon file where a count of turbine and pv installations is 
 attached to the hexagons.
+Optionally, the eligible area of each hexagon in the GLAES exclusion rasters
+and an estimate of the installations that fit in it are also attached.
 
 Secondly, it assigns the specified country name to each hexagon and updates the 
-CRS to match the world dataset, saving the hexagons into a new file.
+CRS to match the world dataset.
 
 Lastly, this script removes the duplicated hexagons that belong to the 
-country/countries which are not the specified country and updates the file 
-created in step two.
+country/countries which are not the specified country, and saves the remaining
+hexagons into a new file.
 
 All files are saved to inputs_geox/data and inputs_geox/final_data.
 """
 import argparse
 import geopandas as gpd
-import json
+import numpy as np
 import os
+import pandas as pd
 
+from boundaries import get_boundaries
+from formats import FORMATS, read_vector, with_format, write_partition, write_vector
+from placements import (get_pv_variant, get_turbine_variants, get_variant_path,
+                        read_placement_coords)
+from profiling import configure, set_context, stage, write_report
 from utils import clean_country_name
+from zonal_stats import add_zonal_stats
 
-def combine_glaes_spider(hex, wind_points, pv_points):
+# Columns that may hold the H3 cell IDs of SPIDER hexagons
+H3_COLUMNS = ['h3_index', 'h3', 'hex_id', 'h3_polyfill', 'index']
+
+# Number of placements counted at a time, so memory-mapped placements are
+# read in pieces
+CHUNK_SIZE = 1000000
+
+def get_h3_column(hex):
     """
-    Combining the glaes and spider files into one hexagon file.
-    
+    Finds the column holding H3 cell IDs of the hexagons, if any.
+
     ...
     Parameters
     ----------
     hex : geodataframe
         Hexagon file from spider run.
-    wind_points : geodataframe
-        Wind placements file from glaes run.
-    pv_points : geodataframe
-        PV placements file from glaes run.
 
     Returns
     -------
-    hex : geodataframe
-        Combined hexagons.
+    column : string or None
+        Name of the H3 column, or None if the hexagons are not H3 cells or the
+        h3 package is not installed.
     """
-    print(" - Joining turbine locations...")
-    # Spatial join the wind points to the polygons
-    spatial_join = gpd.sjoin(wind_points, hex, how='left', predicate='within')
+    try:
+        import h3
+    except ImportError:
+        return None
+
+    is_valid = getattr(h3, 'is_valid_cell', None) or getattr(h3, 'h3_is_valid', None)
+    for column in H3_COLUMNS:
+        if column not in hex.columns or hex.empty:
+            continue
+        cells = hex[column]
+        if all(isinstance(cell, str) and is_valid(cell) for cell in cells):
+            return column
+
+    return None
+
+def get_coords(points):
+    """
+    Gets the coordinates and CRS of placements.
+
+    ...
+    Parameters
+    ----------
+    points : geodataframe or tuple
+        Placements as a geodataframe, or as coordinates and CRS as returned
+        by placements.read_placement_coords().
+
+    Returns
+    -------
+    coords : array
+        Placement coordinates as an (n, 2) array of x and y.
+    crs : CRS or string
+        CRS of the coordinates.
+    """
+    if isinstance(points, tuple):
+        return points
+
+    return (np.column_stack([points.geometry.x.to_numpy(), points.geometry.y.to_numpy()]),
+            points.crs)
+
+def coords_to_h3(coords, crs, resolution):
+    """
+    Converts coordinates to the integer IDs of the H3 cells containing them.
+
+    ...
+    Parameters
+    ----------
+    coords : array
+        Coordinates as an (n, 2) array of x and y.
+    crs : CRS or string
+        CRS of the coordinates.
+    resolution : integer
+        H3 resolution.
+
+    Returns
+    -------
+    cells : array
+        H3 cell IDs as unsigned integers, one per point.
+    """
+    import h3.api.numpy_int as h3_int
+    from pyproj import Transformer
+
+    # Transform the coordinates as arrays, without building shapely objects
+    transformer = Transformer.from_crs(crs, 4326, always_xy=True)
+    lon, lat = transformer.transform(coords[:, 0], coords[:, 1])
+
+    # h3 has no array version of this, but the integer API writes straight
+    # into the array instead of making a string for each point
+    to_cell = getattr(h3_int, 'latlng_to_cell', None) or h3_int.geo_to_h3
+
+    return np.fromiter((to_cell(y, x, resolution) for y, x in zip(lat.tolist(), lon.tolist())),
+                       dtype=np.uint64, count=len(lon))
+
+def count_points_in_hexagons(hex, points, h3_column=None):
+    """
+    Counts the points within each hexagon, as count_points_by_variant() does
+    for one set of points.
+
+    ...
+    Parameters
+    ----------
+    hex : geodataframe
+        Hexagon file from spider run, in the CRS of the points.
+    points : geodataframe or tuple
+        Placements file from glaes run, or its coordinates and CRS as
+        returned by placements.read_placement_coords().
+    h3_column : string
+        Name of the column holding the hexagons' H3 cell IDs. Default is None,
+        which uses the spatial join.
 
-    # Group by polygon and count the points within each polygon
-    wind_point_counts = spatial_join.groupby('index').size()
+    Returns
+    -------
+    counts : series
+        Number of points in each hexagon, aligned with the hexagons' index.
+    """
+    return count_points_by_variant(hex, {'count': points}, h3_column)['count']
 
-    # Merge the point counts with the 'hex' GeoDataFrame based on the index
-    hex['theo_turbines'] = wind_point_counts
+def count_points_by_variant(hex, points_by_variant, h3_column=None):
+    """
+    Counts the points of several placement variants within each hexagon.
 
-    # If some polygons have no points, fill their 'point_count' with 0
-    hex['theo_turbines'] = hex['theo_turbines'].fillna(0)
+    The hexagons are prepared once for all the variants, and the points are
+    counted in chunks, so memory-mapped coordinates are read a piece at a
+    time. If the hexagons are H3 cells, points are converted to integer H3
+    cell IDs and looked up in the sorted cell IDs of the hexagons, without
+    building any geometries. Otherwise, each chunk of points is spatially
+    joined to the hexagons, whose spatial index is built once.
 
-    print(" - Joining pv locations...")
-    # Spatial join the pv points to the polygons
-    spatial_join = gpd.sjoin(pv_points, hex, how='left', predicate='within')
+    ...
+    Parameters
+    ----------
+    hex : geodataframe
+        Hexagon file from spider run, in the CRS of the points.
+    points_by_variant : dictionary
+        Placements of each variant from glaes run, as geodataframes or as
+        coordinates and CRS, keyed by variant name.
+    h3_column : string
+        Name of the column holding the hexagons' H3 cell IDs. Default is None,
+        which uses the spatial join.
 
-    # Group by polygon and count the points within each polygon
-    pv_point_counts = spatial_join.groupby('index').size()
+    Returns
+    -------
+    counts : dataframe
+        Number of points in each hexagon, with one column per variant and
+        aligned with the hexagons' index.
+    """
+    coords_by_variant = {variant: get_coords(points) for variant, points in points_by_variant.items()}
+
+    if h3_column is None:
+        # Spatial join each chunk of points to the polygons, by position
+        polygons = hex[['geometry']].reset_index(drop=True)
+        counts = {}
+        for variant, (coords, _) in coords_by_variant.items():
+            counts[variant] = np.zeros(len(hex))
+            for start in range(0, len(coords), CHUNK_SIZE):
+                chunk = np.asarray(coords[start:start + CHUNK_SIZE])
+                chunk_points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(chunk[:, 0], chunk[:, 1]),
+                                                crs=hex.crs)
+                spatial_join = gpd.sjoin(chunk_points, polygons, how='inner', predicate='within')
+                counts[variant] += np.bincount(spatial_join['index_right'].to_numpy(),
+                                               minlength=len(hex))
+
+        return pd.DataFrame(counts, index=hex.index)
+
+    import h3.api.numpy_int as h3_int
+
+    str_to_int = getattr(h3_int, 'str_to_int', None) or h3_int.string_to_h3
+    get_resolution = getattr(h3_int, 'get_resolution', None) or h3_int.h3_get_resolution
+    hex_cells = np.array([str_to_int(cell) for cell in hex[h3_column]], dtype=np.uint64)
+    resolution = get_resolution(hex_cells[0])
+
+    # Look the cells of the points up in the sorted cells of the hexagons
+    order = np.argsort(hex_cells)
+    sorted_cells = hex_cells[order]
+    counts = {}
+    for variant, (coords, crs) in coords_by_variant.items():
+        counts[variant] = np.zeros(len(hex))
+        for start in range(0, len(coords), CHUNK_SIZE):
+            cells, cell_counts = np.unique(coords_to_h3(coords[start:start + CHUNK_SIZE], crs,
+                                                        resolution),
+                                           return_counts=True)
+            positions = np.minimum(np.searchsorted(sorted_cells, cells), len(sorted_cells) - 1)
+            found = sorted_cells[positions] == cells
+            counts[variant][order] += np.bincount(positions[found], weights=cell_counts[found],
+                                                  minlength=len(hex))
+
+    return pd.DataFrame(counts, index=hex.index)
+
+def combine_glaes_spider(hex, wind_points, pv_points, wind_variants=None,
+                         pv_variants=None):
+    """
+    Combining the glaes and spider files into one hexagon file.
 
-    # Merge the point counts with the 'hex' GeoDataFrame based on the index
-    hex['theo_pv'] = pv_point_counts
+    All placements are counted in one pass with count_points_by_variant().
+    If the hexagons are H3 cells, placements are counted by H3 cell ID instead
+    of with a spatial join. Placements can be given as coordinates, e.g.
+    memory-mapped from the arrays saved by GLAES, so no geometry is built for
+    each placement.
+    
+    ...
+    Parameters
+    ----------
+    hex : geodataframe
+        Hexagon file from spider run, in the CRS of the placements.
+    wind_points : geodataframe or tuple
+        Wind placements file from glaes run, or its coordinates and CRS as
+        returned by placements.read_placement_coords().
+    pv_points : geodataframe or tuple
+        PV placements file from glaes run, or its coordinates and CRS.
+    wind_variants : dictionary
+        Wind placements of each extra turbine, keyed by variant name as made
+        by placements.get_turbine_variants(). Each is counted in a
+        'theo_turbines_[VARIANT]' column. Default is None.
+    pv_variants : dictionary
+        PV placements of each extra separation, keyed by variant name. Each
+        is counted in a 'theo_pv_[VARIANT]' column. Default is None.
 
-    # If some polygons have no points, fill their 'point_count' with 0
-    hex['theo_pv'] = hex['theo_pv'].fillna(0)
+    Returns
+    -------
+    hex : geodataframe
+        Combined hexagons.
+    """
+    h3_column = get_h3_column(hex)
+    if h3_column is None:
+        print(" - Hexagons are not H3 cells, using spatial joins...")
+
+    # Count all placements in one pass, so the hexagons are prepared once
+    points_by_column = {'theo_turbines': wind_points, 'theo_pv': pv_points}
+    points_by_column.update({f'theo_turbines_{variant}': points for variant, points in (wind_variants or {}).items()})
+    points_by_column.update({f'theo_pv_{variant}': points for variant, points in (pv_variants or {}).items()})
+    print(" - Joining turbine and pv locations...")
+    with stage('join_placements'):
+        counts = count_points_by_variant(hex, points_by_column, h3_column)
+    for column in points_by_column:
+        hex[column] = counts[column]
 
     return hex
 
-def assign_country(hexagons, world):
+def assign_country(hexagons, boundaries, country_name_clean):
     """
     Assigns specific country name to each hexagon and matches CRS to the world
     dataset.
 
+    Only the specified country and its neighbours are joined to the hexagons,
+    as hexagons of other countries are removed afterwards.
+
     ...
     Parameters
     ----------
     hexagons : geodataframe
         Hexagon file from data folder.
-    world : geodataframe
-        World dataset.
+    boundaries : Boundaries
+        World dataset, as loaded by boundaries.get_boundaries().
+    country_name_clean : string
+        Country name in a standardised format.
 
     Returns
     -------
     hexagons_with_country : geodataframe
         Modified hexagons.
     """
-    hexagons.to_crs(world.crs, inplace=True)
-    countries = world.drop(columns=[
+    hexagons.to_crs(boundaries.frame.crs, inplace=True)
+    countries = boundaries.with_neighbours(country_name_clean, column='name')
+    countries = countries.drop(columns=[
                                     'pop_est', 
                                     'continent', 
                                     'iso_a3', 
@@ -102,22 +310,23 @@ def assign_country(hexagons, world):
                                     ]
                             )
     countries = countries.rename(columns={'name':'country'})
-    hexagons_with_country = gpd.sjoin(hexagons, countries, op='intersects') # changed from "within"
+    with stage('sjoin_countries'):
+        hexagons_with_country = gpd.sjoin(hexagons, countries, predicate='intersects') # changed from "within"
     
     # Clean up slightly by removing index_right
     hexagons_with_country = hexagons_with_country.drop('index_right', axis=1)
 
     return hexagons_with_country
 
-def remove_extra_hexagons(output_hexagon_path, country_name_clean):
+def remove_extra_hexagons(hexagons_with_country, country_name_clean):
     """
-    Removes duplicated hexagons.
+    Removes duplicated hexagons that belong to other countries.
 
     ...
     Parameters
     ----------
-    output_hexagon_path : string
-        File path to output hexagon file.
+    hexagons_with_country : geodataframe
+        Hexagons with a country assigned, as made by assign_country().
     country_name_clean : string
         Country name in a standardised format.
 
@@ -126,16 +335,7 @@ def remove_extra_hexagons(output_hexagon_path, country_name_clean):
     hexagons : geodataframe
         Modified hexagons.
     """
-    with open(output_hexagon_path, 'r') as file:
-        hexagons = json.load(file)
-
-    copied_list = hexagons["features"].copy()
-
-    for feature in copied_list:
-        if feature['properties']['country'] != country_name_clean:
-            hexagons['features'].remove(feature)
-
-    return hexagons
+    return hexagons_with_country[hexagons_with_country['country'] == country_name_clean]
 
 def update_hexagons(hexagons, output_hexagon_path):
     """
@@ -147,19 +347,188 @@ def update_hexagons(hexagons, output_hexagon_path):
     hexagons : geodataframe
         Hexagon file from data folder.
     output_hexagon_path : string
-        File path to output hexagon file.
+        File path to output hexagon file. Saved as GeoParquet if it ends in
+        .parquet, otherwise as GeoJSON.
     """
-    if isinstance(hexagons, dict):
-            with open(output_hexagon_path, 'w') as file:
-                json.dump(hexagons, file)
-    elif not hexagons.empty:
-        hexagons.to_file(f"{output_hexagon_path}", driver="GeoJSON")
+    if not hexagons.empty:
+        with stage('save', outputs=[output_hexagon_path]):
+            write_vector(hexagons, f"{output_hexagon_path}")
     else:
         print(" ! Hex GeoDataFrame is empty. This can happen when your country \
               is much smaller than the hexagon size you have used in Spider. \
               Please use smaller hexagons in Spider and retry. Not saving to \
               GeoJSON.")
 
+def load_placements(shp_path, file_format='geojson'):
+    """
+    Loads placements for counting, memory-mapping their coordinate array if
+    GLAES saved one, or reading the placement file otherwise.
+
+    ...
+    Parameters
+    ----------
+    shp_path : string
+        Path to the placements Shapefile.
+    file_format : string
+        Format the placements were also saved in, from formats.FORMATS.
+
+    Returns
+    -------
+    points : geodataframe or tuple
+        Placement geometries, or coordinates and CRS.
+    """
+    coords, crs = read_placement_coords(shp_path)
+    if coords is not None:
+        return coords, crs
+
+    # Only the placement geometries are needed for counting
+    return read_vector(with_format(shp_path, file_format), columns=['geometry'])
+
+def combine_country(country_name_clean, dirname, file_format='geojson',
+                    turbines=(), pv_separations=(), zonal_stats=False,
+                    placements=True):
+    """
+    Loads a country's SPIDER hexagons and GLAES placements, combines them and
+    saves the result to inputs_geox/data.
+
+    With zonal_stats, the eligible area and estimated placements of each
+    hexagon are also added from the GLAES exclusion rasters. The placements
+    are then not needed, so they can be left out for scenario runs.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    dirname : string
+        Path to the top-level folder of the repository.
+    file_format : string
+        Format of the placements and output, from formats.FORMATS.
+    turbines : list
+        Extra turbine models or radii in meters placed in
+        prep_before_spider.py.
+    pv_separations : list
+        Extra PV separations placed in prep_before_spider.py.
+    zonal_stats : boolean
+        Whether to add the eligible area and estimated placements of each
+        hexagon. Default is False.
+    placements : boolean
+        Whether to count the GLAES placements in each hexagon. Default is
+        True.
+
+    Returns
+    -------
+    hexagons : geodataframe
+        Combined hexagons.
+    """
+    # Get paths
+    hex_path = os.path.join(dirname, "ccg-spider", "prep", f"{country_name_clean}_hex.geojson")
+    wind_path = os.path.join(dirname, "inputs_glaes", "processed", f"{country_name_clean}_turbine_placements.shp")
+    pv_path = os.path.join(dirname, "inputs_glaes", "processed", f"{country_name_clean}_pv_placements.shp")
+    wind_exclusions_path = os.path.join(dirname, "inputs_glaes", "processed", f"{country_name_clean}_wind_exclusions.tif")
+    pv_exclusions_path = os.path.join(dirname, "inputs_glaes", "processed", f"{country_name_clean}_pv_exclusions.tif")
+    save_path = get_combined_path(country_name_clean, dirname, file_format)
+
+    # Load all files and convert hex to the country's CRS
+    print(" - Loading files...")
+    if os.path.isfile(with_format(hex_path, file_format)):
+        hex_path = with_format(hex_path, file_format)
+    if not placements:
+        with stage('load', inputs=[hex_path]):
+            hexagons = read_vector(hex_path)
+    else:
+        wind_variant_paths = {variant: get_variant_path(wind_path, variant)
+                              for variant in get_turbine_variants(turbines)}
+        pv_variant_paths = {get_pv_variant(separation): get_variant_path(pv_path, get_pv_variant(separation))
+                            for separation in pv_separations}
+        with stage('load', inputs=[hex_path, wind_path, pv_path]):
+            hex = read_vector(hex_path)
+            wind_points = load_placements(wind_path, file_format)
+            pv_points = load_placements(pv_path, file_format)
+            wind_variants = {model: load_placements(path, file_format)
+                             for model, path in wind_variant_paths.items()}
+            pv_variants = {variant: load_placements(path, file_format)
+                           for variant, path in pv_variant_paths.items()}
+            hex.to_crs(get_coords(pv_points)[1], inplace=True)
+
+        with stage('combine_glaes_spider'):
+            hexagons = combine_glaes_spider(hex, wind_points, pv_points,
+                                            wind_variants, pv_variants)
+
+    if zonal_stats:
+        print(" - Adding eligible area from exclusion rasters...")
+        with stage('zonal_stats', inputs=[wind_exclusions_path, pv_exclusions_path]):
+            hexagons = add_zonal_stats(hexagons, wind_exclusions_path, pv_exclusions_path,
+                                       turbines, pv_separations)
+
+    with stage('update_hexagons'):
+        update_hexagons(hexagons, save_path)
+
+    return hexagons
+
+def get_combined_path(country_name_clean, dirname, file_format='geojson'):
+    """
+    Gets the path of a country's combined hexagons in inputs_geox/data.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    dirname : string
+        Path to the top-level folder of the repository.
+    file_format : string
+        One of formats.FORMATS.
+
+    Returns
+    -------
+    path : string
+        Path to the combined hexagons.
+    """
+    return with_format(os.path.join(dirname, "inputs_geox", "data", f"{country_name_clean}_hex_final.geojson"),
+                       file_format)
+
+def finalise_country(hexagons, world, country_name_clean, iso_code, dirname,
+                     file_format='geojson'):
+    """
+    Assigns the country name to a country's combined hexagons, removes those
+    of other countries and saves the result to inputs_geox/final_data.
+
+    ...
+    Parameters
+    ----------
+    hexagons : geodataframe
+        Combined hexagons, as made by combine_country().
+    world : Boundaries
+        World dataset, as loaded by boundaries.get_boundaries().
+    country_name_clean : string
+        Country name in a standardised format.
+    iso_code : string
+        ISO code of the country, used in the output file name.
+    dirname : string
+        Path to the top-level folder of the repository.
+    file_format : string
+        Format of the output, from formats.FORMATS.
+    """
+    # Step 2 - assigning country name to the hexagons
+    print("Assigning country name to hexagons...")
+    output_hexagon_path = with_format(f"inputs_geox/final_data/hex_final_{iso_code}.geojson", file_format)
+
+    with stage('assign_country'):
+        hexagons_with_country = assign_country(hexagons, world, country_name_clean)
+    print("Done! \n")
+
+    # Step 3 - finish off with removing duplicated hexagons
+    print("Removing duplicated hexagons...")
+    with stage('remove_extra_hexagons'):
+        final_hexagons = remove_extra_hexagons(hexagons_with_country, country_name_clean)
+        update_hexagons(final_hexagons, output_hexagon_path)
+        if file_format == 'parquet' and not final_hexagons.empty:
+            partition_path = os.path.join(dirname, "inputs_geox", "final_data", "hex_final")
+            with stage('save_partition', outputs=[partition_path]):
+                write_partition(final_hexagons, partition_path, iso_code)
+    print("Done! File saved")
+
 
 if __name__ == "__main__":
     # Parser set-up
@@ -168,10 +537,30 @@ if __name__ == "__main__":
                          help="<Required> Enter the country names you are preparing for.")
     parser.add_argument('-ic', '--isocodes', nargs='+', type=str,
                         help="<Required> Enter the ISO codes for the country names you are preparing for, respectively.")
+    parser.add_argument('--format', default='geojson', choices=FORMATS,
+                        help="<Optional> Enter 'parquet' to read GLAES placements and save hexagons as GeoParquet files. All countries are also saved to one dataset partitioned by ISO code in inputs_geox/final_data/hex_final. Default is 'geojson'.")
+    parser.add_argument('--turbines', nargs='+', default=[],
+                        help="<Optional> Enter the extra turbine models or radii placed with --turbines in prep_before_spider.py. Each is counted in a theo_turbines_[MODEL] or theo_turbines_[RADIUS]m column.")
+    parser.add_argument('--pv-separations', nargs='+', type=float, default=[],
+                        help="<Optional> Enter the extra PV separations placed with --pv-separations in prep_before_spider.py. Each is counted in a theo_pv_[SEPARATION]m column.")
+    parser.add_argument('--zonal-stats', action='store_true',
+                        help="<Optional> Use the flag to add the eligible area of each hexagon from the GLAES exclusion rasters, and the number of turbines and PV modules estimated to fit in it, in eligible_wind_km2, eligible_pv_km2, est_turbines and est_pv columns.")
+    parser.add_argument('--no-placements', action='store_true',
+                        help="<Optional> Use the flag if prep_before_spider.py was run with --no-placements. The placements are not counted, and --zonal-stats is used instead.")
+    parser.add_argument('--profile', type=str,
+                        help="<Optional> Enter a path ending in .json or .csv to save the time, CPU time, peak memory and file sizes of each stage to. Default will not profile stages.")
+    parser.add_argument('--cprofile', nargs='+', default=[],
+                        help="<Optional> Enter the stages to also run cProfile for, e.g. 'assign_country/sjoin_countries'. Dumps are saved to logs/profiles. Requires --profile.")
     args = parser.parse_args()
 
     if not args.isocodes:
         parser.error('Please enter the ISO codes. This will be used in naming the final file.')
+    if args.cprofile and not args.profile:
+        parser.error('Please enter a report path with --profile to use --cprofile.')
+    try:
+        get_turbine_variants(args.turbines)
+    except ValueError as error:
+        parser.error(str(error))
 
     # Define country name (used for naming files)
     country_names = args.countries
@@ -179,50 +568,38 @@ if __name__ == "__main__":
     # Get path to this file
     dirname = os.path.dirname(__file__)
 
+    if args.profile:
+        configure(cprofile_stages=args.cprofile,
+                  cprofile_path=os.path.join(dirname, "logs", "profiles"))
+
+    # Load the world dataset once for all countries
+    # May need to switch to higher res
+    world = get_boundaries(gpd.datasets.get_path('naturalearth_lowres'))
+
     # Counter to iterate through ISO codes
     iso_count=0
 
     # Loop through a list of country names
-    for country_name in country_names:
-        # Get country names without accents, spaces, apostrophes, or periods for loading files
-        country_name_clean = clean_country_name(country_name)
-
-        print(f"Combining GLAES and SPIDER data for {country_name_clean}:")
-
-        # Get paths
-        hex_path = os.path.join(dirname, "ccg-spider", "prep", f"{country_name_clean}_hex.geojson")
-        wind_path = os.path.join(dirname, "inputs_glaes", "processed", f"{country_name_clean}_turbine_placements.shp")
-        pv_path = os.path.join(dirname, "inputs_glaes", "processed", f"{country_name_clean}_pv_placements.shp")
-        save_path = os.path.join(dirname, "inputs_geox", "data", f"{country_name_clean}_hex_final.geojson")
-
-        # Step 1 - combining glaes and spider files
-        # Load all files and convert hex to the country's CRS
-        print(" - Loading files...")
-        hex = gpd.read_file(hex_path)
-        wind_points = gpd.read_file(wind_path)
-        pv_points = gpd.read_file(pv_path)
-        hex.to_crs(pv_points.crs, inplace=True)
-
-        hexagons = combine_glaes_spider(hex, wind_points, pv_points)
-
-        update_hexagons(hexagons, save_path)
-        print("Done! File saved \n")
-                 
-        # Step 2 - assigning country name to the hexagons
-        print("Assigning country name to hexagons...")
-        # May need to switch to higher res
-        world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
-        
-        output_hexagon_path = f"inputs_geox/final_data/hex_final_{args.isocodes[iso_count]}.geojson"
-        iso_count+=1
-
-        hexagons_with_country = assign_country(hexagons, world)
-        update_hexagons(hexagons_with_country, output_hexagon_path)
-        print("Done! File saved \n")
-
-
-        # Step 3 - finish off with removing duplicated hexagons
-        print("Removing duplicated hexagons...")
-        final_hexagons = remove_extra_hexagons(output_hexagon_path, country_name_clean)
-        update_hexagons(final_hexagons, output_hexagon_path)
-        print("Done! File saved")
+    try:
+        for country_name in country_names:
+            # Get country names without accents, spaces, apostrophes, or periods for loading files
+            country_name_clean = clean_country_name(country_name)
+            set_context(country=country_name_clean)
+
+            print(f"Combining GLAES and SPIDER data for {country_name_clean}:")
+
+            # Step 1 - combining glaes and spider files
+            hexagons = combine_country(country_name_clean, dirname, args.format,
+                                       args.turbines, args.pv_separations,
+                                       args.zonal_stats or args.no_placements,
+                                       not args.no_placements)
+            print("Done! File saved \n")
+
+            # Steps 2 and 3 - assigning country name and removing duplicated hexagons
+            finalise_country(hexagons, world, country_name_clean,
+                             args.isocodes[iso_count], dirname, args.format)
+            iso_count+=1
+    finally:
+        if args.profile:
+            write_report(args.profile)
+            print(f"Profiling report saved to {args.profile}")
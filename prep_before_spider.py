@@ -30,22 +30,62 @@ Lastly, this script tailors config files for each country in the
 It saves these files as "[Country Name]_config.yml" under ccg-spider/prep.
 """
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
 import geopandas as gpd
+import json
 import os
 import pandas as pd
 import pickle
-import rasterio
-from rasterio.mask import mask
 from shapely.geometry import mapping
-from unidecode import unidecode
+import sys
+import traceback
 import yaml
 
-import glaes.glaes as gl
-from utils import clean_country_name
+from boundaries import get_boundaries, get_boundary_tolerance, simplify_boundaries
+from clc import clip_clc, clip_clc_to_vrt, get_clc_path, warp_clc_to_glaes_grid
+from exclusions import (exclude_clc_classes, exclude_coast, get_base_exclusions,
+                        restore_base_exclusions)
+from formats import FORMATS, read_vector, with_format, write_vector
+from oceans import OceanProvider, save_coast_distance
+from osm import (OSM_FCLASSES, convert_osm_layer, get_simplify_tolerance,
+                 simplify_osm_layer)
+from placements import (PV_SEPARATION, TURBINES, distribute_variants,
+                        get_coords_path, get_pv_variant, get_turbine_variants,
+                        get_variant_path, save_placements)
+from profiling import (add_records, configure, get_records, get_settings,
+                       set_context, stage, write_report)
+from registries import clean_registry, split_registry, write_registry
+from spider_config import write_spider_config
+from stage_cache import StageManifest
+from task_graph import TaskGraph, get_file_dependencies
+from utils import clean_country_name, get_paths
+from zonal_stats import add_zonal_stats
+
+# Names of the preparation steps, in the order they are run
+STEPS = ['hydro', 'geothermal', 'boundaries', 'oceans', 'osm', 'clc',
+         'exclusions', 'config']
+
+# OSM layers converted for SPIDER, with the name used in the output files
+OSM_LAYERS = {
+    'gis_osm_water_a_free_1': 'waterbodies',
+    'gis_osm_roads_free_1': 'roads',
+    'gis_osm_waterways_free_1': 'waterways',
+}
+
+# Distance in meters the country is buffered by, to clip the oceans and OSM
+# layers to
+BUFFER_DISTANCE = 10000
+
+# GOAS providers for this process, keyed by path
+_ocean_providers = {}
 
 
 def calculating_exclusions(glaes_data_path, country_name, EPSG, 
-                           glaes_processed_path, turbine_radius):
+                           glaes_processed_path, turbine_radius,
+                           placement_format='geojson', turbine_variants=None,
+                           pv_separations=None, placements=True,
+                           pixel_size=100, output_suffix='', coast_buffer=250):
     """
     Calculating exclusions using GLAES.
 
@@ -63,46 +103,104 @@ def calculating_exclusions(glaes_data_path, country_name, EPSG,
         Path to the folder where some files will be saved.
     turbine_radius : integer
         Turbine radius in meters used for spacing.
+    placement_format : string
+        Format to also save placements in, from formats.FORMATS. Default is
+        'geojson', which only saves the Shapefiles.
+    turbine_variants : dictionary
+        Turbine radius in meters of each extra turbine model to place, keyed
+        by model name. Default is None.
+    pv_separations : list
+        Extra separations in meters to place PV modules with. Default is None.
+    placements : boolean
+        Whether to place turbines and PV modules. If False, only the
+        exclusion rasters are saved. Default is True.
+    pixel_size : float
+        Pixel size in meters of the exclusion calculator. Default is 100.
+    output_suffix : string
+        Text added to the exclusion raster file names, e.g. for previews.
+        Default is ''.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
     """
-    print(" - Initializing exclusion calculator...")
-    ec = gl.ExclusionCalculator(os.path.join(glaes_data_path, f'{country_name}.geojson'), srs=EPSG, pixelSize=100)
+    # GLAES is slow to import, so only load it when exclusions are run
+    import glaes.glaes as gl
 
-    print(" - Applying exclusions - coast...")
-    ec.excludeVectorType(os.path.join(glaes_data_path,  f'{country_name}_oceans.geojson'), buffer=250)
+    clc_path = get_clc_path(glaes_data_path, country_name)
+    grid_clc_path = os.path.join(glaes_data_path, f'{country_name}_CLC_glaes.tif')
+    if not os.path.isfile(grid_clc_path):
+        grid_clc_path = None
+    coast_distance_path = os.path.join(glaes_data_path, f'{country_name}_coast_distance.tif')
+    if not os.path.isfile(coast_distance_path):
+        coast_distance_path = None
 
-    print(" - Applying exclusions - herbaceous wetland...")
-    ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=90, prewarp=True)
+    print(" - Initializing exclusion calculator...")
+    with stage('initialize'):
+        ec = gl.ExclusionCalculator(os.path.join(glaes_data_path, f'{country_name}.geojson'), srs=EPSG, pixelSize=pixel_size)
 
-    print(" - Applying exclusions - built-up area...")
-    ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=50, prewarp=True)
+    print(" - Applying exclusions - coast...")
+    with stage('coast'):
+        exclude_coast(ec, os.path.join(glaes_data_path, f'{country_name}_oceans.geojson'),
+                      coast_buffer, coast_distance_path)
 
-    print(" - Applying exclusions - permanent water bodies...")
-    ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=80, prewarp=True)
+    print(" - Applying exclusions - herbaceous wetland, built-up area and permanent water bodies...")
+    with stage('land_cover'):
+        exclude_clc_classes(ec, clc_path, [90, 50, 80], grid_clc_path)
 
     print(" - Saving excluded areas for wind as .tif file...")
-    ec.save(os.path.join(glaes_processed_path,  f'{country_name}_wind_exclusions.tif'), overwrite=True)
-
-    print(" - Distributing turbines and saving placements as .shp...")
-    ec.distributeItems(separation=(turbine_radius * 10, turbine_radius * 5), axialDirection=45,
-                    output=os.path.join(glaes_processed_path, f'{country_name}_turbine_placements.shp'))
+    wind_exclusions_path = os.path.join(glaes_processed_path,  f'{country_name}_wind_exclusions{output_suffix}.tif')
+    with stage('save_wind_exclusions', outputs=[wind_exclusions_path]):
+        ec.save(wind_exclusions_path, overwrite=True)
+
+    if placements:
+        print(" - Distributing turbines and saving placements as .shp...")
+        turbine_path = os.path.join(glaes_processed_path, f'{country_name}_turbine_placements.shp')
+        with stage('distribute_turbines', outputs=[turbine_path]):
+            ec.distributeItems(separation=(turbine_radius * 10, turbine_radius * 5), axialDirection=45,
+                            output=turbine_path)
+        with stage('save_turbine_placements', outputs=[with_format(turbine_path, placement_format)]):
+            save_placements(ec, turbine_path, EPSG, placement_format)
+        distribute_variants(ec, turbine_path, EPSG, placement_format,
+                            {model: (radius * 10, radius * 5) for model, radius in (turbine_variants or {}).items()},
+                            axialDirection=45)
 
     print(" - Applying exclusions - agriculture...")
-    ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=40, prewarp=True)
+    with stage('agriculture'):
+        exclude_clc_classes(ec, clc_path, [40], grid_clc_path)
 
     print(" - Saving excluded areas for PV as .tif file...")
-    ec.save(os.path.join(glaes_processed_path, f'{country_name}_pv_exclusions.tif'), overwrite=True)
-
-    print(" - Distributing pv modules and saving placements as .shp...")
-    ec.distributeItems(separation=440, output=os.path.join(glaes_processed_path, f'{country_name}_pv_placements.shp'))
+    pv_exclusions_path = os.path.join(glaes_processed_path, f'{country_name}_pv_exclusions{output_suffix}.tif')
+    with stage('save_pv_exclusions', outputs=[pv_exclusions_path]):
+        ec.save(pv_exclusions_path, overwrite=True)
+
+    if placements:
+        print(" - Distributing pv modules and saving placements as .shp...")
+        pv_path = os.path.join(glaes_processed_path, f'{country_name}_pv_placements.shp')
+        with stage('distribute_pv', outputs=[pv_path]):
+            ec.distributeItems(separation=PV_SEPARATION, output=pv_path)
+        with stage('save_pv_placements', outputs=[with_format(pv_path, placement_format)]):
+            save_placements(ec, pv_path, EPSG, placement_format)
+        distribute_variants(ec, pv_path, EPSG, placement_format,
+                            {get_pv_variant(separation): separation for separation in (pv_separations or [])})
 
 def calculating_exclusions_slope_exclusion_included(glaes_data_path, 
                                                     slope_exclusion_output_path,
                                                     country_name, EPSG, 
                                                     glaes_processed_path,
-                                                    turbine_radius):
+                                                    turbine_radius,
+                                                    placement_format='geojson',
+                                                    turbine_variants=None,
+                                                    pv_separations=None,
+                                                    placements=True,
+                                                    pixel_size=100,
+                                                    output_suffix='',
+                                                    coast_buffer=250):
     """
     Calculating exclusions using GLAES, including slope exclusions.
 
+    The coast and land cover exclusions shared by solar and wind are applied
+    once, and each technology's slope and land cover exclusions are then
+    applied to a copy of them.
+
     ...
     Parameters
     ----------
@@ -119,72 +217,1066 @@ def calculating_exclusions_slope_exclusion_included(glaes_data_path,
         Path to the folder where some files will be saved.
     turbine_radius : integer
         Turbine radius in meters used for spacing.
+    placement_format : string
+        Format to also save placements in, from formats.FORMATS. Default is
+        'geojson', which only saves the Shapefiles.
+    turbine_variants : dictionary
+        Turbine radius in meters of each extra turbine model to place, keyed
+        by model name. Default is None.
+    pv_separations : list
+        Extra separations in meters to place PV modules with. Default is None.
+    placements : boolean
+        Whether to place turbines and PV modules. If False, only the
+        exclusion rasters are saved. Default is True.
+    pixel_size : float
+        Pixel size in meters of the exclusion calculator. Default is 100.
+    output_suffix : string
+        Text added to the exclusion raster file names, e.g. for previews.
+        Default is ''.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
     """
-    for gen in ("solar", "wind"):
-        print(f" - Initializing exclusion calculator for {gen}...")
-        ec = gl.ExclusionCalculator(os.path.join(glaes_data_path,  f'{country_name}.geojson'), srs=EPSG, pixelSize=100)
+    # GLAES is slow to import, so only load it when exclusions are run
+    import glaes.glaes as gl
+
+    clc_path = get_clc_path(glaes_data_path, country_name)
+    grid_clc_path = os.path.join(glaes_data_path, f'{country_name}_CLC_glaes.tif')
+    if not os.path.isfile(grid_clc_path):
+        grid_clc_path = None
+    coast_distance_path = os.path.join(glaes_data_path, f'{country_name}_coast_distance.tif')
+    if not os.path.isfile(coast_distance_path):
+        coast_distance_path = None
+
+    def make_base_calculator():
+        print(" - Initializing exclusion calculator...")
+        with stage('initialize'):
+            ec = gl.ExclusionCalculator(os.path.join(glaes_data_path,  f'{country_name}.geojson'), srs=EPSG, pixelSize=pixel_size)
 
         print(" - Applying exclusions - coast...")
-        ec.excludeVectorType(os.path.join(glaes_data_path,  f'{country_name}_oceans.geojson'), buffer=250)
+        with stage('coast'):
+            exclude_coast(ec, os.path.join(glaes_data_path, f'{country_name}_oceans.geojson'),
+                          coast_buffer, coast_distance_path)
 
-        print(" - Applying exclusions - herbaceous wetland...")
-        ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=90, prewarp=True)
+        print(" - Applying exclusions - herbaceous wetland, built-up area and permanent water bodies...")
+        with stage('land_cover'):
+            exclude_clc_classes(ec, clc_path, [90, 50, 80], grid_clc_path)
+
+        return ec
+
+    # Keep the exclusions shared by solar and wind, so each technology can
+    # start from them without recalculating
+    ec = make_base_calculator()
+    base_availability = get_base_exclusions(ec)
+
+    for index, gen in enumerate(("solar", "wind")):
+        print(f" - Applying {gen} exclusions to the shared base exclusions...")
+        if index > 0:
+            ec = restore_base_exclusions(ec, base_availability, make_base_calculator)
 
-        print(" - Applying exclusions - built-up area...")
-        ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=50, prewarp=True)
-        
-        print(" - Applying exclusions - permanent water bodies...")
-        ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=80, prewarp=True)
         if gen == "wind":
             print(" - Applying exclusions - slope")
-            ec.excludeRasterType(os.path.join(slope_exclusion_output_path, f'{country_name}_slope_excluded_wind.tif'), value=1, prewarp=True)
+            with stage('wind_slope'):
+                ec.excludeRasterType(os.path.join(slope_exclusion_output_path, f'{country_name}_slope_excluded_wind.tif'), value=1, prewarp=True)
             
             print(" - Saving excluded areas for wind as .tif file...")
-            ec.save(os.path.join(glaes_processed_path,  f'{country_name}_wind_exclusions.tif'), overwrite=True)
+            wind_exclusions_path = os.path.join(glaes_processed_path,  f'{country_name}_wind_exclusions{output_suffix}.tif')
+            with stage('save_wind_exclusions', outputs=[wind_exclusions_path]):
+                ec.save(wind_exclusions_path, overwrite=True)
         
-            print(" - Distributing turbines and saving placements as .shp...")
-            ec.distributeItems(separation=(turbine_radius * 10, turbine_radius * 5), axialDirection=45,
-                            output=os.path.join(glaes_processed_path, f'{country_name}_turbine_placements.shp'))
+            if placements:
+                print(" - Distributing turbines and saving placements as .shp...")
+                turbine_path = os.path.join(glaes_processed_path, f'{country_name}_turbine_placements.shp')
+                with stage('distribute_turbines', outputs=[turbine_path]):
+                    ec.distributeItems(separation=(turbine_radius * 10, turbine_radius * 5), axialDirection=45,
+                                    output=turbine_path)
+                with stage('save_turbine_placements', outputs=[with_format(turbine_path, placement_format)]):
+                    save_placements(ec, turbine_path, EPSG, placement_format)
+                distribute_variants(ec, turbine_path, EPSG, placement_format,
+                                    {model: (radius * 10, radius * 5) for model, radius in (turbine_variants or {}).items()},
+                                    axialDirection=45)
         if gen == "solar":
             print(" - Applying exclusions - slope")
-            ec.excludeRasterType(os.path.join(slope_exclusion_output_path, f'{country_name}_slope_excluded_pv.tif'), value=1, prewarp=True)
+            with stage('pv_slope'):
+                ec.excludeRasterType(os.path.join(slope_exclusion_output_path, f'{country_name}_slope_excluded_pv.tif'), value=1, prewarp=True)
             
             print(" - Applying exclusions - agriculture...")
-            ec.excludeRasterType(os.path.join(glaes_data_path, f'{country_name}_CLC.tif'), value=40, prewarp=True)
+            with stage('agriculture'):
+                exclude_clc_classes(ec, clc_path, [40], grid_clc_path)
             
             print(" - Saving excluded areas for PV as .tif file...")
-            ec.save(os.path.join(glaes_processed_path, f'{country_name}_pv_exclusions.tif'), overwrite=True)
+            pv_exclusions_path = os.path.join(glaes_processed_path, f'{country_name}_pv_exclusions{output_suffix}.tif')
+            with stage('save_pv_exclusions', outputs=[pv_exclusions_path]):
+                ec.save(pv_exclusions_path, overwrite=True)
             
-            print(" - Distributing pv modules and saving placements as .shp...")
-            ec.distributeItems(separation=440, output=os.path.join(glaes_processed_path, f'{country_name}_pv_placements.shp'))
+            if placements:
+                print(" - Distributing pv modules and saving placements as .shp...")
+                pv_path = os.path.join(glaes_processed_path, f'{country_name}_pv_placements.shp')
+                with stage('distribute_pv', outputs=[pv_path]):
+                    ec.distributeItems(separation=PV_SEPARATION, output=pv_path)
+                with stage('save_pv_placements', outputs=[with_format(pv_path, placement_format)]):
+                    save_placements(ec, pv_path, EPSG, placement_format)
+                distribute_variants(ec, pv_path, EPSG, placement_format,
+                                    {get_pv_variant(separation): separation for separation in (pv_separations or [])})
+
+def get_ocean_provider(ocean_path):
+    """
+    Gets the GOAS provider for this process, creating it on first use.
+
+    The provider reads ocean features by bounding box and keeps them for the
+    rest of the run, so each process only reads each feature once.
+
+    ...
+    Parameters
+    ----------
+    ocean_path : string
+        Path to the GOAS GeoPackage file.
+
+    Returns
+    -------
+    ocean_provider : OceanProvider
+        Ocean provider for this process.
+    """
+    if ocean_path not in _ocean_providers:
+        _ocean_providers[ocean_path] = OceanProvider(ocean_path)
+
+    return _ocean_providers[ocean_path]
+
+def prepare_hydro(country_name_clean, paths):
+    """
+    Creates the hydropower GeoPackage file for SPIDER and Geo-X.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    """
+    print(f"Creating hydropower geopackage file for {country_name_clean}...")
+    input_path = os.path.join(paths['data'], f"{country_name_clean}_hydropower_plants.csv") 
+
+    # Read data from CSV, keeping existing plants with coordinates
+    gdf = clean_registry(pd.read_csv(input_path), 'hydro')
+    print(f"Number of missing 'head' values: {gdf['head'].isna().sum()}")
+
+    # Export GeoPackage
+    write_registry(gdf, 'hydro', country_name_clean, paths)
+
+    print(f"GeoPackage file successfully created for {country_name_clean}\n")
+
+def prepare_geothermal(country_name_clean, paths):
+    """
+    Creates the geothermal GeoPackage file for SPIDER and Geo-X.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    """
+    print(f"Creating geothermal geopackage file for {country_name_clean}...")
+    input_path = os.path.join(paths['data'], f"{country_name_clean}_geothermal_plants.csv") 
+    
+    # Read data from CSV, keeping plants with coordinates and capacity
+    gdf = clean_registry(pd.read_csv(input_path), 'geothermal')
+
+    # Export GeoPackage
+    write_registry(gdf, 'geothermal', country_name_clean, paths)
+
+    print(f"GeoPackage file successfully created for {country_name_clean}\n")
+
+def get_utm_epsg(country):
+    """
+    Gets the EPSG code of the UTM zone of a country, based on its
+    representative point.
+
+    ...
+    Parameters
+    ----------
+    country : geodataframe
+        Country boundaries in EPSG 4326.
+
+    Returns
+    -------
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    """
+    representative_point = country.representative_point().iloc[0]
+    latitude, longitude = representative_point.y, representative_point.x
 
-def replace_country(node, country_name):
+    return int(32700 - round((45 + latitude) / 90, 0) * 100 + round((183 + longitude) / 6, 0))
+
+def prepare_boundaries(country_name_clean, country, EPSG, paths,
+                       boundary_simplify=None):
     """
-    Recursively replaces "Country" with the country name provided.
+    Saves the country boundaries, its buffer and its UTM EPSG code for GLAES
+    and SPIDER.
+
+    SPIDER always gets the full boundaries. If boundary_simplify is given,
+    GLAES and the land cover clip get boundaries simplified to the GLAES
+    pixel size, and the buffer is made from boundaries simplified to a tenth
+    of its distance, as it only needs to cover the country. The change in
+    area is saved to logs/[COUNTRY]_boundary_simplify.json.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    country : geodataframe
+        Country boundaries in EPSG 4326.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    boundary_simplify : float
+        Simplification tolerance as a share of the GLAES pixel size. Default
+        is None, which keeps the full boundaries.
+    """
+    glaes_data_path = paths['glaes_data']
+
+    with open(os.path.join(glaes_data_path, f'{country_name_clean}_EPSG.pkl'), 'wb') as file:
+        pickle.dump(EPSG, file)
+
+    # Reproject country to UTM zone
+    country_utm = country.to_crs(epsg=EPSG)
+    country_region, buffer_source = country_utm, country_utm
+    if boundary_simplify is not None:
+        with stage('simplify'):
+            country_region, region_report = simplify_boundaries(
+                country_utm, get_boundary_tolerance(factor=boundary_simplify))
+            # Any change up to the tolerance is covered by the buffer itself
+            buffer_source, buffer_report = simplify_boundaries(
+                country_utm, BUFFER_DISTANCE / 10, max_area_change=1)
+
+        os.makedirs(paths['logs'], exist_ok=True)
+        report_path = os.path.join(paths['logs'], f'{country_name_clean}_boundary_simplify.json')
+        with open(report_path, 'w', encoding='utf-8') as file:
+            json.dump({'region': region_report, 'buffer': buffer_report}, file, indent=2)
+        if region_report['simplified']:
+            print(f" - Simplified boundaries from {region_report['vertices']} to "
+                  f"{region_report['simplified_vertices']} vertices, changing "
+                  f"{region_report['changed_area_km2']:.1f} km2 "
+                  f"({region_report['changed_area_share']:.3%} of the area)")
+        else:
+            print(f" ! Simplifying boundaries would change {region_report['changed_area_share']:.2%} "
+                  "of the area, so the full boundaries are used")
+
+    country_utm_path = os.path.join(glaes_data_path, f'{country_name_clean}.geojson')
+    with stage('save_country', outputs=[country_utm_path]):
+        country_region.to_file(country_utm_path, driver='GeoJSON', encoding='utf-8')
+
+    # Buffer the "country" polygon by 10 km to create a buffer zone
+    country_buffer = buffer_source['geometry'].buffer(BUFFER_DISTANCE).make_valid()
+    country_buffer_path = os.path.join(glaes_data_path, f'{country_name_clean}_buff.geojson')
+    with stage('save_buffer', outputs=[country_buffer_path]):
+        country_buffer.to_file(country_buffer_path, driver='GeoJSON', encoding='utf-8')
+
+    # Convert country back to EPSG 4326 and save this version for SPIDER as well
+    country_gpkg_path = os.path.join(paths['spider_prep_data'], f'{country_name_clean}.gpkg')
+    with stage('save_spider_country', outputs=[country_gpkg_path]):
+        country_utm.to_crs(epsg=4326).to_file(country_gpkg_path, driver='GPKG', encoding='utf-8')
+
+def prepare_oceans(country_name_clean, paths, EPSG=None):
+    """
+    Clips GOAS to the buffered country and saves it for GLAES and SPIDER.
+
+    If the EPSG code is given, the distance from each pixel of the GLAES grid
+    to the oceans is saved as well, so that GLAES can exclude the coast
+    without buffering the ocean polygons.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    EPSG : integer
+        EPSG code of the country's UTM zone. Default is None, which does not
+        save the distances.
+    """
+    country_buffer = gpd.read_file(os.path.join(paths['glaes_data'], f'{country_name_clean}_buff.geojson'))
+
+    # Clip GOAS to the buffered country, reading only nearby features
+    country_buffer = country_buffer.to_crs(epsg=4326)
+    with stage('clip'):
+        GOAS_country = get_ocean_provider(paths['ocean']).clip(country_buffer)
+    GOAS_country['geometry'].make_valid()
+    # Reconvert to country CRS? Check it makes no difference in distance outputs. GLAES seems happy with 4326.
+    glaes_oceans_path = os.path.join(paths['glaes_data'], f'{country_name_clean}_oceans.geojson')
+    with stage('save_glaes_oceans', outputs=[glaes_oceans_path]):
+        GOAS_country.to_file(glaes_oceans_path, driver='GeoJSON', encoding='utf-8')
+
+    # Calculating spider data files
+    # Save oceans to gpkg for spider
+    spider_oceans_path = os.path.join(paths['spider_prep_data'], f'{country_name_clean}_oceans.gpkg')
+    with stage('save_spider_oceans', outputs=[spider_oceans_path]):
+        GOAS_country.to_file(spider_oceans_path, driver='GPKG', encoding='utf-8')
+
+    if EPSG is not None:
+        country_utm = gpd.read_file(os.path.join(paths['glaes_data'], f'{country_name_clean}.geojson'))
+        coast_distance_path = os.path.join(paths['glaes_data'], f'{country_name_clean}_coast_distance.tif')
+        with stage('coast_distance', outputs=[coast_distance_path]):
+            save_coast_distance(GOAS_country, coast_distance_path, country_utm.total_bounds,
+                                EPSG, max_distance=BUFFER_DISTANCE)
+
+def prepare_osm(country_name_clean, paths, osm_clip=False, EPSG=None,
+                osm_simplify=None):
+    """
+    Saves the OSM layers as GeoPackages for SPIDER, keeping only the columns
+    SPIDER needs.
+
+    If simplifying, each layer is filtered by class, merged and simplified
+    with osm.simplify_osm_layer(), and the vertex reduction and distance error
+    of each layer are saved to logs/[COUNTRY]_osm_simplify.json.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    osm_clip : boolean
+        Whether to drop features outside the buffered country.
+    EPSG : integer
+        EPSG code of the country's UTM zone, used when simplifying. Default
+        is None.
+    osm_simplify : dictionary
+        Simplification 'tolerance' in meters and the 'fclasses' to keep for
+        each layer, as made by get_osm_simplify(). Default is None, which
+        keeps the layers as they are.
+    """
+    spider_prep_data_path = paths['spider_prep_data']
+
+    mask = None
+    if osm_clip:
+        mask = gpd.read_file(os.path.join(paths['glaes_data'], f'{country_name_clean}_buff.geojson')).geometry
+
+    # Save OSM layers in 4236 gpkgs for spider
+    OSM_country_path = os.path.join(paths['OSM'], f"{country_name_clean}")
+    reports = {}
+
+    for layer, name in OSM_LAYERS.items():
+        input_path = os.path.join(OSM_country_path, f'{layer}.shp')
+        output_path = os.path.join(spider_prep_data_path, f'{country_name_clean}_{name}.gpkg')
+        if osm_simplify is None:
+            with stage(name, inputs=[input_path], outputs=[output_path]):
+                count = convert_osm_layer(input_path, output_path, mask=mask)
+            print(f" - Saved {count} OSM {name} features")
+            continue
+
+        full_path = os.path.join(spider_prep_data_path, f'{country_name_clean}_{name}_full.gpkg')
+        with stage(name, inputs=[input_path], outputs=[full_path]):
+            convert_osm_layer(input_path, full_path, mask=mask)
+        with stage(f'simplify_{name}', inputs=[full_path], outputs=[output_path]):
+            reports[name] = simplify_osm_layer(full_path, output_path, EPSG,
+                                               osm_simplify['tolerance'],
+                                               osm_simplify['fclasses'].get(name))
+        os.remove(full_path)
+
+        report = reports[name]
+        print(f" - Kept {report['vertices_kept']} of {report['vertices_before']} OSM {name} "
+              f"vertices in the kept classes")
+        print(f" - Saved {report['features_after']} OSM {name} features with "
+              f"{report['vertices_after']} of {report['vertices_kept']} vertices, "
+              f"changing distances by up to {report['max_distance_error_m']:.0f} m")
+
+    if osm_simplify is not None:
+        os.makedirs(paths['logs'], exist_ok=True)
+        report_path = os.path.join(paths['logs'], f'{country_name_clean}_osm_simplify.json')
+        with open(report_path, 'w', encoding='utf-8') as file:
+            json.dump(dict(osm_simplify, layers=reports), file, indent=2)
+
+def get_osm_simplify(hex_res, factor=0.01, fclasses=()):
+    """
+    Gets the settings for simplifying the OSM layers.
+
+    ...
+    Parameters
+    ----------
+    hex_res : integer
+        H3 resolution of the SPIDER hexagons, from the SPIDER config.
+    factor : float
+        Simplification tolerance as a share of the hexagon edge length.
+    fclasses : list
+        Changes to the OSM classes kept, as strings such as
+        "roads=primary,secondary", or "waterbodies=all" to keep all classes.
+
+    Returns
+    -------
+    osm_simplify : dictionary
+        Simplification 'tolerance' in meters, and the 'fclasses' to keep for
+        each layer.
+    """
+    layer_fclasses = dict(OSM_FCLASSES)
+    for change in fclasses:
+        name, _, classes = change.partition('=')
+        if name not in layer_fclasses or not classes:
+            raise ValueError(f"Cannot read OSM classes '{change}'. Use e.g. "
+                             f"'roads=primary,secondary' with a layer from {list(layer_fclasses)}.")
+        layer_fclasses[name] = None if classes == 'all' else classes.split(',')
+
+    return {'tolerance': get_simplify_tolerance(hex_res, factor),
+            'fclasses': layer_fclasses}
+
+def prepare_clc(country_name_clean, EPSG, paths, clc_max_memory_mb=512,
+                clc_vrt=False):
+    """
+    Clips the CLC raster to the country and warps it onto the GLAES grid.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    clc_max_memory_mb : integer
+        Approximate memory limit in megabytes for clipping the CLC raster.
+    clc_vrt : boolean
+        Whether to save the clipped CLC raster as a VRT with a cutline instead
+        of a GeoTIFF.
+    """
+    glaes_data_path = paths['glaes_data']
+    # Clip to the same boundaries GLAES uses, which may be simplified
+    country_utm_path = os.path.join(glaes_data_path, f'{country_name_clean}.geojson')
+    country_utm = gpd.read_file(country_utm_path)
+
+    # Clip the CLC raster to the country
+    if clc_vrt:
+        # Point to the global raster with a cutline instead of copying pixels,
+        # removing any GeoTIFF from an earlier run so the VRT is used
+        clc_tif_path = os.path.join(glaes_data_path, f'{country_name_clean}_CLC.tif')
+        if os.path.isfile(clc_tif_path):
+            os.remove(clc_tif_path)
+        clc_vrt_path = os.path.join(glaes_data_path, f'{country_name_clean}_CLC.vrt')
+        with stage('clip', outputs=[clc_vrt_path]):
+            clip_clc_to_vrt(paths['clc_raster'], country_utm_path, clc_vrt_path)
+    else:
+        country = country_utm.to_crs(epsg=4326)
+        clc_tif_path = os.path.join(glaes_data_path, f'{country_name_clean}_CLC.tif')
+        with stage('clip', outputs=[clc_tif_path]):
+            clip_clc(paths['clc_raster'], list(country.geometry.apply(mapping)),
+                     clc_tif_path, max_memory_mb=clc_max_memory_mb)
+
+    # Warp the clipped CLC onto the GLAES grid once, so exclusions don't have to
+    grid_clc_path = os.path.join(glaes_data_path, f'{country_name_clean}_CLC_glaes.tif')
+    with stage('warp', outputs=[grid_clc_path]):
+        warp_clc_to_glaes_grid(get_clc_path(glaes_data_path, country_name_clean),
+                               grid_clc_path, country_utm.total_bounds, EPSG)
+
+def run_glaes(country_name, country_name_clean, paths, turbine_radius,
+              slope_exclusion=False, placement_format='geojson',
+              tile_size=None, tile_overlap=5000, glaes_workers=1,
+              turbine_variants=None, pv_separations=None, placements=True,
+              coast_buffer=250):
+    """
+    Calculates land exclusions and placements using GLAES.
 
     ...
     Parameters
     ----------
-    node : dictionary
-        File contents that need to have "Country" replaced with the country
-        name provided.
     country_name : string
-        Name of country to be used as replacement.
+        Name of country as given by the user.
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    turbine_radius : integer
+        Turbine radius in meters used for spacing.
+    slope_exclusion : boolean
+        Whether to include the Slope-Exclusion outputs in GLAES.
+    placement_format : string
+        Format to also save placements in, from formats.FORMATS.
+    tile_size : float
+        Width and height in meters of the tiles to split the country into.
+        Default is None, which runs GLAES on the whole country at once.
+    tile_overlap : float
+        Distance in meters that each tile extends past its neighbours.
+    glaes_workers : integer
+        Number of tiles to run at the same time in separate processes.
+    turbine_variants : dictionary
+        Turbine radius in meters of each extra turbine model to place, keyed
+        by model name. Not used with tiles.
+    pv_separations : list
+        Extra separations in meters to place PV modules with. Not used with
+        tiles.
+    placements : boolean
+        Whether to place turbines and PV modules, or only save the exclusion
+        rasters. Not used with tiles.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
+    """
+    glaes_data_path = paths['glaes_data']
+
+    print(f"Calculating land exclusions for {country_name_clean}...")
+
+    # Load the pickled EPSG code for the country
+    with open(os.path.join(glaes_data_path, f'{country_name_clean}_EPSG.pkl'), 'rb') as file:
+        EPSG = pickle.load(file)
+
+    # Chooses slope-exclusion function based on user input
+    if tile_size is not None:
+        from tiled_glaes import calculating_exclusions_tiled
+
+        wind_slope_path, pv_slope_path = None, None
+        if slope_exclusion:
+            wind_slope_path = os.path.join(paths['slope_exclusion_output'], f'{country_name}_slope_excluded_wind.tif')
+            pv_slope_path = os.path.join(paths['slope_exclusion_output'], f'{country_name}_slope_excluded_pv.tif')
+        calculating_exclusions_tiled(glaes_data_path, country_name_clean, EPSG,
+                                     paths['glaes_processed'], turbine_radius,
+                                     placement_format, tile_size, tile_overlap,
+                                     glaes_workers, wind_slope_path, pv_slope_path,
+                                     coast_buffer)
+    elif slope_exclusion:
+        calculating_exclusions_slope_exclusion_included(glaes_data_path, 
+                                                paths['slope_exclusion_output'],
+                                                country_name, EPSG, 
+                                                paths['glaes_processed'],
+                                                turbine_radius, placement_format,
+                                                turbine_variants, pv_separations,
+                                                placements, coast_buffer=coast_buffer)
+    else:
+        calculating_exclusions(glaes_data_path, country_name_clean, EPSG, 
+                               paths['glaes_processed'], turbine_radius,
+                               placement_format, turbine_variants,
+                               pv_separations, placements,
+                               coast_buffer=coast_buffer)
+    print("Finished calulcating land exclusions\n")
+
+def get_preview_suffix(pixel_size):
+    """
+    Gets the text added to the names of preview files, e.g.
+    "_preview_1000m".
+
+    ...
+    Parameters
+    ----------
+    pixel_size : float
+        Pixel size of the preview in meters.
 
     Returns
     -------
-    node : dictionary
-        File contents with the correct country name used.
-    """
-    if isinstance(node, dict):
-        return {key: replace_country(value, country_name) for key, value in node.items()}
-    elif isinstance(node, list):
-        return [replace_country(item, country_name) for item in node]
-    elif isinstance(node, str):
-        return unidecode(node).replace("Country", country_name)
+    suffix : string
+        Text to add to file names.
+    """
+    return f"_preview_{pixel_size:g}m"
+
+def run_preview(country_name, country_name_clean, paths, pixel_size=1000,
+                slope_exclusion=False, coast_buffer=250):
+    """
+    Runs the GLAES exclusions at a coarse pixel size, to check a country's
+    inputs quickly, and estimates turbine and PV counts from the eligible
+    area instead of placing them.
+
+    The exclusion rasters are saved to inputs_glaes/preview. If the SPIDER
+    hexagons exist, the eligible area and estimated counts of each hexagon
+    are saved to inputs_geox/preview. All preview files have "_preview_" and
+    the pixel size in their names.
+
+    ...
+    Parameters
+    ----------
+    country_name : string
+        Name of country as given by the user.
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    pixel_size : float
+        Pixel size in meters. Default is 1000.
+    slope_exclusion : boolean
+        Whether to include the Slope-Exclusion outputs in GLAES.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
+    """
+    glaes_data_path = paths['glaes_data']
+    suffix = get_preview_suffix(pixel_size)
+    os.makedirs(paths['glaes_preview'], exist_ok=True)
+
+    print(f"Previewing land exclusions for {country_name_clean} at {pixel_size:g} m...")
+    with open(os.path.join(glaes_data_path, f'{country_name_clean}_EPSG.pkl'), 'rb') as file:
+        EPSG = pickle.load(file)
+
+    # The slope-exclusion outputs are named with the country name as given
+    name = country_name if slope_exclusion else country_name_clean
+    if slope_exclusion:
+        calculating_exclusions_slope_exclusion_included(glaes_data_path,
+                                                        paths['slope_exclusion_output'],
+                                                        name, EPSG, paths['glaes_preview'],
+                                                        TURBINES['NREL_4MW'], placements=False,
+                                                        pixel_size=pixel_size,
+                                                        output_suffix=suffix,
+                                                        coast_buffer=coast_buffer)
     else:
-        return node
-        
+        calculating_exclusions(glaes_data_path, name, EPSG, paths['glaes_preview'],
+                               TURBINES['NREL_4MW'], placements=False,
+                               pixel_size=pixel_size, output_suffix=suffix,
+                               coast_buffer=coast_buffer)
+
+    wind_path = os.path.join(paths['glaes_preview'], f'{name}_wind_exclusions{suffix}.tif')
+    pv_path = os.path.join(paths['glaes_preview'], f'{name}_pv_exclusions{suffix}.tif')
+
+    # Summarise the whole country, then each hexagon if SPIDER has been run
+    with stage('preview_estimates'):
+        country = gpd.read_file(os.path.join(glaes_data_path, f'{country_name_clean}.geojson'))
+        totals = add_zonal_stats(country.dissolve(), wind_path, pv_path).iloc[0]
+        print(f" - Eligible area: {totals['eligible_wind_km2']:.0f} km2 for wind and "
+              f"{totals['eligible_pv_km2']:.0f} km2 for PV")
+        print(f" - Estimated {totals['est_turbines']:.0f} turbines and "
+              f"{totals['est_pv']:.0f} PV modules")
+
+        hex_path = os.path.join(paths['spider_prep'], f"{country_name_clean}_hex.geojson")
+        if os.path.isfile(hex_path):
+            os.makedirs(paths['geox_preview'], exist_ok=True)
+            output_path = os.path.join(paths['geox_preview'], f"{country_name_clean}_hex{suffix}.geojson")
+            write_vector(add_zonal_stats(read_vector(hex_path), wind_path, pv_path), output_path)
+            print(f" - Saved hexagon estimates to {output_path}")
+    print("Finished previewing land exclusions\n")
+
+def prepare_country(country_name, country, paths, config_data, turbine_radius,
+                    hydro=False, geothermal=False, slope_exclusion=False,
+                    clc_max_memory_mb=512, clc_vrt=False, osm_clip=False,
+                    osm_simplify=None, boundary_simplify=None,
+                    placement_format='geojson', tile_size=None,
+                    tile_overlap=5000, glaes_workers=1, turbine_variants=None,
+                    pv_separations=None, placements=True, coast_buffer=250,
+                    registries=None, steps=STEPS, force=(), step_workers=1, dry_run=False,
+                    preview=None):
+    """
+    Runs all preparation steps for one country.
+
+    Each step is recorded in a manifest in the manifests folder, and is
+    skipped if its inputs, parameters and outputs are unchanged since it was
+    last run. Steps are run as a task graph, where each step depends on the
+    steps that write its input files, so with several step workers
+    independent steps run at the same time.
+
+    ...
+    Parameters
+    ----------
+    country_name : string
+        Name of country as given by the user.
+    country : geodataframe
+        Country boundaries from the Natural Earth dataset.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    config_data : dictionary
+        Contents of the template SPIDER config file.
+    turbine_radius : integer
+        Turbine radius in meters used for spacing.
+    hydro : boolean
+        Whether to prepare hydropower data.
+    geothermal : boolean
+        Whether to prepare geothermal data.
+    slope_exclusion : boolean
+        Whether to include the Slope-Exclusion outputs in GLAES.
+    clc_max_memory_mb : integer
+        Approximate memory limit in megabytes for clipping the CLC raster.
+    clc_vrt : boolean
+        Whether to save the clipped CLC raster as a VRT with a cutline instead
+        of a GeoTIFF.
+    osm_clip : boolean
+        Whether to drop OSM features outside the buffered country.
+    osm_simplify : dictionary
+        Settings for simplifying the OSM layers, as made by
+        get_osm_simplify(). Default is None, which keeps them as they are.
+    boundary_simplify : float
+        Tolerance for simplifying the boundaries used by GLAES, as a share of
+        the GLAES pixel size. Default is None, which keeps them as they are.
+    placement_format : string
+        Format to also save placements in, from formats.FORMATS.
+    tile_size : float
+        Width and height in meters of the tiles to split the country into for
+        GLAES. Default is None, which does not split the country.
+    tile_overlap : float
+        Distance in meters that each GLAES tile extends past its neighbours.
+    glaes_workers : integer
+        Number of GLAES tiles to run at the same time in separate processes.
+    turbine_variants : dictionary
+        Turbine radius in meters of each extra turbine model to place, keyed
+        by model name. Default is None.
+    pv_separations : list
+        Extra separations in meters to place PV modules with. Default is None.
+    placements : boolean
+        Whether to place turbines and PV modules, or only save the exclusion
+        rasters. Default is True.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
+    registries : dictionary
+        Names in a standardised format of the countries given a GeoPackage
+        from a global registry with registries.split_registry(), keyed by
+        the kind of plant data, 'hydro' or 'geothermal'. The per-country
+        steps of these kinds are skipped, and their data is only added to the
+        SPIDER config of the countries given a GeoPackage. Default is None.
+    steps : list
+        Names of the steps to run, from STEPS. Default is all steps.
+    force : list
+        Names of steps to run even if they are up to date, from STEPS or
+        "all".
+    step_workers : integer
+        Number of steps to run at the same time in threads. Default is 1,
+        which runs steps one after another.
+    dry_run : boolean
+        Whether to only print the planned steps and their dependencies.
+        Default is False.
+    preview : float
+        Pixel size in meters to preview the exclusions at with run_preview().
+        Only the steps GLAES needs are run before it. Default is None, which
+        runs the full exclusions.
+    """
+    country_name_clean = clean_country_name(country_name)
+    set_context(country=country_name_clean)
+    # Countries without plants in a global registry have no GeoPackage
+    registries = registries or {}
+    if 'hydro' in registries:
+        hydro = country_name_clean in registries['hydro']
+    if 'geothermal' in registries:
+        geothermal = country_name_clean in registries['geothermal']
+    manifest = StageManifest(os.path.join(paths['manifests'], f'{country_name_clean}.json'), force)
+    step_files = get_step_files(country_name, paths, slope_exclusion, placement_format,
+                                turbine_variants, pv_separations, placements,
+                                preview, clc_vrt)
+
+    # Caculating glaes data files
+    # Calculate UTM zone based on representative point of country
+    EPSG = get_utm_epsg(country)
+
+    # Function and parameters of each step
+    step_runs = {
+        # Optional prep step - creating hydropower geopackage file
+        'hydro': (lambda: prepare_hydro(country_name_clean, paths), {}),
+        # Optional prep step - creating geothermal geopackage file
+        'geothermal': (lambda: prepare_geothermal(country_name_clean, paths), {}),
+        # Step 1 - preparing files for glaes and spider
+        'boundaries': (lambda: prepare_boundaries(country_name_clean, country, EPSG, paths,
+                                                  boundary_simplify),
+                       {'EPSG': EPSG, 'boundary_simplify': boundary_simplify}),
+        'oceans': (lambda: prepare_oceans(country_name_clean, paths, EPSG), {'EPSG': EPSG}),
+        'osm': (lambda: prepare_osm(country_name_clean, paths, osm_clip, EPSG,
+                                    osm_simplify),
+                {'osm_clip': osm_clip, 'osm_simplify': osm_simplify}),
+        'clc': (lambda: prepare_clc(country_name_clean, EPSG, paths, clc_max_memory_mb,
+                                    clc_vrt),
+                {'EPSG': EPSG, 'clc_vrt': clc_vrt}),
+        # Step 2 - running glaes
+        'exclusions': (lambda: run_glaes(country_name, country_name_clean, paths,
+                                         turbine_radius, slope_exclusion,
+                                         placement_format, tile_size, tile_overlap,
+                                         glaes_workers, turbine_variants,
+                                         pv_separations, placements, coast_buffer),
+                       {'EPSG': EPSG, 'turbine_radius': turbine_radius,
+                        'slope_exclusion': slope_exclusion,
+                        'placement_format': placement_format,
+                        'tile_size': tile_size, 'tile_overlap': tile_overlap,
+                        'turbine_variants': turbine_variants,
+                        'pv_separations': pv_separations,
+                        'placements': placements,
+                        'coast_buffer': coast_buffer}),
+        # Step 3 - creating spider config file
+        'config': (lambda: write_spider_config(country_name_clean, config_data, paths,
+                                               hydro, geothermal),
+                   {'config_data': config_data, 'hydro': hydro,
+                    'geothermal': geothermal}),
+        # Quick look at the exclusions at a coarse pixel size
+        'preview': (lambda: run_preview(country_name, country_name_clean, paths, preview,
+                                        slope_exclusion, coast_buffer),
+                    {'EPSG': EPSG, 'pixel_size': preview,
+                     'slope_exclusion': slope_exclusion,
+                     'coast_buffer': coast_buffer}),
+    }
+
+    skipped = {'hydro': not hydro or 'hydro' in registries,
+               'geothermal': not geothermal or 'geothermal' in registries}
+    steps = [step for step in STEPS if step in steps and not skipped.get(step)]
+    if preview is not None:
+        steps = [step for step in steps if step in ('boundaries', 'oceans', 'clc')] + ['preview']
+
+    # Each step waits only for the steps that write its input files, e.g.
+    # GLAES waits for the boundaries, oceans and CLC but not for OSM
+    graph = TaskGraph()
+    for step, depends_on in get_file_dependencies(step_files, steps).items():
+        function, params = step_runs[step]
+        graph.add(step, lambda step=step, function=function, params=params:
+                  manifest.run(step, function, *step_files[step], params=params),
+                  depends_on)
+
+    if dry_run:
+        print(f"Planned steps for {country_name_clean}:")
+        for step, line in zip(graph.tasks, graph.describe()):
+            inputs, outputs = step_files[step]
+            if not manifest.needs_run(step, inputs, step_runs[step][1], outputs):
+                line += ", currently up to date"
+            print(line)
+        print()
+        return
+
+    print(f"Preparing data files for {country_name_clean}...")
+    graph.run(step_workers)
+    print(f"Finished preparing data files for {country_name_clean}\n")
+
+def get_step_files(country_name, paths, slope_exclusion=False,
+                   placement_format='geojson', turbine_variants=None,
+                   pv_separations=None, placements=True, preview=None,
+                   clc_vrt=False):
+    """
+    Gets the input and output files of each preparation step for a country.
+
+    ...
+    Parameters
+    ----------
+    country_name : string
+        Name of country as given by the user.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    slope_exclusion : boolean
+        Whether the Slope-Exclusion outputs are used in GLAES.
+    placement_format : string
+        Format placements are also saved in, from formats.FORMATS.
+    turbine_variants : dictionary
+        Turbine radius in meters of each extra turbine model placed, keyed by
+        model name.
+    pv_separations : list
+        Extra separations in meters PV modules are placed with.
+    placements : boolean
+        Whether turbines and PV modules are placed.
+    preview : float
+        Pixel size in meters of the exclusions preview. Default is None.
+    clc_vrt : boolean
+        Whether the clipped CLC raster is saved as a VRT instead of a
+        GeoTIFF. Default is False.
+
+    Returns
+    -------
+    step_files : dictionary
+        Lists of input and output paths, keyed by step name.
+    """
+    country_name_clean = clean_country_name(country_name)
+    preview_suffix = get_preview_suffix(preview) if preview is not None else ''
+    glaes_data_path = paths['glaes_data']
+    spider_prep_data_path = paths['spider_prep_data']
+    glaes_processed_path = paths['glaes_processed']
+    OSM_country_path = os.path.join(paths['OSM'], f"{country_name_clean}")
+
+    def glaes_data(suffix):
+        return os.path.join(glaes_data_path, f'{country_name_clean}{suffix}')
+
+    def spider_data(suffix):
+        return os.path.join(spider_prep_data_path, f'{country_name_clean}{suffix}')
+
+    # Placement files of the default and sweep variants
+    placement_files = []
+    placement_names = [country_name] if slope_exclusion else [country_name_clean]
+    for name in (placement_names if placements else []):
+        turbine_path = os.path.join(glaes_processed_path, f'{name}_turbine_placements.shp')
+        pv_path = os.path.join(glaes_processed_path, f'{name}_pv_placements.shp')
+        placement_files += [turbine_path, pv_path]
+        placement_files += [get_variant_path(turbine_path, model) for model in turbine_variants or {}]
+        placement_files += [get_variant_path(pv_path, get_pv_variant(separation))
+                            for separation in pv_separations or []]
+
+    # The slope-exclusion outputs are named with the country name as given
+    clc_path = glaes_data('_CLC.vrt' if clc_vrt else '_CLC.tif')
+    exclusions_inputs = [glaes_data('.geojson'), glaes_data('_EPSG.pkl'),
+                         glaes_data('_oceans.geojson'), glaes_data('_coast_distance.tif'),
+                         clc_path, glaes_data('_CLC_glaes.tif')]
+    if slope_exclusion:
+        exclusions_inputs += [
+            os.path.join(glaes_data_path, f'{country_name}.geojson'),
+            os.path.join(paths['slope_exclusion_output'], f'{country_name}_slope_excluded_wind.tif'),
+            os.path.join(paths['slope_exclusion_output'], f'{country_name}_slope_excluded_pv.tif'),
+        ]
+
+    return {
+        'hydro': (
+            [os.path.join(paths['data'], f"{country_name_clean}_hydropower_plants.csv")],
+            [spider_data('_hydropower_dams.gpkg'),
+             os.path.join(paths['geox_final_data'], f"{country_name_clean}_hydropower_dams.gpkg")],
+        ),
+        'geothermal': (
+            [os.path.join(paths['data'], f"{country_name_clean}_geothermal_plants.csv")],
+            [spider_data('_geothermal_plants.gpkg'),
+             os.path.join(paths['geox_final_data'], f"{country_name_clean}_geothermal_plants.gpkg")],
+        ),
+        'boundaries': (
+            [paths['region']],
+            [glaes_data('_EPSG.pkl'), glaes_data('.geojson'),
+             glaes_data('_buff.geojson'), spider_data('.gpkg')],
+        ),
+        'oceans': (
+            [paths['ocean'], glaes_data('_buff.geojson'), glaes_data('.geojson')],
+            [glaes_data('_oceans.geojson'), spider_data('_oceans.gpkg'),
+             glaes_data('_coast_distance.tif')],
+        ),
+        'osm': (
+            [os.path.join(OSM_country_path, f'{layer}.shp') for layer in OSM_LAYERS]
+            + [glaes_data('_buff.geojson')],
+            [spider_data(f'_{name}.gpkg') for name in OSM_LAYERS.values()],
+        ),
+        'clc': (
+            [paths['clc_raster'], glaes_data('.geojson')],
+            [clc_path, glaes_data('_CLC_glaes.tif')],
+        ),
+        'exclusions': (
+            exclusions_inputs,
+            [os.path.join(glaes_processed_path, f'{name}{suffix}')
+             for name in ([country_name] if slope_exclusion else [country_name_clean])
+             for suffix in ('_wind_exclusions.tif', '_pv_exclusions.tif')]
+            + placement_files
+            + [get_coords_path(path) for path in placement_files]
+            + [with_format(path, placement_format) for path in placement_files
+               if placement_format != 'geojson'],
+        ),
+        'config': (
+            [paths['config_input_file']],
+            [os.path.join(paths['spider_prep'], f"{country_name_clean}_config.yml")],
+        ),
+        'preview': (
+            exclusions_inputs + [os.path.join(paths['spider_prep'], f"{country_name_clean}_hex.geojson")],
+            [os.path.join(paths['glaes_preview'], f'{name}_{gen}_exclusions{preview_suffix}.tif')
+             for name in ([country_name] if slope_exclusion else [country_name_clean])
+             for gen in ('wind', 'pv')],
+        ),
+    }
+
+def order_by_area(country_names, boundaries):
+    """
+    Orders countries from largest to smallest area, so the largest countries
+    are started first when running in parallel.
+
+    ...
+    Parameters
+    ----------
+    country_names : list
+        Names of countries as given by the user.
+    boundaries : Boundaries
+        Natural Earth country boundaries indexed by name.
+
+    Returns
+    -------
+    country_names : list
+        Names of countries ordered by descending area.
+    """
+    names_clean = [clean_country_name(name) for name in country_names]
+    # Use an equal-area projection so areas are comparable across latitudes
+    areas = boundaries.in_crs('EPSG:6933').loc[names_clean].area.groupby(level=0).sum()
+
+    return sorted(country_names,
+                  key=lambda name: areas[clean_country_name(name)],
+                  reverse=True)
+
+def run_country_with_log(country_name, log_path, *args, profile_settings=None,
+                         **kwargs):
+    """
+    Runs prepare_country() with its output written to a log file, catching
+    any error so that other countries can continue.
+
+    ...
+    Parameters
+    ----------
+    country_name : string
+        Name of country as given by the user.
+    log_path : string
+        Path to the log file for this country.
+    *args, **kwargs
+        Other arguments passed to prepare_country().
+    profile_settings : dictionary
+        Profiling settings from the main process, as returned by
+        profiling.get_settings(). Default is None, which leaves profiling off.
+
+    Returns
+    -------
+    error : string or None
+        Traceback of the error if the country failed, otherwise None.
+    records : list
+        Profiling records of the country's stages.
+    """
+    if profile_settings is not None:
+        configure(**profile_settings)
+    # Worker processes are reused, so only return this country's records
+    record_count = len(get_records())
+    error = None
+
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        with redirect_stdout(log_file), redirect_stderr(log_file):
+            try:
+                prepare_country(country_name, *args, **kwargs)
+            except Exception:
+                error = traceback.format_exc()
+                print(error)
+
+    return error, get_records()[record_count:]
+
+def run_countries_in_pool(country_names, boundaries, paths, config_data,
+                          turbine_radius, workers, **kwargs):
+    """
+    Runs prepare_country() for several countries in a process pool.
+
+    Countries are started largest first. Each country's output is written to
+    its own log file in the logs folder. A failing country is reported at the
+    end without stopping the others.
+
+    ...
+    Parameters
+    ----------
+    country_names : list
+        Names of countries as given by the user.
+    boundaries : Boundaries
+        Natural Earth country boundaries indexed by name.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    config_data : dictionary
+        Contents of the template SPIDER config file.
+    turbine_radius : integer
+        Turbine radius in meters used for spacing.
+    workers : integer
+        Number of worker processes.
+    **kwargs
+        Other keyword arguments passed to prepare_country().
+
+    Returns
+    -------
+    failed : dictionary
+        Tracebacks of the failed countries, keyed by country name.
+    """
+    os.makedirs(paths['logs'], exist_ok=True)
+    failed = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for country_name in order_by_area(country_names, boundaries):
+            country_name_clean = clean_country_name(country_name)
+            log_path = os.path.join(paths['logs'], f"{country_name_clean}.log")
+            country = boundaries.select([f'{country_name_clean}'])
+            future = executor.submit(run_country_with_log, country_name,
+                                     log_path, country, paths, config_data,
+                                     turbine_radius,
+                                     profile_settings=get_settings(), **kwargs)
+            futures[future] = (country_name, log_path)
+
+        for future in as_completed(futures):
+            country_name, log_path = futures[future]
+            try:
+                error, records = future.result()
+                add_records(records)
+            except Exception:
+                # The worker process itself failed, e.g. it ran out of memory
+                error = traceback.format_exc()
+            if error is None:
+                print(f"Finished {country_name} (log: {log_path})")
+            else:
+                failed[country_name] = error
+                print(f" ! {country_name} failed (log: {log_path})")
+
+    return failed
+
 
 if __name__ == "__main__":
     # Parser set-up
@@ -195,247 +1287,168 @@ if __name__ == "__main__":
                         help="<Optional> Use the flag if you need hydropower to be considered. Default will not consider hydropower.")
     parser.add_argument('--geothermal', action='store_true',
                         help="<Optional> Use the flag if you need geothermal to be considered. Default will not consider geothermal.")
+    parser.add_argument('--hydro-registry', type=str,
+                        help="<Optional> Enter the path to one hydropower CSV file for all countries, e.g. data/hydropower_plants.csv. Plants are assigned to countries by location. Implies --hydro.")
+    parser.add_argument('--geothermal-registry', type=str,
+                        help="<Optional> Enter the path to one geothermal CSV file for all countries, e.g. data/geothermal_plants.csv. Plants are assigned to countries by location. Implies --geothermal.")
     parser.add_argument('-se', '--slopeexclusion', action='store_true',
                         help="<Optional> Use the flag if you have used the Slope-Exclusion submodule. Default will not consider that the Slope-Exclusion submodule has been used.")
+    parser.add_argument('--clc-memory', type=int, default=512,
+                        help="<Optional> Enter the approximate memory limit in megabytes used when clipping the land cover raster. Default is 512.")
+    parser.add_argument('--clc-vrt', action='store_true',
+                        help="<Optional> Use the flag to save the clipped land cover raster as a VRT pointing to the global raster instead of copying its pixels. Default will save a GeoTIFF.")
+    parser.add_argument('--osm-clip', action='store_true',
+                        help="<Optional> Use the flag to drop OSM features that are outside the country and its 10 km buffer. Default will keep all features.")
+    parser.add_argument('--osm-simplify', action='store_true',
+                        help="<Optional> Use the flag to keep only the main OSM road and waterway classes, merge them and simplify them for faster SPIDER distances. Default keeps all features as they are.")
+    parser.add_argument('--osm-simplify-factor', type=float, default=0.01,
+                        help="<Optional> Enter the simplification tolerance as a share of the hexagon edge length in the SPIDER config. Default is 0.01.")
+    parser.add_argument('--osm-fclasses', nargs='+', default=[],
+                        help="<Optional> Enter the OSM classes to keep in a layer when simplifying, e.g. 'roads=motorway,trunk,primary', or 'waterways=all' to keep all classes.")
+    parser.add_argument('--simplify-boundaries', type=float, nargs='?', const=0.5,
+                        help="<Optional> Use the flag to simplify the country boundaries used by GLAES, the land cover clip and the 10 km buffer. Enter the tolerance as a share of the 100 m GLAES pixel size, 0.5 if not given. The full boundaries are kept if more than 1%% of the area would change. Default keeps the full boundaries.")
+    parser.add_argument('--format', default='geojson', choices=FORMATS,
+                        help="<Optional> Enter 'parquet' to also save the GLAES placements as GeoParquet files for prep_after_spider.py to read. Default is 'geojson', which saves Shapefiles only.")
+    parser.add_argument('--force', nargs='+', default=[], choices=STEPS + ['preview', 'all'],
+                        help="<Optional> Enter the steps to run even if their outputs are up to date, or 'all' to run every step. By default, steps whose inputs, settings and outputs are unchanged since the last run are skipped.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="<Optional> Enter the number of countries to prepare at the same time in separate processes. Default is 1, which prepares countries one after another.")
+    parser.add_argument('--step-workers', type=int, default=1,
+                        help="<Optional> Enter the number of steps of each country to run at the same time in threads, e.g. the OSM conversion while GLAES runs. Default is 1, which runs steps one after another.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="<Optional> Use the flag to print the planned steps of each country and the steps they wait for, without running them.")
+    parser.add_argument('--tile-size', type=float,
+                        help="<Optional> Enter a tile size in kilometres to run GLAES on overlapping tiles of each country, for countries too large to fit in memory. Default will run GLAES on the whole country at once.")
+    parser.add_argument('--tile-overlap', type=float, default=5,
+                        help="<Optional> Enter the distance in kilometres that each GLAES tile extends past its neighbours. Should be more than the turbine separation. Default is 5.")
+    parser.add_argument('--glaes-workers', type=int, default=1,
+                        help="<Optional> Enter the number of GLAES tiles to run at the same time in separate processes. Only used with --tile-size. Default is 1.")
+    parser.add_argument('--turbines', nargs='+', default=[],
+                        help="<Optional> Enter extra turbines to place, reusing the same exclusions, as models (NREL_4MW, Vestas_V80 or Enercon_E126) or radii in meters. Each is saved to [COUNTRY]_turbine_placements_[MODEL].shp, or [COUNTRY]_turbine_placements_[RADIUS]m.shp for radii. Default places only the NREL 4MW turbine.")
+    parser.add_argument('--pv-separations', nargs='+', type=float, default=[],
+                        help="<Optional> Enter extra separations in meters to place PV modules with, reusing the same exclusions. Each is saved to [COUNTRY]_pv_placements_[SEPARATION]m.shp. Default places PV modules 440 m apart only.")
+    parser.add_argument('--preview', type=float, nargs='?', const=1000,
+                        help="<Optional> Use the flag to quickly preview the land exclusions at a coarse pixel size in meters, 1000 if not given, with turbine and PV counts estimated from the eligible area. Only the boundary, ocean and land cover steps are run before it. Outputs are saved to inputs_glaes/preview and inputs_geox/preview with '_preview_' in their names.")
+    parser.add_argument('--coast-buffer', type=float, default=250,
+                        help="<Optional> Enter the distance in meters from the oceans to exclude in GLAES, up to 10000. Default is 250.")
+    parser.add_argument('--no-placements', action='store_true',
+                        help="<Optional> Use the flag to only save the GLAES exclusion rasters, without placing turbines and PV modules. Use with --zonal-stats in prep_after_spider.py. Default places them.")
+    parser.add_argument('--profile', type=str,
+                        help="<Optional> Enter a path ending in .json or .csv to save the time, CPU time, peak memory and file sizes of each stage to. Default will not profile stages.")
+    parser.add_argument('--cprofile', nargs='+', default=[],
+                        help="<Optional> Enter the stages to also run cProfile for, e.g. 'exclusions/coast' or 'exclusions/*'. Dumps are saved to logs/profiles. Requires --profile.")
     args = parser.parse_args()
 
+    if args.cprofile and not args.profile:
+        parser.error('Please enter a report path with --profile to use --cprofile.')
+    if args.tile_size and (args.turbines or args.pv_separations):
+        parser.error('--turbines and --pv-separations cannot be used with --tile-size.')
+    try:
+        turbine_variants = get_turbine_variants(args.turbines)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.tile_size and args.no_placements:
+        parser.error('--no-placements cannot be used with --tile-size.')
+    if args.preview is not None and args.preview <= 100:
+        parser.error('Please enter a --preview pixel size larger than the 100 m used for full runs.')
+    if args.preview is not None and args.tile_size:
+        parser.error('--preview cannot be used with --tile-size.')
+    if not 0 <= args.coast_buffer < BUFFER_DISTANCE:
+        parser.error(f'Please enter a --coast-buffer from 0 to less than {BUFFER_DISTANCE} m.')
+
     # Define country name(s) to be used
     country_names = args.countries
 
     # Store paths to files and folders
     dirname = os.path.dirname(__file__)
 
-    data_path = os.path.join(dirname, 'data')
-    region_path = os.path.join(data_path, 'ne_50m_admin_0_countries', 'ne_50m_admin_0_countries.shp')
-    clc_raster_path = os.path.join(data_path, "PROBAV_LC100_global_v3.0.1_2019-nrt_Discrete-Classification-map_EPSG-4326.tif")
-    ocean_path = os.path.join(data_path, "GOaS_v1_20211214_gpkg", "goas_v01.gpkg")
-    OSM_path = os.path.join(data_path, "OSM")
-
-    # config_name = "Country_config_hydro.yml" if args.hydro else "Country_config.yml"
-    config_input_file_path = os.path.join(dirname, "inputs_spider", "Country_config.yml")
-
-    slope_exclusion_output_path = os.path.join(dirname, "Slope-Exclusion", "output")
-    glaes_data_path = os.path.join(dirname, 'glaes', 'glaes', 'data')
-    spider_prep_data_path = os.path.join(dirname, 'ccg-spider', 'prep', 'data')
+    paths = get_paths(dirname)
 
-    glaes_processed_path = os.path.join(dirname, 'inputs_glaes', 'processed')
-    spider_prep_path = os.path.join(dirname, "ccg-spider", "prep")
-    geox_final_data_path = os.path.join(dirname, "inputs_geox/final_data")
+    if args.profile:
+        configure(cprofile_stages=args.cprofile,
+                  cprofile_path=os.path.join(paths['logs'], 'profiles'))
 
     # Read shapefile of countries
-    countries = gpd.read_file(region_path).set_index('NAME')
+    boundaries = get_boundaries(paths['region'], index_column='NAME')
 
     # Open and load the input config YAML file to be used to make the 
     # country-specific config YAML file
-    with open(config_input_file_path, 'r') as file:
+    with open(paths['config_input_file'], 'r') as file:
         config_data = yaml.load(file, Loader=yaml.FullLoader)
     
-    # Define turbine radius in meters for spacing.
-    # This is NREL_ReferenceTurbine_2020ATB_4MW - https://nrel.github.io/turbine-models/2020ATB_NREL_Reference_4MW_150.html
-    # Other options:
-    # Vestas_V80_2MW_gridstreamer - https://en.wind-turbine-models.com/turbines/19-vestas-v80-2.0, turbine_radius = 80
-    # Enercon_E126_7500kW - https://www.thewindpower.net/turbine_en_225_enercon_e126-7500.php, turbine_radius = 127
-    turbine_radius = 150
-
-    # Loop through a list of country names
-    for country_name in country_names:
-        country_name_clean = clean_country_name(country_name)
+    # Tie the OSM simplification tolerance to the SPIDER hexagon size
+    osm_simplify = None
+    if args.osm_simplify:
+        try:
+            osm_simplify = get_osm_simplify(config_data['hex_res'], args.osm_simplify_factor,
+                                            args.osm_fclasses)
+        except ValueError as error:
+            parser.error(str(error))
 
-        # Optional prep step - creating hydropower geopackage file
-        if args.hydro:
-            print(f"Creating hydropower geopackage file for {country_name_clean}...")
-            input_path = os.path.join(data_path, f"{country_name_clean}_hydropower_plants.csv") 
-            output_path = os.path.join(spider_prep_data_path, f"{country_name_clean}_hydropower_dams.gpkg")
-            final_data_output_path  = os.path.join(geox_final_data_path, f"{country_name_clean}_hydropower_dams.gpkg")
-
-            # Read data from CSV
-            data = pd.read_csv(input_path)
-
-            # Select relevant columns
-            data = data[['name', 'lat', 'lon', 
-                        'capacity', 'head']]
-
-            # Ensure numeric conversion for relevant columns
-            data['lon'] = pd.to_numeric(data['lon'], errors='coerce')
-            data['lat'] = pd.to_numeric(data['lat'], errors='coerce')
-            data['capacity'] = pd.to_numeric(data['capacity'], errors='raise')
-
-            # Drop rows with missing coordinates
-            data = data.dropna(subset=['lon', 'lat'])
-
-            # Data Preparation
-            # Filter for existing plants
-            data_existing = data.dropna(subset=['head'])
-            print(f"Number of missing 'head' values: {data_existing['head'].isna().sum()}")
-
-            # Export GeoPackage
-            gdf = gpd.GeoDataFrame(
-                data_existing,
-                geometry=gpd.points_from_xy(data_existing.lon, data_existing.lat)
-            )
-
-            gdf.set_crs(epsg=4326, inplace=True)
-            gdf.to_file(output_path, layer='dams', driver="GPKG")
-            gdf.to_file(final_data_output_path, layer='dams', driver="GPKG")
-
-            print(f"GeoPackage file successfully created for {country_name_clean}\n")
-
-        # Optional prep step - creating geothermal geopackage file
-        if args.geothermal:
-            print(f"Creating geothermal geopackage file for {country_name_clean}...")
-            input_path = os.path.join(data_path, f"{country_name_clean}_geothermal_plants.csv") 
-            output_path = os.path.join(spider_prep_data_path, f"{country_name_clean}_geothermal_plants.gpkg")
-            final_data_output_path  = os.path.join(geox_final_data_path, f"{country_name_clean}_geothermal_plants.gpkg")
-            
-            # Read data from CSV
-            data = pd.read_csv(input_path)
-
-            # Select relevant columns
-            data = data[['name', 'lat', 'lon', 'capacity']]
-
-            # Ensure numeric conversion for relevant columns
-            data['lon'] = pd.to_numeric(data['lon'], errors='coerce')
-            data['lat'] = pd.to_numeric(data['lat'], errors='coerce')
-            data['capacity'] = pd.to_numeric(data['capacity'], errors='raise')
-
-            # Drop rows with missing coordinates and missing capacity
-            data = data.dropna(subset=['lon', 'lat', 'capacity'])
-
-            # Data Preparation
-            # Export GeoPackage
-            gdf = gpd.GeoDataFrame(
-                data,
-                geometry=gpd.points_from_xy(data.lon, data.lat)
-            )
-
-            gdf.set_crs(epsg=4326, inplace=True)
-            gdf.to_file(output_path, layer='plants', driver="GPKG")
-            gdf.to_file(final_data_output_path, layer='plants', driver="GPKG")
-
-            print(f"GeoPackage file successfully created for {country_name_clean}\n")
-
-        # Step 1 - preparing files for glaes and spider
-        print(f"Preparing spider and glaes data files for {country_name_clean}...")
-
-        # Grab country boundaries
-        country = countries.loc[[f'{country_name_clean}'], :]
-
-        # Caculating glaes data files
-        # Calculate UTM zone based on representative point of country
-        representative_point = country.representative_point().iloc[0]
-        latitude, longitude = representative_point.y, representative_point.x
-        EPSG = int(32700 - round((45 + latitude) / 90, 0) * 100 + round((183 + longitude) / 6, 0))
-        with open(os.path.join(glaes_data_path, f'{country_name_clean}_EPSG.pkl'), 'wb') as file:
-            pickle.dump(EPSG, file)
-
-        # Reproject country to UTM zone
-        country.to_crs(epsg=EPSG, inplace=True)
-        country.to_file(os.path.join(glaes_data_path, f'{country_name_clean}.geojson'), driver='GeoJSON', encoding='utf-8')
-
-        # Buffer the "country" polygon by 1000 meters to create a buffer zone
-        country_buffer = country['geometry'].buffer(10000)
-        country_buffer.make_valid()
-        country_buffer.to_file(os.path.join(glaes_data_path, f'{country_name_clean}_buff.geojson'), driver='GeoJSON', encoding='utf-8')
-
-        # Reproject GOAS to UTM zone of country
-        GOAS = gpd.read_file(ocean_path)
-        country_buffer = country_buffer.to_crs(epsg=4326)
-        GOAS.to_crs(epsg=4326, inplace=True)
-        GOAS_country = gpd.clip(GOAS, country_buffer)
-        GOAS_country['geometry'].make_valid()
-        # Reconvert to country CRS? Check it makes no difference in distance outputs. GLAES seems happy with 4326.
-        GOAS_country.to_file(os.path.join(glaes_data_path, f'{country_name_clean}_oceans.geojson'), driver='GeoJSON', encoding='utf-8')
-
-        # Calculating spider data files
-        # Save oceans to gpkg for spider
-        GOAS_country.to_file(os.path.join(spider_prep_data_path, f'{country_name_clean}_oceans.gpkg'), driver='GPKG', encoding='utf-8')
-
-        # Save OSM layers in 4236 gpkgs for spider
-        OSM_country_path = os.path.join(OSM_path, f"{country_name_clean}")
-
-        OSM_waterbodies = gpd.read_file(os.path.join(OSM_country_path, 'gis_osm_water_a_free_1.shp'))
-        OSM_waterbodies.to_file(os.path.join(spider_prep_data_path, f'{country_name_clean}_waterbodies.gpkg'), driver='GPKG', encoding='utf-8')
-        OSM_roads = gpd.read_file(os.path.join(OSM_country_path, f'gis_osm_roads_free_1.shp'))
-        OSM_roads.to_file(os.path.join(spider_prep_data_path, f'{country_name_clean}_roads.gpkg'), driver='GPKG', encoding='utf-8')
-        OSM_waterways = gpd.read_file(os.path.join(OSM_country_path, 'gis_osm_waterways_free_1.shp'))
-        OSM_waterways.to_file(os.path.join(spider_prep_data_path, f'{country_name_clean}_waterways.gpkg'), driver='GPKG', encoding='utf-8')
-
-        # Convert country back to EPSG 4326 to trim CLC and save this version for SPIDER as well
-        country.to_crs(epsg=4326, inplace=True)
-        country.to_file(os.path.join(spider_prep_data_path, f'{country_name_clean}.gpkg'), driver='GPKG', encoding='utf-8')
-
-        # Open the CLC GeoTIFF file for reading
-        with rasterio.open(clc_raster_path) as src:
-            # Mask the raster using the vector file's geometry
-            out_image, out_transform = mask(src, country.geometry.apply(mapping), crop=True)
-            # Copy the metadata from the source raster
-            out_meta = src.meta.copy()
-            # Update the metadata for the clipped raster
-            out_meta.update({
-                'height': out_image.shape[1],
-                'width': out_image.shape[2],
-                'transform': out_transform
-            })
-
-            # Save the clipped raster as a new GeoTIFF file
-            with rasterio.open(os.path.join(glaes_data_path, f'{country_name_clean}_CLC.tif'), 'w', **out_meta) as dest:
-                dest.write(out_image)
-
-        print(f"Finished preparing glaes and spider data files for {country_name_clean}\n")
-
-
-        # Step 2 - running glaes
-        print(f"Calculating land exclusions for {country_name_clean}...")
-
-        # Load the pickled EPSG code for the country
-        with open(os.path.join(glaes_data_path, f'{country_name_clean}_EPSG.pkl'), 'rb') as file:
-            EPSG = pickle.load(file)
-
-        # Chooses slope-exclusion function based on user input
-        if args.slopeexclusion:
-            calculating_exclusions_slope_exclusion_included(glaes_data_path, 
-                                                    slope_exclusion_output_path,
-                                                    country_name, EPSG, 
-                                                    glaes_processed_path,
-                                                    turbine_radius)
+    # Define turbine radius in meters for spacing.
+    # This is NREL_ReferenceTurbine_2020ATB_4MW. The other models in TURBINES,
+    # or any radius, can be placed as well with --turbines.
+    turbine_radius = TURBINES['NREL_4MW']
+
+    # Split global plant registries between countries in one pass each
+    registries = {'hydro': args.hydro_registry, 'geothermal': args.geothermal_registry}
+    registries = {kind: path for kind, path in registries.items() if path}
+    saved = {}
+    for kind, registry_path in registries.items():
+        if args.dry_run:
+            print(f"Planned: split {kind} registry {registry_path} between countries\n")
+            saved[kind] = [clean_country_name(name) for name in country_names]
+            continue
+        print(f"Splitting {kind} registry {registry_path} between countries...")
+        with stage(f'{kind}_registry', inputs=[registry_path]):
+            saved[kind] = split_registry(registry_path, kind, boundaries, country_names, paths)
+
+    options = {
+        'hydro': args.hydro,
+        'geothermal': args.geothermal,
+        'slope_exclusion': args.slopeexclusion,
+        'clc_max_memory_mb': args.clc_memory,
+        'clc_vrt': args.clc_vrt,
+        'osm_clip': args.osm_clip,
+        'osm_simplify': osm_simplify,
+        'boundary_simplify': args.simplify_boundaries,
+        'placement_format': args.format,
+        'tile_size': args.tile_size * 1000 if args.tile_size else None,
+        'tile_overlap': args.tile_overlap * 1000,
+        'glaes_workers': args.glaes_workers,
+        'turbine_variants': turbine_variants,
+        'pv_separations': args.pv_separations,
+        'placements': not args.no_placements,
+        'coast_buffer': args.coast_buffer,
+        'registries': saved,
+        'force': args.force,
+        'step_workers': args.step_workers,
+        'dry_run': args.dry_run,
+        'preview': args.preview,
+    }
+
+    failed = {}
+    try:
+        if args.workers > 1 and not args.dry_run:
+            failed = run_countries_in_pool(country_names, boundaries, paths,
+                                           config_data, turbine_radius,
+                                           args.workers, **options)
         else:
-            calculating_exclusions(glaes_data_path, country_name_clean, EPSG, 
-                                   glaes_processed_path, turbine_radius)
-        print("Finished calulcating land exclusions\n")
-     
-
-        # Step 3 - creating spider config file
-        print(f'Preparing config file for {country_name_clean}...')
-
-        # Adding country name to the config file
-        current_data = replace_country(config_data, country_name_clean)
-
-        # Adding hydropower data if required
-        if args.hydro:
-            data = {
-                "name": "hydro",
-                "type": "vector",
-                "operation": "sjoin",
-                "file": f"data/{country_name_clean}_hydropower_dams.gpkg",
-                "joined_col": "capacity"
-            }
-
-            current_data["features"].append(data)
-        
-        # Adding geothermal data if required
-        if args.geothermal:
-            data = {
-                "name": "geothermal",
-                "type": "vector",
-                "operation": "sjoin",
-                "file": f"data/{country_name_clean}_geothermal_plants.gpkg",
-                "joined_col": "capacity"
-            }
-
-            current_data["features"].append(data)
-
-        output_file = f"{country_name_clean}_config.yml"
-        with open(os.path.join(spider_prep_path, output_file), 'w', encoding='utf-8') as file:
-            yaml.dump(current_data, file, default_flow_style=False, allow_unicode=True)
-
-        print(f'Config file is created and saved as "{output_file}"')
+            # Loop through a list of country names
+            for country_name in country_names:
+                country_name_clean = clean_country_name(country_name)
+                country = boundaries.select([f'{country_name_clean}'])
+                prepare_country(country_name, country, paths, config_data,
+                                turbine_radius, **options)
+    finally:
+        # Save the report even if a country failed, as that run is often the
+        # one worth looking at
+        if args.profile:
+            write_report(args.profile)
+            print(f"Profiling report saved to {args.profile}")
+
+    if failed:
+        print(f"\n{len(failed)} of {len(country_names)} countries failed:")
+        for country_name, error in failed.items():
+            print(f" ! {country_name}:\n{error}")
+        sys.exit(1)
@@ -0,0 +1,314 @@
+"""
+A file used for recording the time and memory used by each stage of a run,
+and saving them to a JSON or CSV report.
+
+Profiling is off until configure() is called, so stage() costs nothing in
+normal runs. Stages can be nested, and are named by their path, e.g.
+"exclusions/coast".
+
+Contains FIELDS, add_records(), configure(), file_size(), get_records(),
+get_settings(), set_context(), stage() and write_report().
+"""
+from contextlib import contextmanager
+import cProfile
+import csv
+from fnmatch import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak memory is not recorded
+    resource = None
+
+# Columns of the run report
+FIELDS = ['country', 'stage', 'status', 'wall_s', 'cpu_s', 'peak_rss_mb',
+          'process_peak_rss_mb', 'input_mb', 'output_mb', 'cprofile_path']
+
+# Seconds between samples of the resident memory while stages run
+RSS_SAMPLE_INTERVAL = 0.05
+
+# Profiling settings for this process, set by configure()
+_settings = {'enabled': False, 'cprofile_stages': [], 'cprofile_path': None}
+
+# Labels added to each record, e.g. the country being prepared
+_context = {}
+
+# Names of the stages currently running in each thread, outermost first
+_local = threading.local()
+
+# Records of the finished stages
+_records = []
+
+# Highest resident memory sampled in megabytes for each running stage, and
+# the thread sampling it, or None when no stage is running
+_rss_peaks = {}
+_rss_sampler = {'thread': None}
+_rss_lock = threading.Lock()
+
+
+def configure(enabled=True, cprofile_stages=(), cprofile_path=None):
+    """
+    Turns profiling on or off for this process.
+
+    ...
+    Parameters
+    ----------
+    enabled : boolean
+        Whether to record stages.
+    cprofile_stages : list
+        Stage paths to also run cProfile for. Shell-style wildcards can be
+        used, e.g. "exclusions/*". Default is (), which runs no cProfile.
+    cprofile_path : string
+        Path to the folder to save cProfile dumps to.
+    """
+    _settings['enabled'] = enabled
+    _settings['cprofile_stages'] = list(cprofile_stages)
+    _settings['cprofile_path'] = cprofile_path
+
+def get_settings():
+    """
+    Gets the profiling settings for this process, e.g. to pass on to worker
+    processes.
+
+    ...
+    Returns
+    -------
+    settings : dictionary
+        Keyword arguments for configure().
+    """
+    return dict(_settings)
+
+def set_context(**labels):
+    """
+    Sets labels added to each following record, e.g. country="Kenya".
+    """
+    _context.clear()
+    _context.update(labels)
+
+def file_size(path):
+    """
+    Gets the size of a file, including Shapefile sidecar files, or of all
+    files in a folder.
+
+    ...
+    Parameters
+    ----------
+    path : string
+        Path to the file or folder.
+
+    Returns
+    -------
+    size : integer
+        Size in bytes, or 0 if the path does not exist.
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(folder, name))
+                   for folder, _, names in os.walk(path) for name in names)
+    if not os.path.exists(path):
+        return 0
+    if path.endswith('.shp'):
+        base = os.path.splitext(path)[0]
+        return sum(os.path.getsize(base + ext) for ext in ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+                   if os.path.exists(base + ext))
+
+    return os.path.getsize(path)
+
+def _get_stack():
+    """
+    Gets the names of the stages currently running in this thread, so that
+    stages run in parallel threads are not nested in each other.
+    """
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+
+    return _local.stack
+
+def _process_peak_rss_mb():
+    """
+    Gets the peak resident memory of this process so far in megabytes, or
+    None if it cannot be measured.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 1024 ** 2
+
+def _current_rss_mb():
+    """
+    Gets the current resident memory of this process in megabytes, or None
+    if it cannot be measured.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    # Outside Linux, psutil is used if it is installed
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+def _sample_rss():
+    """
+    Samples the resident memory into the peak of each running stage, until
+    no stage is running.
+    """
+    while True:
+        rss = _current_rss_mb()
+        with _rss_lock:
+            if not _rss_peaks:
+                _rss_sampler['thread'] = None
+                return
+            for key, peak in _rss_peaks.items():
+                _rss_peaks[key] = max(peak, rss)
+        time.sleep(RSS_SAMPLE_INTERVAL)
+
+def _start_rss(key):
+    """
+    Starts tracking the peak resident memory of a stage. Returns False if it
+    cannot be measured.
+    """
+    rss = _current_rss_mb()
+    if rss is None:
+        return False
+
+    with _rss_lock:
+        _rss_peaks[key] = rss
+        if _rss_sampler['thread'] is None:
+            _rss_sampler['thread'] = threading.Thread(target=_sample_rss, daemon=True)
+            _rss_sampler['thread'].start()
+
+    return True
+
+def _stop_rss(key):
+    """
+    Stops tracking the peak resident memory of a stage and returns it.
+    """
+    rss = _current_rss_mb()
+    with _rss_lock:
+        return max(_rss_peaks.pop(key), rss)
+
+@contextmanager
+def stage(name, inputs=(), outputs=()):
+    """
+    Records the wall time, CPU time, peak memory and input/output sizes of
+    the code run within it, if profiling is on.
+
+    The peak memory is the highest resident memory of the process sampled
+    while the stage runs, every RSS_SAMPLE_INTERVAL seconds, so peaks
+    shorter than that may be missed. When stages run in parallel threads, it
+    includes the other running stages. The peak of the whole process up to
+    the end of the stage is also recorded.
+
+    ...
+    Parameters
+    ----------
+    name : string
+        Name of the stage.
+    inputs : list
+        Paths to the stage's input files. Default is ().
+    outputs : list
+        Paths to the stage's output files, measured when the stage ends.
+        Default is ().
+    """
+    if not _settings['enabled']:
+        yield
+        return
+
+    stack = _get_stack()
+    stack.append(name)
+    stage_path = '/'.join(stack)
+    record = dict(_context, stage=stage_path, status='ok',
+                  input_mb=sum(file_size(path) for path in inputs) / 1024 ** 2)
+
+    profiler = None
+    if any(fnmatch(stage_path, pattern) for pattern in _settings['cprofile_stages']):
+        profiler = cProfile.Profile()
+
+    rss_key = object()
+    sampling = _start_rss(rss_key)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record['wall_s'] = time.perf_counter() - wall_start
+        record['cpu_s'] = time.process_time() - cpu_start
+        record['peak_rss_mb'] = _stop_rss(rss_key) if sampling else None
+        record['process_peak_rss_mb'] = _process_peak_rss_mb()
+        record['output_mb'] = sum(file_size(path) for path in outputs) / 1024 ** 2
+
+        if profiler is not None:
+            cprofile_path = _settings['cprofile_path'] or '.'
+            os.makedirs(cprofile_path, exist_ok=True)
+            prefix = '_'.join(str(label) for label in _context.values())
+            file_name = '_'.join(filter(None, [prefix, stage_path.replace('/', '_')]))
+            record['cprofile_path'] = os.path.join(cprofile_path, f"{file_name}.prof")
+            profiler.dump_stats(record['cprofile_path'])
+
+        _records.append(record)
+        stack.pop()
+
+def get_records():
+    """
+    Gets the records of the stages finished in this process.
+
+    ...
+    Returns
+    -------
+    records : list
+        One dictionary per stage, in the order they finished.
+    """
+    return list(_records)
+
+def add_records(records):
+    """
+    Adds records from another process, e.g. a worker, to this one's report.
+
+    ...
+    Parameters
+    ----------
+    records : list
+        Records as returned by get_records().
+    """
+    _records.extend(records)
+
+def write_report(report_path):
+    """
+    Saves the records of all stages as CSV if the path ends in .csv, or as
+    JSON otherwise.
+
+    ...
+    Parameters
+    ----------
+    report_path : string
+        Path to save the report to.
+    """
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+
+    if report_path.endswith('.csv'):
+        with open(report_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(_records)
+    else:
+        with open(report_path, 'w', encoding='utf-8') as file:
+            json.dump(_records, file, indent=2)
@@ -0,0 +1,159 @@
+"""
+A file used for preparing hydropower and geothermal plant registries for
+SPIDER and Geo-X.
+
+A registry can be one CSV file per country, or one global CSV file that is
+split between countries by location.
+
+Contains REGISTRIES, clean_registry(), split_registry() and write_registry().
+"""
+import os
+
+import geopandas as gpd
+import pandas as pd
+
+from utils import clean_country_name, link_or_copy
+
+# Columns, required values and output names of each kind of registry
+REGISTRIES = {
+    'hydro': {
+        'columns': ['name', 'lat', 'lon', 'capacity', 'head'],
+        # Plants without a head are not existing plants
+        'required': ['lon', 'lat', 'head'],
+        'layer': 'dams',
+        'file_suffix': '_hydropower_dams.gpkg',
+    },
+    'geothermal': {
+        'columns': ['name', 'lat', 'lon', 'capacity'],
+        'required': ['lon', 'lat', 'capacity'],
+        'layer': 'plants',
+        'file_suffix': '_geothermal_plants.gpkg',
+    },
+}
+
+
+def clean_registry(data, kind):
+    """
+    Selects the relevant columns of a registry, converts them to numbers and
+    drops plants with missing values.
+
+    ...
+    Parameters
+    ----------
+    data : dataframe
+        Registry rows as read from the CSV file.
+    kind : string
+        'hydro' or 'geothermal'.
+
+    Returns
+    -------
+    plants : geodataframe
+        Plants as points in EPSG 4326.
+    """
+    registry = REGISTRIES[kind]
+
+    # Select relevant columns
+    data = data[registry['columns']].copy()
+
+    # Ensure numeric conversion for relevant columns
+    data['lon'] = pd.to_numeric(data['lon'], errors='coerce')
+    data['lat'] = pd.to_numeric(data['lat'], errors='coerce')
+    data['capacity'] = pd.to_numeric(data['capacity'], errors='raise')
+
+    data = data.dropna(subset=registry['required'])
+
+    return gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(data.lon, data.lat),
+                            crs=4326)
+
+def write_registry(plants, kind, country_name_clean, paths):
+    """
+    Saves one country's plants as a GeoPackage for SPIDER, and links or copies
+    it to the Geo-X final data folder instead of saving it again.
+
+    ...
+    Parameters
+    ----------
+    plants : geodataframe
+        Plants of the country.
+    kind : string
+        'hydro' or 'geothermal'.
+    country_name_clean : string
+        Country name in a standardised format.
+    paths : dictionary
+        Paths to input files and output folders, as made by
+        utils.get_paths().
+    """
+    registry = REGISTRIES[kind]
+    file_name = f"{country_name_clean}{registry['file_suffix']}"
+    output_path = os.path.join(paths['spider_prep_data'], file_name)
+
+    plants.to_file(output_path, layer=registry['layer'], driver="GPKG")
+    link_or_copy(output_path, os.path.join(paths['geox_final_data'], file_name))
+
+def split_registry(csv_path, kind, boundaries, country_names, paths,
+                   chunksize=100000):
+    """
+    Splits a global registry between countries and saves each country's
+    plants, as write_registry() does.
+
+    The CSV file is read in chunks, and each chunk's plants are assigned to
+    countries with one spatial join, so only the plants of the given countries
+    are held in memory.
+
+    ...
+    Parameters
+    ----------
+    csv_path : string
+        Path to the global registry CSV file.
+    kind : string
+        'hydro' or 'geothermal'.
+    boundaries : Boundaries
+        Natural Earth country boundaries indexed by name.
+    country_names : list
+        Names of countries as given by the user.
+    paths : dictionary
+        Paths to input files and output folders, as made by
+        utils.get_paths().
+    chunksize : integer
+        Number of CSV rows to read at a time.
+
+    Returns
+    -------
+    saved : list
+        Names in a standardised format of the countries a GeoPackage was
+        saved for. Countries without plants get no GeoPackage.
+    """
+    names_clean = [clean_country_name(name) for name in country_names]
+    countries = boundaries.select(names_clean).to_crs(epsg=4326)
+    countries = gpd.GeoDataFrame({'country': countries.index},
+                                 geometry=countries.geometry.values,
+                                 crs=countries.crs)
+
+    try:
+        reader = pd.read_csv(csv_path, chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        reader = []
+
+    chunks = []
+    for chunk in reader:
+        plants = clean_registry(chunk, kind)
+        plants = gpd.sjoin(plants, countries, how='inner', predicate='within')
+        chunks.append(plants.drop(columns='index_right'))
+    if chunks:
+        plants = gpd.GeoDataFrame(pd.concat(chunks), crs=4326)
+    else:
+        # An empty registry has no plants for any country
+        plants = gpd.GeoDataFrame(columns=REGISTRIES[kind]['columns'] + ['country'],
+                                  geometry=[], crs=4326)
+
+    saved = []
+    for country_name_clean in names_clean:
+        country_plants = plants[plants['country'] == country_name_clean].drop(columns='country')
+        if country_plants.empty:
+            print(f" ! No plants found in {csv_path} for {country_name_clean}. Not saving a GeoPackage.")
+            continue
+        write_registry(country_plants, kind, country_name_clean, paths)
+        print(f" - Saved {len(country_plants)} plants for {country_name_clean}")
+        saved.append(country_name_clean)
+
+    return saved
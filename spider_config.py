@@ -0,0 +1,98 @@
+"""
+A file used for making the country-specific SPIDER config files.
+
+It only needs light dependencies, so the config step can be run without
+loading the geospatial stack.
+
+Contains PLANT_FILES, replace_country() and write_spider_config().
+"""
+import os
+
+from unidecode import unidecode
+import yaml
+
+# Suffixes of the plant GeoPackages in the SPIDER data folder, as saved by
+# registries.write_registry()
+PLANT_FILES = {'hydro': '_hydropower_dams.gpkg', 'geothermal': '_geothermal_plants.gpkg'}
+
+
+def replace_country(node, country_name):
+    """
+    Recursively replaces "Country" with the country name provided.
+
+    ...
+    Parameters
+    ----------
+    node : dictionary
+        File contents that need to have "Country" replaced with the country
+        name provided.
+    country_name : string
+        Name of country to be used as replacement.
+
+    Returns
+    -------
+    node : dictionary
+        File contents with the correct country name used.
+    """
+    if isinstance(node, dict):
+        return {key: replace_country(value, country_name) for key, value in node.items()}
+    elif isinstance(node, list):
+        return [replace_country(item, country_name) for item in node]
+    elif isinstance(node, str):
+        return unidecode(node).replace("Country", country_name)
+    else:
+        return node
+
+def write_spider_config(country_name_clean, config_data, paths, hydro=False,
+                        geothermal=False):
+    """
+    Creates the SPIDER config file for the country.
+
+    ...
+    Parameters
+    ----------
+    country_name_clean : string
+        Country name in a standardised format.
+    config_data : dictionary
+        Contents of the template SPIDER config file.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    hydro : boolean
+        Whether to add hydropower data to the config.
+    geothermal : boolean
+        Whether to add geothermal data to the config.
+    """
+    print(f'Preparing config file for {country_name_clean}...')
+
+    # Adding country name to the config file
+    current_data = replace_country(config_data, country_name_clean)
+
+    # Adding hydropower data if required
+    if hydro:
+        data = {
+            "name": "hydro",
+            "type": "vector",
+            "operation": "sjoin",
+            "file": f"data/{country_name_clean}{PLANT_FILES['hydro']}",
+            "joined_col": "capacity"
+        }
+
+        current_data["features"].append(data)
+    
+    # Adding geothermal data if required
+    if geothermal:
+        data = {
+            "name": "geothermal",
+            "type": "vector",
+            "operation": "sjoin",
+            "file": f"data/{country_name_clean}{PLANT_FILES['geothermal']}",
+            "joined_col": "capacity"
+        }
+
+        current_data["features"].append(data)
+
+    output_file = f"{country_name_clean}_config.yml"
+    with open(os.path.join(paths['spider_prep'], output_file), 'w', encoding='utf-8') as file:
+        yaml.dump(current_data, file, default_flow_style=False, allow_unicode=True)
+
+    print(f'Config file is created and saved as "{output_file}"')
@@ -0,0 +1,183 @@
+"""
+A file used for skipping preparation steps whose outputs are up to date.
+
+Contains StageManifest.
+"""
+import json
+import os
+import threading
+
+from profiling import stage
+
+
+class StageManifest:
+    """
+    Records the inputs, parameters and outputs of each step run for one
+    country, so that a step can be skipped on a later run when none of them
+    have changed.
+
+    Files are compared by size and modification time. As each step lists the
+    outputs of earlier steps as inputs, re-running a step also re-runs the
+    steps that depend on it.
+
+    ...
+    Attributes
+    ----------
+    manifest_path : string
+        Path to the JSON manifest file for the country.
+    force : set
+        Names of steps to run even if they are up to date. "all" runs every
+        step.
+    """
+    def __init__(self, manifest_path, force=()):
+        self.manifest_path = manifest_path
+        self.force = set(force)
+        self.steps = {}
+        # Steps of one country can run in parallel threads and record at once
+        self._lock = threading.Lock()
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                self.steps = json.load(file)
+
+    @staticmethod
+    def _file_state(path):
+        """
+        Gets the size and modification time of a file, or None if it does not
+        exist.
+
+        ...
+        Parameters
+        ----------
+        path : string
+            Path to the file.
+
+        Returns
+        -------
+        state : list or None
+            Size in bytes and modification time in nanoseconds.
+        """
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _record_for(self, inputs, params, outputs):
+        """
+        Makes the manifest record for a step.
+
+        ...
+        Parameters
+        ----------
+        inputs : list
+            Paths to the step's input files.
+        params : dictionary
+            Parameters that change the step's outputs.
+        outputs : list
+            Paths to the step's output files.
+
+        Returns
+        -------
+        record : dictionary
+            Record of the current state of the step's files and parameters.
+        """
+        return {
+            'inputs': {path: self._file_state(path) for path in inputs},
+            'params': json.loads(json.dumps(params, default=str)),
+            'outputs': {path: self._file_state(path) for path in outputs},
+        }
+
+    def needs_run(self, step, inputs, params, outputs):
+        """
+        Checks whether a step needs to be run.
+
+        A step needs to be run if it is forced, if it has not been recorded, or
+        if any input, parameter or output has changed since it was recorded.
+
+        ...
+        Parameters
+        ----------
+        step : string
+            Name of the step.
+        inputs : list
+            Paths to the step's input files.
+        params : dictionary
+            Parameters that change the step's outputs.
+        outputs : list
+            Paths to the step's output files.
+
+        Returns
+        -------
+        needs_run : boolean
+            True if the step needs to be run.
+        """
+        if step in self.force or 'all' in self.force:
+            return True
+        if step not in self.steps:
+            return True
+
+        current = self._record_for(inputs, params, outputs)
+        if any(state is None for state in current['outputs'].values()):
+            return True
+
+        return current != self.steps[step]
+
+    def record(self, step, inputs, params, outputs):
+        """
+        Records a step as run and saves the manifest.
+
+        ...
+        Parameters
+        ----------
+        step : string
+            Name of the step.
+        inputs : list
+            Paths to the step's input files.
+        params : dictionary
+            Parameters that change the step's outputs.
+        outputs : list
+            Paths to the step's output files.
+        """
+        record = self._record_for(inputs, params, outputs)
+
+        with self._lock:
+            self.steps[step] = record
+            os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+            temporary_path = f"{self.manifest_path}.tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(self.steps, file, indent=2)
+            os.replace(temporary_path, self.manifest_path)
+
+    def run(self, step, function, inputs, outputs, params=None):
+        """
+        Runs a step and records it, unless it is up to date.
+
+        ...
+        Parameters
+        ----------
+        step : string
+            Name of the step.
+        function : function
+            Function that runs the step, taking no arguments.
+        inputs : list
+            Paths to the step's input files.
+        outputs : list
+            Paths to the step's output files.
+        params : dictionary
+            Parameters that change the step's outputs. Default is None.
+
+        Returns
+        -------
+        ran : boolean
+            True if the step was run, False if it was skipped.
+        """
+        params = params or {}
+        if not self.needs_run(step, inputs, params, outputs):
+            print(f" - Skipping {step}, outputs are up to date")
+            return False
+
+        with stage(step, inputs, outputs):
+            function()
+        self.record(step, inputs, params, outputs)
+
+        return True
@@ -0,0 +1,148 @@
+"""
+A file used for running the preparation steps of one country as a graph of
+tasks, so that steps which do not depend on each other can run at the same
+time.
+
+Contains TaskGraph and get_file_dependencies().
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class TaskGraph:
+    """
+    Tasks and the tasks each one depends on. A task is started once all of
+    its dependencies have finished, and is not run if any of them failed.
+
+    Tasks are run in threads. Most of the preparation steps spend their time
+    reading and writing files or in GDAL, GEOS and NumPy, which release the
+    GIL, so steps overlap without the cost of copying data between
+    processes.
+
+    ...
+    Attributes
+    ----------
+    tasks : dictionary
+        Function and dependencies of each task, keyed by name, in the order
+        they were added.
+    """
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, function, depends_on=()):
+        """
+        Adds a task to the graph.
+
+        ...
+        Parameters
+        ----------
+        name : string
+            Name of the task.
+        function : function
+            Function that runs the task, taking no arguments.
+        depends_on : list
+            Names of the tasks that must finish first. Default is ().
+        """
+        unknown = [dependency for dependency in depends_on if dependency not in self.tasks]
+        if unknown:
+            raise ValueError(f"Task {name} depends on unknown tasks {unknown}. "
+                             "Add tasks after the tasks they depend on.")
+        self.tasks[name] = {'function': function, 'depends_on': list(depends_on)}
+
+    def describe(self):
+        """
+        Describes the planned graph, one task per line, in the order tasks
+        could be started.
+
+        ...
+        Returns
+        -------
+        lines : list
+            Description of each task and its dependencies.
+        """
+        lines = []
+        for name, task in self.tasks.items():
+            if task['depends_on']:
+                lines.append(f" - {name} (after {', '.join(task['depends_on'])})")
+            else:
+                lines.append(f" - {name} (can start at once)")
+
+        return lines
+
+    def run(self, workers=1):
+        """
+        Runs every task once its dependencies have finished.
+
+        With one worker, tasks are run one after another in the order they
+        were added. If a task fails, the tasks that depend on it are not run,
+        the others are left to finish, and the first error is then raised.
+
+        ...
+        Parameters
+        ----------
+        workers : integer
+            Number of tasks to run at the same time. Default is 1.
+        """
+        if workers <= 1:
+            for task in self.tasks.values():
+                task['function']()
+            return
+
+        done, failed, errors = set(), set(), []
+        waiting = dict(self.tasks)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while waiting or running:
+                for name, task in list(waiting.items()):
+                    if any(dependency in failed for dependency in task['depends_on']):
+                        print(f" ! Not running {name}, as a step it depends on failed")
+                        failed.add(name)
+                        del waiting[name]
+                    elif all(dependency in done for dependency in task['depends_on']):
+                        running[executor.submit(task['function'])] = name
+                        del waiting[name]
+
+                if not running:
+                    # Only tasks blocked by failed tasks were left
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(name)
+                    except Exception as error:
+                        failed.add(name)
+                        errors.append(error)
+
+        if errors:
+            raise errors[0]
+
+def get_file_dependencies(step_files, steps):
+    """
+    Finds which steps depend on each other, from the files each step reads
+    and writes. A step depends on every earlier step that writes one of its
+    input files.
+
+    ...
+    Parameters
+    ----------
+    step_files : dictionary
+        Lists of input and output paths, keyed by step name.
+    steps : list
+        Names of the steps to run, in the order they would be run one after
+        another.
+
+    Returns
+    -------
+    dependencies : dictionary
+        Names of the steps each step depends on, keyed by step name.
+    """
+    dependencies = {}
+    for index, step in enumerate(steps):
+        inputs = set(step_files[step][0])
+        dependencies[step] = [earlier for earlier in steps[:index]
+                              if inputs & set(step_files[earlier][1])]
+
+    return dependencies
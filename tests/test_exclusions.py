@@ -0,0 +1,203 @@
+"""
+Tests that the exclusions written straight into the GLAES availability array
+match the ones GLAES makes itself, and that the private state is only used
+with supported GLAES versions.
+
+The tests marked as needing GLAES are skipped when it is not installed.
+"""
+from types import SimpleNamespace
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from scipy.ndimage import binary_dilation, binary_erosion
+from shapely.geometry import box
+
+import exclusions
+from exclusions import (exclude_clc_classes, exclude_coast, get_availability,
+                        get_base_exclusions, get_item_coords, restore_base_exclusions,
+                        set_availability)
+
+EPSG = 32736
+PIXEL_SIZE = 100
+# Top left corner of the fixture rasters, on the 100 m GLAES grid
+ORIGIN = (500000, 9000000)
+
+
+def make_land_cover(path, width=40, height=30, seed=0):
+    """
+    Saves a land cover raster on the GLAES grid with a few classes, and
+    returns its pixels.
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.choice([20, 40, 50, 80, 90], size=(height, width)).astype(np.uint8)
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1,
+                       dtype='uint8', crs=f'EPSG:{EPSG}', nodata=255,
+                       transform=from_origin(*ORIGIN, PIXEL_SIZE, PIXEL_SIZE)) as dest:
+        dest.write(data, 1)
+
+    return data
+
+def make_calculator(col, row, width, height):
+    """
+    Makes a stand-in for a GLAES exclusion calculator covering part of the
+    fixture grid, recording calls to the GLAES exclusion methods.
+    """
+    x_min = ORIGIN[0] + col * PIXEL_SIZE
+    y_max = ORIGIN[1] - row * PIXEL_SIZE
+    extent = SimpleNamespace(xMin=x_min, xMax=x_min + width * PIXEL_SIZE,
+                             yMin=y_max - height * PIXEL_SIZE, yMax=y_max)
+    calls = []
+    return SimpleNamespace(
+        region=SimpleNamespace(extent=extent, mask=np.ones((height, width), dtype=bool)),
+        _availability=np.full((height, width), 100.0),
+        _itemCoords=np.array([[x_min + 50, y_max - 50]]),
+        excludeRasterType=lambda *args, **kwargs: calls.append(('raster', args, kwargs)),
+        excludeVectorType=lambda *args, **kwargs: calls.append(('vector', args, kwargs)),
+        calls=calls,
+    )
+
+@pytest.fixture
+def glaes_version(monkeypatch):
+    """
+    Sets the GLAES version seen by the exclusion helpers.
+    """
+    def set_version(version):
+        monkeypatch.setattr(exclusions, '_get_glaes_version', lambda: version)
+
+    set_version('1.2.1')
+    return set_version
+
+def test_direct_clc_exclusion_reads_matching_window(tmp_path, glaes_version):
+    grid_path = str(tmp_path / 'clc_glaes.tif')
+    data = make_land_cover(grid_path)
+    ec = make_calculator(col=5, row=4, width=20, height=15)
+
+    exclude_clc_classes(ec, 'unused.tif', [40, 50], grid_path)
+
+    expected = np.where(np.isin(data[4:19, 5:25], [40, 50]), 0, 100.0)
+    np.testing.assert_array_equal(ec._availability, expected)
+    assert ec.calls == []
+
+def test_misaligned_grid_uses_glaes(tmp_path, glaes_version):
+    grid_path = str(tmp_path / 'clc_glaes.tif')
+    make_land_cover(grid_path)
+    ec = make_calculator(col=5, row=4, width=20, height=15)
+    ec.region.extent.xMin += PIXEL_SIZE / 2
+    ec.region.extent.xMax += PIXEL_SIZE / 2
+
+    exclude_clc_classes(ec, 'clc.tif', [40, 50], grid_path)
+
+    assert (ec._availability == 100).all()
+    assert [call[2]['value'] for call in ec.calls] == [40, 50]
+
+def test_unsupported_glaes_version_uses_glaes(tmp_path, glaes_version):
+    grid_path = str(tmp_path / 'clc_glaes.tif')
+    make_land_cover(grid_path)
+    ec = make_calculator(col=0, row=0, width=40, height=30)
+    glaes_version('2.0.0')
+
+    exclude_clc_classes(ec, 'clc.tif', [40], grid_path)
+
+    assert (ec._availability == 100).all()
+    assert len(ec.calls) == 1
+    with pytest.raises(RuntimeError):
+        get_availability(ec)
+    with pytest.raises(RuntimeError):
+        set_availability(ec, np.zeros((30, 40)))
+    assert get_item_coords(ec) is None
+
+def test_set_availability_copies(glaes_version):
+    ec = make_calculator(col=0, row=0, width=4, height=3)
+    base = get_availability(ec).copy()
+    base[0, 0] = 0
+
+    set_availability(ec, base)
+    base[1, 1] = 0
+
+    assert ec._availability[0, 0] == 0
+    assert ec._availability[1, 1] == 100
+    with pytest.raises(ValueError):
+        set_availability(ec, np.zeros((2, 2)))
+
+@pytest.mark.parametrize('version, supported', [('1.2', True), ('1.2.1', True), ('1.20.0', False),
+                                                ('1.3.0', False), ('11.2', False), (None, False)])
+def test_glaes_versions(glaes_version, version, supported):
+    ec = make_calculator(col=0, row=0, width=4, height=3)
+    glaes_version(version)
+
+    assert (get_base_exclusions(ec) is not None) == supported
+    assert (get_item_coords(ec) is not None) == supported
+
+def test_restore_base_exclusions(glaes_version):
+    ec = make_calculator(col=0, row=0, width=4, height=3)
+    new_calculators = []
+
+    def make_calculator_again():
+        new_calculators.append(make_calculator(col=0, row=0, width=4, height=3))
+        return new_calculators[-1]
+
+    base = get_base_exclusions(ec)
+    ec._availability[:] = 0
+    assert restore_base_exclusions(ec, base, make_calculator_again) is ec
+    assert (ec._availability == 100).all()
+    assert new_calculators == []
+
+    # Other GLAES versions get a new calculator with the base exclusions
+    glaes_version('2.0.0')
+    assert get_base_exclusions(ec) is None
+    assert restore_base_exclusions(ec, None, make_calculator_again) is new_calculators[0]
+
+def make_region(tmp_path):
+    """
+    Saves a region on the fixture grid, with an ocean along its southern
+    edge, and returns their paths and the region's bounds.
+    """
+    bounds = (ORIGIN[0] + 500, ORIGIN[1] - 2500, ORIGIN[0] + 3500, ORIGIN[1] - 500)
+    region_path = str(tmp_path / 'region.geojson')
+    gpd.GeoDataFrame(geometry=[box(*bounds)], crs=EPSG).to_file(region_path, driver='GeoJSON')
+    oceans = gpd.GeoDataFrame(geometry=[box(ORIGIN[0], ORIGIN[1] - 3000,
+                                            ORIGIN[0] + 4000, ORIGIN[1] - 2150)], crs=EPSG)
+    oceans_path = str(tmp_path / 'oceans.geojson')
+    oceans.to_crs(4326).to_file(oceans_path, driver='GeoJSON')
+
+    return region_path, oceans, oceans_path, bounds
+
+def test_clc_exclusion_matches_glaes(tmp_path):
+    gl = pytest.importorskip('glaes.glaes')
+    clc_path = str(tmp_path / 'clc.tif')
+    make_land_cover(clc_path)
+    region_path, _, _, _ = make_region(tmp_path)
+
+    direct = gl.ExclusionCalculator(region_path, srs=EPSG, pixelSize=PIXEL_SIZE)
+    exclude_clc_classes(direct, clc_path, [40, 50, 80], grid_clc_path=clc_path)
+    warped = gl.ExclusionCalculator(region_path, srs=EPSG, pixelSize=PIXEL_SIZE)
+    exclude_clc_classes(warped, clc_path, [40, 50, 80])
+
+    np.testing.assert_array_equal(get_availability(direct), get_availability(warped))
+
+def test_coast_exclusion_matches_glaes(tmp_path):
+    gl = pytest.importorskip('glaes.glaes')
+    from oceans import save_coast_distance
+
+    region_path, oceans, oceans_path, bounds = make_region(tmp_path)
+    distance_path = str(tmp_path / 'coast_distance.tif')
+    save_coast_distance(oceans, distance_path, bounds, EPSG, pixel_size=PIXEL_SIZE)
+
+    direct = gl.ExclusionCalculator(region_path, srs=EPSG, pixelSize=PIXEL_SIZE)
+    exclude_coast(direct, oceans_path, 250, distance_path)
+    buffered = gl.ExclusionCalculator(region_path, srs=EPSG, pixelSize=PIXEL_SIZE)
+    exclude_coast(buffered, oceans_path, 250)
+
+    with rasterio.open(distance_path) as src:
+        distance = src.read(1, window=exclusions._get_glaes_window(src, direct))
+    excluded = distance <= 250
+    assert excluded.any() and not excluded.all()
+
+    # The saved distances are accurate to about half a pixel, so pixels may
+    # only differ within one pixel of the edge of the buffer
+    edge = binary_dilation(excluded) & ~binary_erosion(excluded, border_value=1)
+    differs = get_availability(direct) != get_availability(buffered)
+    assert not (differs & ~binary_dilation(edge)).any()
@@ -0,0 +1,44 @@
+"""
+Tests that ocean polygons clipped by OceanProvider match clipping the whole
+layer, as was done before.
+"""
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from oceans import OceanProvider
+
+
+def make_oceans(path, spatial_index=True):
+    """
+    Saves a GeoPackage of ocean polygons in a projected CRS, with a gap in
+    the feature IDs.
+    """
+    oceans = gpd.GeoDataFrame(
+        {'name': [f"Sea {i}" for i in range(6)], 'area_km2': [float(i) for i in range(6)]},
+        geometry=[box(200000 * i, 9000000, 200000 * i + 150000, 9300000) for i in range(6)],
+        crs=32736)
+    oceans.to_file(path, driver='GPKG', layer='oceans', SPATIAL_INDEX='YES' if spatial_index else 'NO')
+
+    return oceans
+
+@pytest.mark.parametrize('spatial_index', [True, False])
+def test_clip_matches_whole_layer(tmp_path, spatial_index):
+    ocean_path = str(tmp_path / 'oceans.gpkg')
+    make_oceans(ocean_path, spatial_index)
+    provider = OceanProvider(ocean_path)
+    areas = [gpd.GeoSeries([box(180000, 9100000, 420000, 9200000)], crs=32736),
+             gpd.GeoSeries([box(380000, 9050000, 900000, 9150000)], crs=32736)]
+
+    for area in areas:
+        baseline = gpd.read_file(ocean_path).to_crs(epsg=4326).clip(area.to_crs(epsg=4326))
+        clipped = provider.clip(area)
+
+        assert list(clipped.columns) == list(baseline.columns)
+        assert list(clipped['name']) == list(baseline['name'])
+        assert clipped.geom_equals_exact(baseline.geometry, 1e-9, align=False).all()
+
+        # No feature IDs are saved with the clipped polygons
+        output_path = tmp_path / 'clipped.geojson'
+        clipped.to_file(output_path, driver='GeoJSON')
+        assert list(gpd.read_file(output_path).columns) == ['name', 'area_km2', 'geometry']
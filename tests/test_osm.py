@@ -0,0 +1,54 @@
+"""
+Tests that simplified OSM layers never have more features or vertices than
+the classes kept from them.
+"""
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+from osm import simplify_osm_layer
+
+EPSG = 32736
+
+
+def make_roads(path, seed=0):
+    """
+    Saves a layer of roads in EPSG 4326 within one 50 km tile, made of
+    chains of short segments, as OSM roads are split at junctions, and of
+    straight roads crossing each other.
+    """
+    rng = np.random.default_rng(seed)
+    geometries, fclasses = [], []
+    for chain in range(20):
+        start = rng.uniform([410000, 9010000], [440000, 9040000])
+        steps = rng.normal(0, 100, size=(25, 2)) + rng.uniform(-150, 150, 2)
+        vertices = start + np.cumsum(steps, axis=0)
+        for i in range(0, 24, 3):
+            geometries.append(LineString(vertices[i:i + 4]))
+            fclasses.append('primary' if chain % 2 else 'residential')
+    # Straight roads that all cross each other, which noding would split
+    for offset in np.linspace(5000, 45000, 6):
+        geometries.append(LineString([(400000, 9000000 + offset), (449000, 9000000 + offset)]))
+        geometries.append(LineString([(400000 + offset, 9000000), (400000 + offset, 9049000)]))
+        fclasses.extend(['primary', 'primary'])
+    roads = gpd.GeoDataFrame({'osm_id': range(len(geometries)), 'fclass': fclasses},
+                             geometry=geometries, crs=EPSG)
+    roads.to_crs(epsg=4326).to_file(path, driver='GPKG')
+
+    return roads
+
+@pytest.mark.parametrize('tolerance', [0, 10, 200])
+@pytest.mark.parametrize('fclasses', [None, ['primary']])
+def test_simplified_layer_is_never_larger(tmp_path, tolerance, fclasses):
+    input_path = str(tmp_path / 'roads.gpkg')
+    make_roads(input_path)
+
+    report = simplify_osm_layer(input_path, str(tmp_path / 'roads_simplified.gpkg'), EPSG,
+                                tolerance, fclasses)
+
+    assert report['features_after'] <= report['features_kept'] <= report['features_before']
+    assert report['vertices_after'] <= report['vertices_kept'] <= report['vertices_before']
+    # Segments of each chain are joined end to end
+    assert report['features_after'] < report['features_kept']
+    assert report['max_distance_error_m'] <= tolerance + 1e-6
@@ -0,0 +1,52 @@
+"""
+Tests that placements are counted in each hexagon as a spatial join counts
+them.
+"""
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Polygon
+
+import prep_after_spider
+from prep_after_spider import count_points_by_variant
+
+EPSG = 32736
+
+
+def make_hexagons(rows=6, cols=8, size=1000):
+    """
+    Makes a grid of touching flat-topped hexagons that are not H3 cells.
+    """
+    angles = np.radians(np.arange(0, 360, 60))
+    hexagons = []
+    for row in range(rows):
+        for col in range(cols):
+            x = 500000 + col * 1.5 * size
+            y = 9000000 + (row + (col % 2) / 2) * np.sqrt(3) * size
+            hexagons.append(Polygon(zip(x + size * np.cos(angles), y + size * np.sin(angles))))
+
+    return gpd.GeoDataFrame({'name': range(len(hexagons))}, geometry=hexagons, crs=EPSG,
+                            index=np.arange(len(hexagons)) * 10)
+
+def test_non_h3_counts_match_spatial_join(monkeypatch):
+    # Count in several chunks
+    monkeypatch.setattr(prep_after_spider, 'CHUNK_SIZE', 700)
+    hex = make_hexagons()
+    x_min, y_min, x_max, y_max = hex.total_bounds
+    rng = np.random.default_rng(0)
+    points_by_variant = {}
+    for variant, n in [('wind', 3000), ('pv', 5000)]:
+        coords = np.column_stack([rng.uniform(x_min - 500, x_max + 500, n),
+                                  rng.uniform(y_min - 500, y_max + 500, n)])
+        # Include points on the shared corners of hexagons
+        coords[:50] = np.asarray(hex.geometry.iloc[0].exterior.coords)[:6].repeat(9, axis=0)[:50]
+        points_by_variant[variant] = (coords, f"EPSG:{EPSG}")
+
+    counts = count_points_by_variant(hex, points_by_variant)
+
+    for variant, (coords, crs) in points_by_variant.items():
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(coords[:, 0], coords[:, 1]), crs=crs)
+        expected = (gpd.sjoin(points, hex, how='inner', predicate='within')
+                    .groupby('index_right').size()
+                    .reindex(hex.index, fill_value=0))
+        np.testing.assert_array_equal(counts[variant].to_numpy(), expected.to_numpy())
+        assert counts.index.equals(hex.index)
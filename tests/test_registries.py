@@ -0,0 +1,54 @@
+"""
+Tests that a global registry is split between countries.
+"""
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from boundaries import Boundaries
+from registries import split_registry
+
+
+def make_paths(tmp_path):
+    """
+    Makes the output folders used by write_registry().
+    """
+    paths = {'spider_prep_data': tmp_path / 'spider', 'geox_final_data': tmp_path / 'geox'}
+    for path in paths.values():
+        path.mkdir()
+
+    return {name: str(path) for name, path in paths.items()}
+
+def make_boundaries():
+    """
+    Makes the boundaries of two countries side by side.
+    """
+    frame = gpd.GeoDataFrame(geometry=[box(30, -5, 35, 0), box(35, -5, 40, 0)], crs=4326,
+                             index=['Testland', 'Otherland'])
+
+    return Boundaries(frame)
+
+def test_split_registry(tmp_path):
+    csv_path = tmp_path / 'registry.csv'
+    csv_path.write_text("name,lat,lon,capacity,head\n"
+                        "A,-2,31,10,50\n"
+                        "B,-3,32,20,60\n"
+                        "C,-2,37,30,\n")
+
+    saved = split_registry(str(csv_path), 'hydro', make_boundaries(), ['Testland', 'Otherland'],
+                           make_paths(tmp_path), chunksize=2)
+
+    assert saved == ['Testland']
+    plants = gpd.read_file(tmp_path / 'spider' / 'Testland_hydropower_dams.gpkg')
+    assert list(plants['name']) == ['A', 'B']
+
+@pytest.mark.parametrize('text', ['', 'name,lat,lon,capacity,head\n'])
+def test_split_empty_registry(tmp_path, text):
+    csv_path = tmp_path / 'registry.csv'
+    csv_path.write_text(text)
+
+    saved = split_registry(str(csv_path), 'hydro', make_boundaries(), ['Testland'],
+                           make_paths(tmp_path))
+
+    assert saved == []
+    assert not list((tmp_path / 'spider').iterdir())
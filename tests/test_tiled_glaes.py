@@ -0,0 +1,17 @@
+"""
+Tests for stitching the exclusion rasters of tiled GLAES runs.
+"""
+import pytest
+
+pytest.importorskip('glaes.glaes')
+
+from tiled_glaes import stitch_exclusions  # noqa: E402
+
+
+def test_stitch_without_tile_rasters(tmp_path):
+    tiles = [{'core': (500000, 9000000, 510000, 9010000)}]
+    output_path = tmp_path / 'exclusions.tif'
+
+    with pytest.raises(ValueError, match="No tile has an exclusion raster"):
+        stitch_exclusions(tiles, [None], str(output_path), (500000, 9000000, 510000, 9010000))
+    assert not output_path.exists()
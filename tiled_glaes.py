@@ -0,0 +1,375 @@
+"""
+A file used for running GLAES exclusions and placements on overlapping tiles
+of a country, so that very large countries fit in memory and use several
+processes.
+
+Each tile is run on its core area plus an overlap on every side, so that
+buffers and placements near the tile edge match those of a single run. The
+exclusion rasters are stitched from the tile cores, and placements are kept
+from the tile whose core holds them. Placements closer than the separation
+across a tile border are then thinned out.
+
+Contains calculating_exclusions_tiled(), make_tiles(), remove_seam_conflicts(),
+run_tile() and stitch_exclusions().
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+
+import geopandas as gpd
+import glaes.glaes as gl
+import numpy as np
+import rasterio
+from rasterio.windows import from_bounds
+from scipy.spatial import cKDTree
+from shapely.geometry import box
+
+from clc import get_clc_path, get_glaes_grid
+from exclusions import (exclude_clc_classes, exclude_coast, get_base_exclusions,
+                        restore_base_exclusions)
+from placements import PV_SEPARATION, get_placement_coords, save_placements
+from profiling import stage
+
+
+def make_tiles(country_utm, tile_size, overlap, pixel_size=100):
+    """
+    Splits a country into square tiles on the GLAES pixel grid.
+
+    ...
+    Parameters
+    ----------
+    country_utm : geodataframe
+        Country boundaries in its UTM CRS.
+    tile_size : float
+        Width and height of the tile cores in meters. Rounded to whole pixels.
+    overlap : float
+        Distance in meters that each tile extends past its core.
+    pixel_size : integer
+        Pixel size in meters used by GLAES.
+
+    Returns
+    -------
+    tiles : list
+        One dictionary per tile, with the 'core' bounds and the 'region'
+        geometry to run GLAES on. Tiles outside the country have no region.
+    """
+    transform, width, height = get_glaes_grid(country_utm.total_bounds, pixel_size)
+    minx, maxy = transform.c, transform.f
+    maxx, miny = minx + width * pixel_size, maxy - height * pixel_size
+    tile_size = max(1, int(round(tile_size / pixel_size))) * pixel_size
+    country = country_utm.union_all()
+
+    tiles = []
+    for top in np.arange(maxy, miny, -tile_size):
+        for left in np.arange(minx, maxx, tile_size):
+            core = (left, max(top - tile_size, miny), min(left + tile_size, maxx), top)
+            region = box(*core).buffer(overlap, join_style=2).intersection(country)
+            # Only run tiles whose core touches the country
+            if not box(*core).intersects(country) or region.is_empty:
+                region = None
+            tiles.append({'core': core, 'region': region})
+
+    return tiles
+
+def run_tile(region_path, tile_path, glaes_data_path, country_name, EPSG,
+             turbine_radius, wind_slope_path=None, pv_slope_path=None,
+             coast_buffer=250):
+    """
+    Calculates exclusions and placements for one tile. Used as the target of
+    the worker processes.
+
+    The steps are the same as calculating_exclusions() in
+    prep_before_spider.py, with the optional slope exclusions of
+    calculating_exclusions_slope_exclusion_included().
+
+    ...
+    Parameters
+    ----------
+    region_path : string
+        Path to the GeoJSON file of the tile's region.
+    tile_path : string
+        Path to the folder to save the tile's outputs to.
+    glaes_data_path : string
+        Path to the folder of the GLAES input files.
+    country_name : string
+        Name of country for file names.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    turbine_radius : integer
+        Turbine radius in meters used for spacing.
+    wind_slope_path : string
+        Path to the Slope-Exclusion output for wind. Default is None.
+    pv_slope_path : string
+        Path to the Slope-Exclusion output for PV. Default is None.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
+
+    Returns
+    -------
+    outputs : dictionary
+        Paths to the tile's exclusion rasters, and the coordinates of its
+        turbine and PV placements.
+    """
+    clc_path = get_clc_path(glaes_data_path, country_name)
+    grid_clc_path = os.path.join(glaes_data_path, f'{country_name}_CLC_glaes.tif')
+    if not os.path.isfile(grid_clc_path):
+        grid_clc_path = None
+    coast_distance_path = os.path.join(glaes_data_path, f'{country_name}_coast_distance.tif')
+    if not os.path.isfile(coast_distance_path):
+        coast_distance_path = None
+    outputs = {
+        'wind_exclusions': os.path.join(tile_path, 'wind_exclusions.tif'),
+        'pv_exclusions': os.path.join(tile_path, 'pv_exclusions.tif'),
+    }
+
+    def make_base_calculator():
+        ec = gl.ExclusionCalculator(region_path, srs=EPSG, pixelSize=100)
+        exclude_coast(ec, os.path.join(glaes_data_path, f'{country_name}_oceans.geojson'),
+                      coast_buffer, coast_distance_path)
+        exclude_clc_classes(ec, clc_path, [90, 50, 80], grid_clc_path)
+
+        return ec
+
+    ec = make_base_calculator()
+    base_availability = get_base_exclusions(ec)
+
+    if wind_slope_path is not None:
+        ec.excludeRasterType(wind_slope_path, value=1, prewarp=True)
+    ec.save(outputs['wind_exclusions'], overwrite=True)
+    turbine_path = os.path.join(tile_path, 'turbine_placements.shp')
+    ec.distributeItems(separation=(turbine_radius * 10, turbine_radius * 5), axialDirection=45,
+                       output=turbine_path)
+    outputs['turbines'] = get_placement_coords(ec, turbine_path)
+
+    ec = restore_base_exclusions(ec, base_availability, make_base_calculator)
+    if pv_slope_path is not None:
+        ec.excludeRasterType(pv_slope_path, value=1, prewarp=True)
+    exclude_clc_classes(ec, clc_path, [40], grid_clc_path)
+    ec.save(outputs['pv_exclusions'], overwrite=True)
+    pv_path = os.path.join(tile_path, 'pv_placements.shp')
+    ec.distributeItems(separation=PV_SEPARATION, output=pv_path)
+    outputs['pv'] = get_placement_coords(ec, pv_path)
+
+    return outputs
+
+def stitch_exclusions(tiles, tile_rasters, output_path, bounds, pixel_size=100):
+    """
+    Stitches the cores of the tile exclusion rasters into one raster on the
+    country's GLAES grid, one tile at a time. Raises a ValueError if no tile
+    has a raster, e.g. when every tile is outside the country.
+
+    ...
+    Parameters
+    ----------
+    tiles : list
+        Tiles as made by make_tiles().
+    tile_rasters : list
+        Path to each tile's exclusion raster, or None for tiles that were not
+        run.
+    output_path : string
+        Path to save the stitched raster to.
+    bounds : array
+        Bounds of the country as (minx, miny, maxx, maxy) in its UTM CRS.
+    pixel_size : integer
+        Pixel size in meters used by GLAES.
+    """
+    rasters = [path for path in tile_rasters if path is not None]
+    if not rasters:
+        raise ValueError(f"No tile has an exclusion raster to stitch into {output_path}. "
+                         "Check that the tiles overlap the country.")
+    transform, width, height = get_glaes_grid(bounds, pixel_size)
+
+    with rasterio.open(rasters[0]) as src:
+        out_meta = src.meta.copy()
+    nodata = out_meta['nodata'] if out_meta['nodata'] is not None else 0
+    out_meta.update({'transform': transform, 'width': width, 'height': height,
+                     'nodata': nodata, 'compress': 'deflate'})
+
+    with rasterio.open(output_path, 'w', **out_meta) as dest:
+        for tile, tile_raster in zip(tiles, tile_rasters):
+            window = from_bounds(*tile['core'], transform=transform).round_offsets().round_lengths()
+            if tile_raster is None:
+                data = np.full((window.height, window.width), nodata, dtype=out_meta['dtype'])
+            else:
+                with rasterio.open(tile_raster) as src:
+                    src_window = from_bounds(*tile['core'], transform=src.transform)
+                    src_window = src_window.round_offsets().round_lengths()
+                    data = src.read(1, window=src_window, boundless=True, fill_value=nodata)
+            dest.write(data, 1, window=window)
+
+def remove_seam_conflicts(coords, tile_ids, separation):
+    """
+    Removes placements that are closer than the separation to a placement of
+    an earlier tile. Placements of the same tile are already spaced by GLAES,
+    so only pairs across tile borders are checked.
+
+    ...
+    Parameters
+    ----------
+    coords : array
+        Placement coordinates as an (n, 2) array of x and y.
+    tile_ids : array
+        Index of the tile each placement is from.
+    separation : float
+        Minimum distance in meters between placements.
+
+    Returns
+    -------
+    keep : array
+        Boolean mask of the placements to keep.
+    """
+    keep = np.ones(len(coords), dtype=bool)
+    if len(coords) < 2:
+        return keep
+
+    pairs = cKDTree(coords).query_pairs(r=separation, output_type='ndarray')
+    pairs = pairs[tile_ids[pairs[:, 0]] != tile_ids[pairs[:, 1]]]
+    # Visit pairs in a fixed order, dropping the placement from the later tile
+    # unless the pair is already resolved
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    for i, j in pairs:
+        if keep[i] and keep[j]:
+            if tile_ids[i] > tile_ids[j]:
+                keep[i] = False
+            else:
+                keep[j] = False
+
+    return keep
+
+def _gather_placements(tiles, tile_outputs, key):
+    """
+    Gets the placements of each tile that lie within its core.
+
+    ...
+    Parameters
+    ----------
+    tiles : list
+        Tiles as made by make_tiles().
+    tile_outputs : list
+        Outputs of run_tile() for each tile, or None for tiles not run.
+    key : string
+        'turbines' or 'pv'.
+
+    Returns
+    -------
+    coords : array
+        Placement coordinates as an (n, 2) array of x and y.
+    tile_ids : array
+        Index of the tile each placement is from.
+    """
+    coords, tile_ids = [], []
+    for tile_id, (tile, outputs) in enumerate(zip(tiles, tile_outputs)):
+        if outputs is None or len(outputs[key]) == 0:
+            continue
+        points = outputs[key]
+        minx, miny, maxx, maxy = tile['core']
+        # Half-open bounds, so a point on a shared border has one tile
+        in_core = ((points[:, 0] >= minx) & (points[:, 0] < maxx)
+                   & (points[:, 1] > miny) & (points[:, 1] <= maxy))
+        coords.append(points[in_core])
+        tile_ids.append(np.full(in_core.sum(), tile_id))
+
+    if not coords:
+        return np.empty((0, 2)), np.empty(0, dtype=int)
+
+    return np.concatenate(coords), np.concatenate(tile_ids)
+
+def calculating_exclusions_tiled(glaes_data_path, country_name, EPSG,
+                                 glaes_processed_path, turbine_radius,
+                                 placement_format='geojson', tile_size=200000,
+                                 overlap=5000, workers=1,
+                                 wind_slope_path=None, pv_slope_path=None,
+                                 coast_buffer=250):
+    """
+    Calculating exclusions using GLAES on overlapping tiles of the country.
+
+    Saves the same exclusion rasters and placement Shapefiles as
+    calculating_exclusions() in prep_before_spider.py.
+
+    ...
+    Parameters
+    ----------
+    glaes_data_path : string
+        Path to the folder where some files will be saved.
+    country_name : string
+        Name of country for file names.
+    EPSG : integer
+        EPSG code of the country's UTM zone.
+    glaes_processed_path : string
+        Path to the folder where some files will be saved.
+    turbine_radius : integer
+        Turbine radius in meters used for spacing.
+    placement_format : string
+        Format to also save placements in, from formats.FORMATS. Default is
+        'geojson', which only saves the Shapefiles.
+    tile_size : float
+        Width and height of the tile cores in meters. Default is 200000.
+    overlap : float
+        Distance in meters that each tile extends past its core. Should be
+        more than the turbine separation and the coast buffer. Default is
+        5000.
+    workers : integer
+        Number of tiles to run at the same time in separate processes.
+        Default is 1.
+    wind_slope_path : string
+        Path to the Slope-Exclusion output for wind. Default is None, which
+        does not apply slope exclusions.
+    pv_slope_path : string
+        Path to the Slope-Exclusion output for PV. Default is None.
+    coast_buffer : float
+        Distance in meters from the oceans to exclude. Default is 250.
+    """
+    country_utm = gpd.read_file(os.path.join(glaes_data_path, f'{country_name}.geojson'))
+    tiles = make_tiles(country_utm, tile_size, overlap)
+    tile_folder = os.path.join(glaes_processed_path, f'{country_name}_tiles')
+    os.makedirs(tile_folder, exist_ok=True)
+
+    print(f" - Splitting country into {sum(tile['region'] is not None for tile in tiles)} tiles...")
+    jobs = {}
+    for tile_id, tile in enumerate(tiles):
+        if tile['region'] is None:
+            continue
+        tile_path = os.path.join(tile_folder, f'tile_{tile_id}')
+        os.makedirs(tile_path, exist_ok=True)
+        region_path = os.path.join(tile_path, 'region.geojson')
+        gpd.GeoDataFrame(geometry=[tile['region']], crs=country_utm.crs).to_file(region_path, driver='GeoJSON')
+        jobs[tile_id] = (region_path, tile_path, glaes_data_path, country_name, EPSG,
+                         turbine_radius, wind_slope_path, pv_slope_path, coast_buffer)
+
+    print(" - Calculating exclusions and placements for each tile...")
+    tile_outputs = [None] * len(tiles)
+    with stage('tiles'):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {tile_id: executor.submit(run_tile, *job) for tile_id, job in jobs.items()}
+                for tile_id, future in futures.items():
+                    tile_outputs[tile_id] = future.result()
+        else:
+            for tile_id, job in jobs.items():
+                tile_outputs[tile_id] = run_tile(*job)
+
+    for gen, key, separation in (('wind', 'turbines', turbine_radius * 10),
+                                 ('pv', 'pv', PV_SEPARATION)):
+        print(f" - Stitching excluded areas for {gen} into a .tif file...")
+        exclusions_path = os.path.join(glaes_processed_path, f'{country_name}_{gen}_exclusions.tif')
+        with stage(f'stitch_{gen}_exclusions', outputs=[exclusions_path]):
+            stitch_exclusions(tiles, [None if outputs is None else outputs[f'{gen}_exclusions']
+                                      for outputs in tile_outputs],
+                              exclusions_path, country_utm.total_bounds)
+
+        # Turbines are checked against the longer of their two separations,
+        # so spacing holds across borders in every direction
+        print(f" - Removing {gen} placements too close across tile borders...")
+        coords, tile_ids = _gather_placements(tiles, tile_outputs, key)
+        keep = remove_seam_conflicts(coords, tile_ids, separation)
+        print(f" - Removed {len(keep) - keep.sum()} of {len(keep)} {gen} placements")
+
+        name = 'turbine' if gen == 'wind' else 'pv'
+        placements_path = os.path.join(glaes_processed_path, f'{country_name}_{name}_placements.shp')
+        placements = gpd.GeoDataFrame(geometry=gpd.points_from_xy(coords[keep, 0], coords[keep, 1]),
+                                      crs=f"EPSG:{EPSG}")
+        with stage(f'save_{name}_placements', outputs=[placements_path]):
+            placements.to_file(placements_path)
+            save_placements(None, placements_path, EPSG, placement_format, coords[keep])
+
+    shutil.rmtree(tile_folder)
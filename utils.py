@@ -5,8 +5,11 @@
 
 A simple file used for shared functions.
 
-Contains clean_country_name().
+Contains clean_country_name(), get_paths() and link_or_copy().
 """
+import os
+import shutil
+
 from unidecode import unidecode
 
 def clean_country_name(country_name):
@@ -25,4 +28,62 @@ def clean_country_name(country_name):
     country_name_clean = country_name_clean.replace(".", "")
     country_name_clean = country_name_clean.replace("'", "")
 
-    return country_name_clean
\ No newline at end of file
+    return country_name_clean
+
+def link_or_copy(source_path, destination_path):
+    """
+    Makes a file available at a second path, as a hard link if possible so
+    that it is not written twice, or as a copy otherwise, e.g. across drives.
+
+    ...
+    Parameters
+    ----------
+    source_path : string
+        Path to the existing file.
+    destination_path : string
+        Path to make the file available at. Any existing file is replaced.
+    """
+    if os.path.lexists(destination_path):
+        os.remove(destination_path)
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        shutil.copy2(source_path, destination_path)
+
+def get_paths(dirname):
+    """
+    Gets paths to the input files and output folders used by the data prep
+    scripts.
+
+    ...
+    Parameters
+    ----------
+    dirname : string
+        Path to the top-level folder of the repository.
+
+    Returns
+    -------
+    paths : dictionary
+        Paths to input files and output folders.
+    """
+    data_path = os.path.join(dirname, 'data')
+
+    return {
+        'data': data_path,
+        'region': os.path.join(data_path, 'ne_50m_admin_0_countries', 'ne_50m_admin_0_countries.shp'),
+        'clc_raster': os.path.join(data_path, "PROBAV_LC100_global_v3.0.1_2019-nrt_Discrete-Classification-map_EPSG-4326.tif"),
+        'ocean': os.path.join(data_path, "GOaS_v1_20211214_gpkg", "goas_v01.gpkg"),
+        'OSM': os.path.join(data_path, "OSM"),
+        # config_name = "Country_config_hydro.yml" if args.hydro else "Country_config.yml"
+        'config_input_file': os.path.join(dirname, "inputs_spider", "Country_config.yml"),
+        'slope_exclusion_output': os.path.join(dirname, "Slope-Exclusion", "output"),
+        'glaes_data': os.path.join(dirname, 'glaes', 'glaes', 'data'),
+        'spider_prep_data': os.path.join(dirname, 'ccg-spider', 'prep', 'data'),
+        'glaes_processed': os.path.join(dirname, 'inputs_glaes', 'processed'),
+        'glaes_preview': os.path.join(dirname, 'inputs_glaes', 'preview'),
+        'spider_prep': os.path.join(dirname, "ccg-spider", "prep"),
+        'geox_final_data': os.path.join(dirname, "inputs_geox/final_data"),
+        'geox_preview': os.path.join(dirname, "inputs_geox", "preview"),
+        'logs': os.path.join(dirname, "logs"),
+        'manifests': os.path.join(dirname, "manifests"),
+    }
@@ -0,0 +1,387 @@
+"""
+A file used for running country jobs in one long-lived worker process, so
+that the global datasets are loaded once instead of once per job.
+
+The worker imports GLAES, GDAL and geopandas, reads the Natural Earth
+boundaries and the world dataset with their spatial indexes, opens the GOAS
+GeoPackage and keeps the global CLC raster open. Jobs for the before- and
+after-SPIDER stages are then sent to it over a local socket, and run one at a
+time from a queue. Each job's output is written to its own log file, and its
+status and stage timings can be asked for at any time.
+
+The socket only listens on this machine, and the worker's address and a
+random key are saved to a file that only the current user can read. Clients
+need the key to connect.
+
+Only the standard library is imported at the top, so that submitting jobs
+and asking for their status start quickly.
+
+Contains JOB_KINDS, WorkerService and send_request().
+"""
+from contextlib import redirect_stderr, redirect_stdout
+import importlib
+import json
+from multiprocessing.connection import Client, Listener
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+# Kinds of job the worker runs: prepare_country() before SPIDER, and
+# combine_country() and finalise_country() after it
+JOB_KINDS = ['before', 'after']
+
+# Modules imported during warm-up, so that no job pays for them
+WARM_MODULES = ['glaes.glaes', 'osgeo.gdal', 'prep_after_spider', 'prep_before_spider']
+
+
+class WorkerService:
+    """
+    Holds the global datasets and the queue of country jobs for one worker
+    process.
+
+    ...
+    Attributes
+    ----------
+    dirname : string
+        Path to the top-level folder of the repository.
+    paths : dictionary
+        Paths to input files and output folders, as made by utils.get_paths().
+    jobs : dictionary
+        Status of each job, keyed by job ID, in the order they were submitted.
+    warm_up_s : dictionary
+        Time in seconds taken to load each global dataset, keyed by name.
+    """
+    def __init__(self, dirname):
+        from utils import get_paths
+
+        self.dirname = dirname
+        self.paths = get_paths(dirname)
+        self.jobs = {}
+        self.warm_up_s = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        # Jobs redirect the output while they run, so service messages are
+        # printed to where the output was at start-up
+        self._stdout = sys.stdout
+
+    def _print(self, message):
+        """
+        Prints a service message, even while a job's output is redirected.
+        """
+        print(message, file=self._stdout, flush=True)
+
+    def warm_up(self):
+        """
+        Imports the heavy libraries and loads the global datasets, timing each.
+        """
+        def timed(name, function):
+            start = time.perf_counter()
+            result = function()
+            self.warm_up_s[name] = time.perf_counter() - start
+            self._print(f" - Loaded {name} in {self.warm_up_s[name]:.1f} s")
+            return result
+
+        self._print("Warming up worker...")
+        timed('imports', self._import_libraries)
+
+        import geopandas as gpd
+        import yaml
+
+        from boundaries import get_boundaries
+        from clc import keep_open
+        from prep_before_spider import get_ocean_provider
+
+        self.boundaries = timed('region', lambda: get_boundaries(self.paths['region'],
+                                                                 index_column='NAME'))
+        self.world = timed('world', lambda: get_boundaries(gpd.datasets.get_path('naturalearth_lowres')))
+        timed('ocean', lambda: get_ocean_provider(self.paths['ocean']))
+        timed('land_cover', lambda: keep_open(self.paths['clc_raster']))
+        with open(self.paths['config_input_file'], 'r') as file:
+            self.config_data = yaml.load(file, Loader=yaml.FullLoader)
+
+    @staticmethod
+    def _import_libraries():
+        """
+        Imports the modules used by the jobs, so that no job pays for them.
+        """
+        for module in WARM_MODULES:
+            importlib.import_module(module)
+
+    def submit(self, kind, country_name, options=None):
+        """
+        Adds a job to the queue.
+
+        ...
+        Parameters
+        ----------
+        kind : string
+            One of JOB_KINDS.
+        country_name : string
+            Name of country as given by the user.
+        options : dictionary
+            For 'before' jobs, keyword arguments passed to
+            prepare_country(). For 'after' jobs, 'iso_code' and keyword
+            arguments passed to combine_country(). Default is None.
+
+        Returns
+        -------
+        job_id : integer
+            ID of the new job.
+        """
+        options = dict(options or {})
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind}. Choose from {JOB_KINDS}.")
+        if kind == 'after' and not options.get('iso_code'):
+            raise ValueError("Please give an 'iso_code' for 'after' jobs.")
+
+        from utils import clean_country_name
+
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            log_path = os.path.join(self.paths['logs'], 'jobs',
+                                    f"{job_id}_{clean_country_name(country_name)}_{kind}.log")
+            self.jobs[job_id] = {
+                'id': job_id, 'kind': kind, 'country': country_name,
+                'options': options, 'state': 'queued', 'log_path': log_path,
+                'submitted': time.time(), 'started': None, 'finished': None,
+                'wall_s': None, 'error': None, 'stages': [],
+            }
+        self._queue.put(job_id)
+
+        return job_id
+
+    def status(self, job_ids=None):
+        """
+        Gets the status of some or all jobs.
+
+        ...
+        Parameters
+        ----------
+        job_ids : list
+            IDs of the jobs. Default is None, which gets all jobs.
+
+        Returns
+        -------
+        jobs : list
+            Copy of the status of each job.
+        """
+        with self._lock:
+            if job_ids is None:
+                job_ids = list(self.jobs)
+            return [dict(self.jobs[job_id]) for job_id in job_ids if job_id in self.jobs]
+
+    def _update(self, job_id, **fields):
+        """
+        Updates the status of a job.
+        """
+        with self._lock:
+            self.jobs[job_id].update(fields)
+
+    def _run_before(self, country_name, options):
+        """
+        Runs prepare_country() for a country.
+        """
+        from placements import TURBINES
+        from prep_before_spider import prepare_country
+        from utils import clean_country_name
+
+        country = self.boundaries.select([clean_country_name(country_name)])
+        prepare_country(country_name, country, self.paths, self.config_data,
+                        TURBINES['NREL_4MW'], **options)
+
+    def _run_after(self, country_name, options):
+        """
+        Runs combine_country() and finalise_country() for a country.
+        """
+        from prep_after_spider import combine_country, finalise_country
+        from profiling import set_context
+        from utils import clean_country_name
+
+        options = dict(options)
+        iso_code = options.pop('iso_code')
+        country_name_clean = clean_country_name(country_name)
+        set_context(country=country_name_clean)
+
+        print(f"Combining GLAES and SPIDER data for {country_name_clean}:")
+        hexagons = combine_country(country_name_clean, self.dirname, **options)
+        print("Done! File saved \n")
+        finalise_country(hexagons, self.world, country_name_clean, iso_code,
+                         self.dirname, options.get('file_format', 'geojson'))
+
+    def _run_job(self, job_id):
+        """
+        Runs one job with its output written to its log file, recording its
+        timings and any error.
+        """
+        from profiling import get_records
+
+        job = self.status([job_id])[0]
+        os.makedirs(os.path.dirname(job['log_path']), exist_ok=True)
+        self._update(job_id, state='running', started=time.time())
+        self._print(f"Started job {job_id}: {job['kind']} {job['country']}")
+
+        # The worker keeps running, so only keep this job's records
+        record_count = len(get_records())
+        run = self._run_before if job['kind'] == 'before' else self._run_after
+        start = time.perf_counter()
+        error = None
+        with open(job['log_path'], 'w', encoding='utf-8') as log_file:
+            with redirect_stdout(log_file), redirect_stderr(log_file):
+                try:
+                    run(job['country'], job['options'])
+                except Exception:
+                    error = traceback.format_exc()
+                    print(error)
+
+        self._update(job_id, state='failed' if error else 'done', finished=time.time(),
+                     wall_s=time.perf_counter() - start, error=error,
+                     stages=get_records()[record_count:])
+        self._print(f"{'Failed' if error else 'Finished'} job {job_id} "
+                    f"(log: {job['log_path']})")
+
+    def _run_jobs(self):
+        """
+        Runs jobs from the queue one at a time until None is taken from it.
+        """
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._run_job(job_id)
+
+    def _handle(self, message):
+        """
+        Handles one request from a client.
+
+        ...
+        Parameters
+        ----------
+        message : dictionary
+            Request with a 'command' of 'ping', 'submit', 'status' or 'stop',
+            and the command's arguments.
+
+        Returns
+        -------
+        reply : dictionary
+            Reply to send back, with an 'error' if the request failed.
+        """
+        command = message.get('command')
+        if command == 'ping':
+            return {'warm_up_s': self.warm_up_s}
+        if command == 'submit':
+            job_ids = [self.submit(message['kind'], country_name, options)
+                       for country_name, options in message['jobs']]
+            return {'job_ids': job_ids}
+        if command == 'status':
+            return {'jobs': self.status(message.get('job_ids'))}
+        if command == 'stop':
+            return {}
+
+        raise ValueError(f"Unknown command {command}.")
+
+    def serve(self, address_path, port=0):
+        """
+        Warms up and then answers requests until a 'stop' request is
+        received. The job running then is finished, and jobs still queued
+        are cancelled.
+
+        ...
+        Parameters
+        ----------
+        address_path : string
+            Path to save the worker's address and key to, for clients.
+        port : integer
+            Port to listen on. Default is 0, which uses any free port.
+        """
+        from profiling import configure
+
+        # Record stage timings for the job status
+        configure()
+        self.warm_up()
+
+        authkey = os.urandom(16)
+        runner = threading.Thread(target=self._run_jobs, daemon=True)
+        runner.start()
+
+        with Listener(('127.0.0.1', port), authkey=authkey) as listener:
+            host, port = listener.address
+            os.makedirs(os.path.dirname(address_path) or '.', exist_ok=True)
+            # Only the current user can read the key
+            file_descriptor = os.open(address_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+                json.dump({'host': host, 'port': port, 'authkey': authkey.hex()}, file)
+            self._print(f"Worker listening on {host}:{port} (address saved to {address_path})")
+
+            try:
+                while True:
+                    try:
+                        connection = listener.accept()
+                    except Exception as error:
+                        # e.g. a client with the wrong key
+                        self._print(f" ! Refused connection: {error}")
+                        continue
+                    with connection:
+                        message = connection.recv()
+                        try:
+                            reply = self._handle(message)
+                        except Exception as error:
+                            reply = {'error': str(error)}
+                        connection.send(reply)
+                    if message.get('command') == 'stop':
+                        break
+            finally:
+                self._cancel_queued()
+                self._queue.put(None)
+                runner.join()
+                if os.path.exists(address_path):
+                    os.remove(address_path)
+        self._print("Worker stopped")
+
+    def _cancel_queued(self):
+        """
+        Cancels the jobs that have not started yet.
+        """
+        while True:
+            try:
+                job_id = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job_id is not None:
+                self._update(job_id, state='cancelled')
+
+def send_request(address_path, message):
+    """
+    Sends a request to a running worker and waits for its reply.
+
+    ...
+    Parameters
+    ----------
+    address_path : string
+        Path to the address file saved by WorkerService.serve().
+    message : dictionary
+        Request, as handled by WorkerService._handle().
+
+    Returns
+    -------
+    reply : dictionary
+        Reply from the worker.
+    """
+    if not os.path.isfile(address_path):
+        raise FileNotFoundError(f"No worker address found at {address_path}. "
+                                "Please start a worker with 'python prep.py serve'.")
+    with open(address_path, 'r', encoding='utf-8') as file:
+        address = json.load(file)
+
+    with Client((address['host'], address['port']),
+                authkey=bytes.fromhex(address['authkey'])) as connection:
+        connection.send(message)
+        reply = connection.recv()
+    if 'error' in reply:
+        raise ValueError(reply['error'])
+
+    return reply
@@ -0,0 +1,167 @@
+"""
+A file used for summarising the GLAES exclusion rasters per hexagon, without
+generating placement points.
+
+The hexagons are rasterised in one pass onto the exclusion raster grid as
+labels, and the eligible area of each hexagon is summed with np.bincount().
+The number of turbines or PV modules that fit in that area is then
+estimated from their spacing.
+
+Contains add_zonal_stats(), estimate_placements() and
+zonal_exclusion_stats().
+"""
+import numpy as np
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window, bounds as window_bounds
+from shapely.geometry import box
+
+from placements import PV_SEPARATION, TURBINES, get_pv_variant, get_turbine_variants
+
+
+def estimate_placements(eligible_area, separation):
+    """
+    Estimates how many items fit in an eligible area, with one item per
+    spacing rectangle. For turbines spaced 10 by 5 rotor radii this is the
+    usual rule of thumb for wind farm layouts. GLAES places items one at a
+    time around exclusions, so its counts are usually somewhat lower.
+
+    ...
+    Parameters
+    ----------
+    eligible_area : array
+        Eligible area of each hexagon in square meters.
+    separation : float or tuple
+        Separation in meters between items, or the separations along and
+        across the main axis, as passed to GLAES distributeItems().
+
+    Returns
+    -------
+    estimate : array
+        Estimated number of items in each hexagon.
+    """
+    if np.isscalar(separation):
+        separation = (separation, separation)
+
+    return np.floor(eligible_area / (separation[0] * separation[1]))
+
+def _read_availability(src, window):
+    """
+    Reads the share of each pixel that is available, from 0 to 1. GLAES saves
+    availability as a percentage, and pixels outside the region as nodata.
+    """
+    data = src.read(1, window=window)
+    available = np.where(data <= 100, data, 0).astype(np.float64) / 100
+    if src.nodata is not None:
+        available[data == src.nodata] = 0
+
+    return available
+
+def zonal_exclusion_stats(hex, exclusions_paths, max_memory_mb=512):
+    """
+    Sums the eligible area of each hexagon in one or more GLAES exclusion
+    rasters on the same grid.
+
+    The rasters are read in strips of rows so that memory use stays below a
+    set limit. The hexagons are rasterised once per strip, by pixel centre,
+    and the labels are shared by all the rasters.
+
+    ...
+    Parameters
+    ----------
+    hex : geodataframe
+        Hexagon file from spider run.
+    exclusions_paths : dictionary
+        Paths to the exclusion rasters, keyed by name, e.g. 'wind' and 'pv'.
+    max_memory_mb : integer
+        Approximate limit in megabytes for the pixels held in memory at once.
+
+    Returns
+    -------
+    eligible_area : dictionary
+        Eligible area in square meters of each hexagon, in the order of the
+        hexagons, keyed by the raster names.
+    """
+    sources = {name: rasterio.open(path) for name, path in exclusions_paths.items()}
+    try:
+        first = next(iter(sources.values()))
+        for name, src in sources.items():
+            if src.transform != first.transform or src.shape != first.shape:
+                raise ValueError(f"The {name} exclusion raster is not on the same grid as the others.")
+
+        # Labels start at 1, as 0 is left for pixels outside all hexagons
+        hexagons = hex.to_crs(first.crs).geometry.reset_index(drop=True)
+        pixel_area = abs(first.transform.a * first.transform.e)
+        totals = {name: np.zeros(len(hexagons) + 1) for name in sources}
+
+        # Each row needs its labels plus the availability of each raster
+        bytes_per_row = first.width * (4 + 8 * len(sources))
+        rows = max(1, int(max_memory_mb * 1024 ** 2 // bytes_per_row))
+
+        for row_start in range(0, first.height, rows):
+            strip = Window(0, row_start, first.width, min(rows, first.height - row_start))
+            # Only rasterise the hexagons that overlap the strip
+            positions = hexagons.sindex.query(box(*window_bounds(strip, first.transform)))
+            if len(positions) == 0:
+                continue
+
+            labels = rasterize(zip(hexagons.iloc[positions], positions + 1),
+                               out_shape=(int(strip.height), first.width),
+                               transform=first.window_transform(strip),
+                               fill=0, dtype='int32')
+            for name, src in sources.items():
+                totals[name] += np.bincount(labels.ravel(),
+                                            weights=_read_availability(src, strip).ravel(),
+                                            minlength=len(hexagons) + 1)
+    finally:
+        for src in sources.values():
+            src.close()
+
+    return {name: total[1:] * pixel_area for name, total in totals.items()}
+
+def add_zonal_stats(hex, wind_exclusions_path, pv_exclusions_path,
+                    turbines=(), pv_separations=()):
+    """
+    Adds the eligible area of each hexagon in the GLAES exclusion rasters, and
+    the number of turbines and PV modules estimated to fit in it, without
+    using any placements.
+
+    ...
+    Parameters
+    ----------
+    hex : geodataframe
+        Hexagon file from spider run, or any polygons.
+    wind_exclusions_path : string
+        Path to the wind exclusions raster from glaes run.
+    pv_exclusions_path : string
+        Path to the PV exclusions raster from glaes run.
+    turbines : list
+        Extra turbine models or radii in meters to estimate turbines for.
+        Each is added in an 'est_turbines_[MODEL]' or 'est_turbines_[RADIUS]m'
+        column.
+    pv_separations : list
+        Extra PV separations to estimate PV modules for. Each is added in an
+        'est_pv_[SEPARATION]m' column.
+
+    Returns
+    -------
+    hex : geodataframe
+        Hexagons with 'eligible_wind_km2', 'eligible_pv_km2', 'est_turbines'
+        and 'est_pv' columns.
+    """
+    eligible_area = zonal_exclusion_stats(hex, {'wind': wind_exclusions_path,
+                                                'pv': pv_exclusions_path})
+    hex['eligible_wind_km2'] = eligible_area['wind'] / 1e6
+    hex['eligible_pv_km2'] = eligible_area['pv'] / 1e6
+
+    radius = TURBINES['NREL_4MW']
+    hex['est_turbines'] = estimate_placements(eligible_area['wind'], (radius * 10, radius * 5))
+    hex['est_pv'] = estimate_placements(eligible_area['pv'], PV_SEPARATION)
+    for variant, radius in get_turbine_variants(turbines).items():
+        hex[f'est_turbines_{variant}'] = estimate_placements(eligible_area['wind'],
+                                                            (radius * 10, radius * 5))
+    for separation in pv_separations:
+        hex[f'est_pv_{get_pv_variant(separation)}'] = estimate_placements(eligible_area['pv'],
+                                                                           separation)
+
+    return hex